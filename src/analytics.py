@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from transform import read_processed_data, get_processed_file_path
+from profiling import profiled_step
+from config import logger
+
+# Columnas del dataset procesado que usan las exportaciones
+ANALYTICS_COLUMNS = ['county', 'city', 'model_year', 'make', 'model', 'cafv_eligibility']
+
+# Valor de cafv_eligibility que filtra cafv_by_location
+CAFV_ELIGIBLE = 'Clean Alternative Fuel Vehicle Eligible'
+
+@profiled_step
+def load_analytics_data(file_path=None):
+    """
+    Lee del dataset procesado sólo las columnas que usan las exportaciones. Es el mismo
+    dataset que se carga en la base de datos, así que los resultados coinciden con los de
+    las consultas SQL de powerbi_prep.
+    
+    Args:
+        file_path (str, optional): Ruta al archivo procesado. Si es None se usa el de
+            transform_data con el formato configurado
+    
+    Returns:
+        pd.DataFrame: Columnas de ANALYTICS_COLUMNS
+    """
+    if file_path is None:
+        file_path, _ = get_processed_file_path('processed_ev_data')
+    logger.info(f"Leyendo datos procesados para las exportaciones desde {file_path}")
+    return read_processed_data(file_path, columns=ANALYTICS_COLUMNS)
+
+def count_by(df, columns, count_name):
+    """
+    Cuenta las filas por cada combinación de valores de las columnas, como un
+    GROUP BY ... COUNT(*): los nulos forman su propio grupo y sólo aparecen las
+    combinaciones que existen. Los grupos quedan ordenados por sus valores (los textos por
+    bytes, como la intercalación 'C' de PostgreSQL, y los nulos al final), no por el orden
+    de las categorías, que en la transformación por bloques es el de aparición.
+    
+    Args:
+        df (pd.DataFrame): Datos
+        columns (list): Columnas de agrupación
+        count_name (str): Nombre de la columna con el conteo
+    
+    Returns:
+        pd.DataFrame: Columnas de agrupación (como texto, no como categorías) y el conteo
+    """
+    result = df.groupby(columns, observed=True, dropna=False).size().reset_index(name=count_name)
+    for column in columns:
+        if isinstance(result[column].dtype, pd.CategoricalDtype):
+            result[column] = result[column].astype(object)
+    return result.sort_values(columns, kind='stable').reset_index(drop=True)
+
+def round_percentage(numerator, denominator):
+    """
+    Calcula numerator / denominator * 100 redondeado a 2 decimales con aritmética entera,
+    igual que ROUND(numeric, 2) en PostgreSQL (los empates se alejan del cero).
+    
+    Args:
+        numerator (np.ndarray): Numeradores enteros
+        denominator (np.ndarray): Denominadores enteros distintos de cero
+    
+    Returns:
+        np.ndarray: Porcentajes (float)
+    """
+    scaled = np.abs(numerator) * 10000
+    quotient, remainder = np.divmod(scaled, denominator)
+    quotient += 2 * remainder >= denominator
+    return np.sign(numerator) * quotient / 100
+
+def get_vehicles_by_year(df):
+    """
+    Equivalente de powerbi_prep.get_vehicles_by_year sobre el DataFrame.
+    """
+    years = pd.DataFrame({'registration_year': df['model_year'].dt.year})
+    result = count_by(years.dropna(), ['registration_year'], 'vehicle_count')
+    result['registration_year'] = result['registration_year'].astype('int64')
+    return result
+
+def get_top_models(df):
+    """
+    Equivalente de powerbi_prep.get_top_models sobre el DataFrame. Los modelos con la misma
+    cantidad de registros quedan ordenados por marca y modelo.
+    """
+    result = count_by(df, ['make', 'model'], 'registration_count')
+    result = result.sort_values(['registration_count', 'make', 'model'], ascending=[False, True, True],
+                                kind='stable').head(10)
+    return result.reset_index(drop=True)
+
+def get_cafv_by_location(df):
+    """
+    Equivalente de powerbi_prep.get_cafv_by_location sobre el DataFrame. Las ubicaciones con
+    la misma cantidad de vehículos quedan ordenadas por condado y ciudad.
+    """
+    eligible = df[df['cafv_eligibility'] == CAFV_ELIGIBLE]
+    result = count_by(eligible, ['county', 'city', 'cafv_eligibility'], 'vehicle_count')
+    result.insert(0, 'country', 'United States')
+    result = result.sort_values(['vehicle_count', 'county', 'city'], ascending=[False, True, True],
+                                kind='stable')
+    return result.reset_index(drop=True)
+
+def get_yoy_change(df):
+    """
+    Equivalente de powerbi_prep.get_yoy_change sobre el DataFrame: registros por condado y
+    año junto con los del año anterior, la diferencia y la variación porcentual. El orden
+    por condado es el de la intercalación 'C' de PostgreSQL (por bytes).
+    """
+    county_years = pd.DataFrame({'county': df['county'], 'year': df['model_year'].dt.year})
+    counts = count_by(county_years.dropna(subset=['year']), ['county', 'year'], 'registration_count')
+    counts['year'] = counts['year'].astype('int64')
+    
+    # Registros del año anterior: se une con los conteos corridos un año
+    previous = counts.rename(columns={'registration_count': 'prev_year_count'})
+    previous['year'] += 1
+    result = counts.merge(previous, on=['county', 'year'], how='left')
+    result['prev_year_count'] = result['prev_year_count'].astype('float64')
+    
+    previous_counts = result['prev_year_count'].fillna(0).astype('int64').to_numpy()
+    current_counts = result['registration_count'].to_numpy()
+    result['absolute_change'] = current_counts - previous_counts
+    
+    percentage = np.full(len(result), np.nan)
+    has_previous = previous_counts != 0
+    percentage[has_previous] = round_percentage(current_counts[has_previous] - previous_counts[has_previous],
+                                                previous_counts[has_previous])
+    result['percentage_change'] = percentage
+    return result.sort_values(['county', 'year'], kind='stable').reset_index(drop=True)
+
+# Resultados de powerbi_prep.EXPORT_QUERIES calculados sobre el dataset procesado
+EXPORT_FUNCTIONS = {
+    'vehicles_by_year': get_vehicles_by_year,
+    'top_models': get_top_models,
+    'cafv_by_location': get_cafv_by_location,
+    'yoy_change': get_yoy_change,
+}
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+# El benchmark usa su propio directorio de datos y su propia base de datos para no pisar
+# los resultados ni la caché del pipeline. Tiene que configurarse antes de importar config.
+BENCHMARK_DIR = Path(__file__).resolve().parent.parent / 'data' / 'benchmark'
+os.environ['DATA_DIR'] = str(BENCHMARK_DIR / 'pipeline')
+os.environ['DB_NAME'] = os.getenv('BENCHMARK_DB_NAME', 'ev_benchmark')
+
+import pandas as pd
+from config import (PROJECT_ROOT, TRANSFORM_STREAMING, TRANSFORM_WORKERS, CSV_ENGINE, RAW_ARROW_CACHE, PROCESSED_DATA_FORMAT,
+                    LOAD_METHOD, LOAD_STRATEGY, LOAD_WORKERS, DB_SCHEMA_LAYOUT,
+                    DB_PARTITIONING, EXPORT_BACKEND, logger)
+from database import initialize_database, execute_query
+from transform import transform_data, transform_data_in_chunks
+from load import load_data_to_database, load_chunks_to_database
+from powerbi_prep import save_query_results
+from profiling import start_run_report, get_run_report, get_peak_rss_mb
+from synthetic_data import generate_synthetic_data, DUPLICATE_RATIO
+
+# Historial de resultados, una línea JSON por ejecución del benchmark
+RESULTS_FILE = BENCHMARK_DIR / 'results.jsonl'
+
+# Escalas por defecto (filas) y variación a partir de la cual se marca una regresión
+DEFAULT_SCALES = ['100k']
+REGRESSION_THRESHOLD = 0.10
+
+def parse_rows(value):
+    """
+    Convierte una cantidad de filas escrita como 100000, 100k o 1M a entero.
+    
+    Args:
+        value (str): Cantidad de filas
+    
+    Returns:
+        int: Cantidad de filas
+    """
+    multipliers = {'k': 1000, 'm': 1000000}
+    value = value.strip().lower()
+    if value and value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+def get_git_revision():
+    """
+    Devuelve el commit actual y si hay cambios sin confirmar, para comparar resultados
+    entre versiones del código.
+    
+    Returns:
+        tuple: (hash corto del commit o None, True si hay cambios sin confirmar)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        return commit, bool(status)
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+def get_synthetic_file(rows, seed, duplicate_ratio=DUPLICATE_RATIO):
+    """
+    Devuelve el CSV sintético de la escala indicada, generándolo si todavía no existe.
+    
+    Args:
+        rows (int): Cantidad de filas
+        seed (int): Semilla del generador
+        duplicate_ratio (float): Fracción de filas con un DOL Vehicle ID repetido
+    
+    Returns:
+        str: Ruta al archivo
+    """
+    file_path = BENCHMARK_DIR / f'synthetic_{rows}_{seed}_dup{duplicate_ratio:g}.csv'
+    if not file_path.exists():
+        generate_synthetic_data(str(file_path), rows, seed, duplicate_ratio=duplicate_ratio)
+    return str(file_path)
+
+def time_stage(stages, name, func, *args):
+    """
+    Ejecuta una etapa y agrega su duración a stages[name].
+    
+    Args:
+        stages (dict): Duraciones de cada etapa
+        name (str): Nombre de la etapa
+        func (callable): Función de la etapa
+        *args: Argumentos de la función
+    
+    Returns:
+        Resultado de la etapa
+    """
+    start_time = time.perf_counter()
+    result = func(*args)
+    stages.setdefault(name, []).append(time.perf_counter() - start_time)
+    return result
+
+def run_scale(rows, seed=42, repeat=3, duplicate_ratio=DUPLICATE_RATIO):
+    """
+    Mide transform_data, load_data_to_database y save_query_results sobre un CSV sintético
+    de la escala indicada. Con TRANSFORM_STREAMING activo, la transformación y la carga
+    se miden juntas como una sola etapa (transform_and_load), igual que en el pipeline.
+    
+    Args:
+        rows (int): Cantidad de filas
+        seed (int): Semilla del generador de datos
+        repeat (int): Cantidad de repeticiones de cada etapa
+        duplicate_ratio (float): Fracción de filas con un DOL Vehicle ID repetido
+    
+    Returns:
+        dict: Resultado del benchmark, None si alguna etapa falló
+    """
+    input_file = get_synthetic_file(rows, seed, duplicate_ratio)
+    stages = {}
+    
+    for iteration in range(repeat):
+        logger.info(f"Benchmark de {rows} filas: repetición {iteration + 1} de {repeat}")
+        start_run_report()
+        if TRANSFORM_STREAMING:
+            loaded = time_stage(stages, 'transform_and_load', load_chunks_to_database,
+                                transform_data_in_chunks(input_file))
+        else:
+            df, _ = time_stage(stages, 'transform_data', transform_data, input_file)
+            if df is None:
+                return None
+            loaded = time_stage(stages, 'load_data_to_database', load_data_to_database, df)
+            del df
+        if not loaded:
+            return None
+        results = time_stage(stages, 'save_query_results', save_query_results)
+        if not results or 'errors' in results:
+            return None
+    
+    commit, dirty = get_git_revision()
+    server_version = execute_query("SHOW server_version")
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'rows': rows,
+        'seed': seed,
+        'repeat': repeat,
+        'settings': {
+            'duplicate_ratio': duplicate_ratio,
+            'transform_streaming': TRANSFORM_STREAMING,
+            'transform_workers': TRANSFORM_WORKERS,
+            'csv_engine': CSV_ENGINE,
+            'raw_arrow_cache': RAW_ARROW_CACHE,
+            'processed_data_format': PROCESSED_DATA_FORMAT,
+            'load_method': LOAD_METHOD,
+            'load_strategy': LOAD_STRATEGY,
+            'load_workers': LOAD_WORKERS,
+            'db_schema_layout': DB_SCHEMA_LAYOUT,
+            'db_partitioning': DB_PARTITIONING,
+            'export_backend': EXPORT_BACKEND,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'postgres': server_version['data'][0][0] if server_version else None,
+        },
+        'stages': {
+            name: {
+                'best_s': round(min(times), 4),
+                'median_s': round(statistics.median(times), 4),
+                'runs_s': [round(t, 4) for t in times],
+                'rows_per_s': round(rows / min(times)),
+            }
+            for name, times in stages.items()
+        },
+        'peak_rss_mb': get_peak_rss_mb(),
+        # Desglose por subetapa de la última repetición (ver profiling.py)
+        'steps': {step['step']: step['wall_time_s'] for step in get_run_report()['steps']},
+    }
+
+def save_result(result):
+    """
+    Agrega un resultado al historial RESULTS_FILE.
+    """
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    with open(RESULTS_FILE, 'a') as f:
+        f.write(json.dumps(result) + '\n')
+    logger.info(f"Resultado del benchmark guardado en {RESULTS_FILE}")
+
+def load_results():
+    """
+    Lee el historial de resultados.
+    
+    Returns:
+        list: Resultados en el orden en que se guardaron
+    """
+    if not RESULTS_FILE.exists():
+        return []
+    with open(RESULTS_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare_results(threshold=REGRESSION_THRESHOLD):
+    """
+    Compara, para cada escala y configuración, el último resultado con el último de un
+    commit distinto, e imprime la variación del mejor tiempo de cada etapa.
+    
+    Args:
+        threshold (float): Variación relativa a partir de la cual se marca una regresión
+    
+    Returns:
+        list: Regresiones encontradas (escala, etapa, variación)
+    """
+    groups = {}
+    for result in load_results():
+        key = (result['rows'], json.dumps(result['settings'], sort_keys=True))
+        groups.setdefault(key, []).append(result)
+    
+    regressions = []
+    for (rows, settings), results in sorted(groups.items()):
+        current = results[-1]
+        previous = next((r for r in reversed(results[:-1]) if r['commit'] != current['commit']), None)
+        if previous is None:
+            continue
+        print(f"\n{rows} filas ({previous['commit']} -> {current['commit']}{' con cambios' if current['dirty'] else ''}) {settings}")
+        for stage, metrics in current['stages'].items():
+            if stage not in previous['stages']:
+                continue
+            before = previous['stages'][stage]['best_s']
+            after = metrics['best_s']
+            change = (after - before) / before if before else 0
+            mark = ''
+            if change > threshold:
+                mark = '  <- REGRESIÓN'
+                regressions.append((rows, stage, change))
+            print(f"  {stage:<24} {before:>9.3f}s -> {after:>9.3f}s  {change:+7.1%}{mark}")
+    
+    if not groups:
+        print("No hay resultados guardados")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline con datos sintéticos")
+    parser.add_argument('--rows', nargs='+', default=DEFAULT_SCALES,
+                        help="Escalas a medir, por ejemplo 100k 1M 10M (por defecto 100k)")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones de cada etapa")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla del generador de datos")
+    parser.add_argument('--duplicate-ratio', type=float, default=DUPLICATE_RATIO,
+                        help="Fracción de filas sintéticas con un DOL Vehicle ID repetido")
+    parser.add_argument('--compare', action='store_true',
+                        help="Sólo compara los últimos resultados guardados entre commits")
+    args = parser.parse_args()
+    
+    if not args.compare:
+        initialize_database()
+        for rows in map(parse_rows, args.rows):
+            result = run_scale(rows, args.seed, args.repeat, args.duplicate_ratio)
+            if result is None:
+                logger.error(f"El benchmark de {rows} filas falló")
+                sys.exit(1)
+            save_result(result)
+    
+    # Salida con error si hubo regresiones, para poder usarlo en integración continua
+    sys.exit(1 if compare_results() else 0)
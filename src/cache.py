@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import inspect
+from datetime import datetime
+from config import CACHE_DIR, logger
+
+def compute_stage_key(stage_name, input_key, modules, settings=None):
+    """
+    Calcula la clave de caché de una etapa del pipeline a partir del hash de su entrada,
+    del código de los módulos que la implementan y de la configuración que la afecta.
+    Si cualquiera de ellos cambia, la clave cambia y la etapa se vuelve a ejecutar.
+    
+    Args:
+        stage_name (str): Nombre de la etapa (por ejemplo 'transform_data')
+        input_key (str): Hash del contenido de entrada o clave de la etapa anterior
+        modules (list): Módulos cuyo código define la versión de la etapa
+        settings (dict, optional): Configuración que afecta al resultado de la etapa
+        
+    Returns:
+        str: Clave de la etapa en hexadecimal
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(stage_name.encode())
+    sha256.update(input_key.encode())
+    for module in modules:
+        sha256.update(inspect.getsource(module).encode())
+    sha256.update(json.dumps(settings or {}, sort_keys=True, default=str).encode())
+    return sha256.hexdigest()
+
+def get_cached_stage(stage_name, stage_key):
+    """
+    Busca el resultado guardado de una etapa con la clave indicada.
+    
+    Args:
+        stage_name (str): Nombre de la etapa
+        stage_key (str): Clave calculada con compute_stage_key
+        
+    Returns:
+        dict: Resultados guardados de la etapa, None si no hay una entrada válida
+    """
+    entry_path = os.path.join(CACHE_DIR, f"{stage_name}.json")
+    if not os.path.exists(entry_path):
+        return None
+    try:
+        with open(entry_path) as f:
+            entry = json.load(f)
+    except (IOError, ValueError) as e:
+        logger.warning(f"Entrada de caché inválida para {stage_name}: {e}")
+        return None
+    
+    if entry.get('key') != stage_key:
+        return None
+    
+    # Los archivos generados por la etapa tienen que seguir existiendo
+    missing_files = [path for path in entry.get('files', []) if not os.path.exists(path)]
+    if missing_files:
+        logger.info(f"Caché de {stage_name} descartada, faltan archivos: {missing_files}")
+        return None
+    
+    logger.info(f"Etapa {stage_name} sin cambios (caché del {entry.get('created_at')})")
+    return entry.get('outputs', {})
+
+def save_stage(stage_name, stage_key, outputs, files=None):
+    """
+    Guarda el resultado de una etapa para reutilizarlo en próximas ejecuciones.
+    
+    Args:
+        stage_name (str): Nombre de la etapa
+        stage_key (str): Clave calculada con compute_stage_key
+        outputs (dict): Resultados de la etapa (deben ser serializables en JSON)
+        files (list, optional): Archivos generados por la etapa, que deben existir para
+            que la entrada siga siendo válida
+    """
+    entry = {
+        'key': stage_key,
+        'outputs': outputs,
+        'files': [str(path) for path in (files or [])],
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    entry_path = os.path.join(CACHE_DIR, f"{stage_name}.json")
+    with open(entry_path + '.tmp', 'w') as f:
+        json.dump(entry, f, indent=2, default=str)
+    os.replace(entry_path + '.tmp', entry_path)
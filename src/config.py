@@ -6,16 +6,24 @@ from dotenv import load_dotenv
 
 
 
+# Carga las variables del .env
+load_dotenv()
+
 # Configuración de rutas del proyecto
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
-DATA_DIR = PROJECT_ROOT / 'data'
+# El directorio de datos se puede cambiar (por ejemplo, el benchmark usa uno propio)
+DATA_DIR = Path(os.getenv('DATA_DIR', PROJECT_ROOT / 'data'))
 RAW_DATA_DIR = DATA_DIR / 'raw'
+RAW_SNAPSHOTS_DIR = RAW_DATA_DIR / 'snapshots'
 PROCESSED_DATA_DIR = DATA_DIR / 'processed'
+CACHE_DIR = DATA_DIR / 'cache'
+RAW_ARROW_CACHE_DIR = CACHE_DIR / 'raw_arrow'
 LOGS_DIR = PROJECT_ROOT / 'logs'
 
 # Crear directorios si no existen
 os.makedirs(RAW_DATA_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+os.makedirs(CACHE_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
 
 # Configurar logging básico
@@ -29,9 +37,6 @@ logging.basicConfig(
 )
 
 # Configuraciones de base de datos
-# Carga las variables del .env
-load_dotenv()
-
 DB_CONFIG = {
     'host':     os.getenv('DB_HOST'),
     'port':     os.getenv('DB_PORT'),
@@ -40,9 +45,102 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD'),
 }
 
+# Pool de conexiones compartido por todos los módulos
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 8))
+# Segundos de espera por una conexión libre cuando el pool está agotado
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+# Segundos de inactividad a partir de los cuales se verifica la conexión con SELECT 1
+DB_POOL_HEALTHCHECK_INTERVAL = int(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 30))
+# Filas por bloque que trae del servidor database.iterate_query (cursor del lado del servidor)
+DB_QUERY_ITERSIZE = int(os.getenv('DB_QUERY_ITERSIZE', 10000))
+
 # URL del conjunto de datos de vehículos eléctricos
 EV_DATA_URL = 'https://data.wa.gov/api/views/f6w7-q2d2/rows.csv?accessType=DOWNLOAD'
 RAW_DATA_FILENAME = 'electric_vehicle_population_data.csv'
 
+# Configuración de la descarga
+# Si está activo, se consulta al servidor si el archivo cambió (ETag/Last-Modified) aunque ya exista.
+# Desactivado, sólo se descarga si no hay copia local, así que el pipeline funciona sin conexión
+EXTRACT_REFRESH = os.getenv('EXTRACT_REFRESH', 'false').lower() == 'true'
+# Tamaño del buffer de lectura/escritura de la descarga (1 MB)
+DOWNLOAD_CHUNK_SIZE = int(os.getenv('DOWNLOAD_CHUNK_SIZE', 1024 * 1024))
+# Tiempo máximo de espera del servidor, en segundos
+DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', 60))
+# Compresión con que se guarda el CSV crudo: 'none', 'gzip' o 'zstd' (requiere el paquete
+# zstandard). La transformación lo descomprime al leerlo
+RAW_DATA_COMPRESSION = os.getenv('RAW_DATA_COMPRESSION', 'none').lower()
+# Versiones anteriores del CSV crudo que se conservan en RAW_SNAPSHOTS_DIR (0 no guarda ninguna)
+RAW_SNAPSHOTS_KEEP = int(os.getenv('RAW_SNAPSHOTS_KEEP', 0))
+
+# Configuración del modo de transformación por bloques (streaming)
+# Si está activo, el CSV crudo se procesa en bloques de TRANSFORM_CHUNK_SIZE filas
+TRANSFORM_STREAMING = os.getenv('TRANSFORM_STREAMING', 'false').lower() == 'true'
+TRANSFORM_CHUNK_SIZE = int(os.getenv('TRANSFORM_CHUNK_SIZE', 50000))
+# Procesos que transforman en paralelo particiones del CSV crudo (fuera del modo por bloques).
+# 1 transforma en el proceso principal; 0 usa un proceso por núcleo
+TRANSFORM_WORKERS = int(os.getenv('TRANSFORM_WORKERS', 1)) or os.cpu_count() or 1
+# Modo superpuesto: la descarga, la transformación por bloques y la carga corren a la vez,
+# conectadas por colas acotadas de PIPELINE_QUEUE_SIZE elementos (bloques descargados o
+# bloques de filas); si una etapa se atrasa, las anteriores esperan
+PIPELINE_OVERLAP = os.getenv('PIPELINE_OVERLAP', 'false').lower() == 'true'
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 4))
+
+# Si está activo, la transformación guarda en la caché una copia Arrow IPC de las columnas
+# leídas del CSV crudo y, mientras el CSV no cambie, la lee mapeada en memoria en lugar de
+# parsearlo de nuevo. Transforma en un solo proceso (no usa TRANSFORM_WORKERS)
+RAW_ARROW_CACHE = os.getenv('RAW_ARROW_CACHE', 'false').lower() == 'true'
+# Motor de lectura del CSV crudo: 'pyarrow' (más rápido) o 'c' (el de pandas).
+# La lectura por bloques usa siempre 'c', porque pyarrow no la admite
+CSV_ENGINE = os.getenv('CSV_ENGINE', 'pyarrow').lower()
+# Si está activo, el pipeline genera también la versión completa de los datos (todas las
+# columnas del CSV crudo). También se puede generar por separado con main.py --full-export
+SAVE_FULL_PROCESSED_DATA = os.getenv('SAVE_FULL_PROCESSED_DATA', 'false').lower() == 'true'
+
+# Formato de los datos procesados: 'parquet' (columnar, conserva los tipos) o 'csv'
+PROCESSED_DATA_FORMAT = os.getenv('PROCESSED_DATA_FORMAT', 'parquet').lower()
+# Compresión de los archivos parquet: 'snappy', 'zstd', 'gzip' o 'none'
+PROCESSED_DATA_COMPRESSION = os.getenv('PROCESSED_DATA_COMPRESSION', 'snappy').lower()
+
+# Método de carga en la base de datos:
+#   'bulk': COPY por lotes sin armar el CSV completo en memoria, reconstruyendo los índices al final
+#   'copy': COPY de un único CSV en memoria manteniendo los índices (método original)
+LOAD_METHOD = os.getenv('LOAD_METHOD', 'bulk').lower()
+# Filas que se convierten a CSV en cada lote del método 'bulk'
+LOAD_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', 50000))
+# Estrategia de carga:
+#   'replace': vacía la tabla y carga todas las filas
+#   'incremental': aplica sólo las altas, cambios y bajas por dol_vehicle_id
+#   'swap': carga una tabla sombra y la intercambia con la actual renombrándolas
+LOAD_STRATEGY = os.getenv('LOAD_STRATEGY', 'replace').lower()
+# Conexiones que copian en paralelo particiones de los datos a la tabla sombra (sólo con 'swap').
+# Conviene que sea menor que DB_POOL_MAX_SIZE, porque la carga usa además una conexión propia
+LOAD_WORKERS = int(os.getenv('LOAD_WORKERS', 1))
+# Esquema de la tabla de vehículos:
+#   'flat': una sola tabla con los textos repetidos en cada fila (esquema original)
+#   'star': tabla de hechos angosta con claves enteras hacia tablas de dimensiones (dim_*)
+DB_SCHEMA_LAYOUT = os.getenv('DB_SCHEMA_LAYOUT', 'flat').lower()
+# Particionado de la tabla de vehículos:
+#   'none': una sola tabla
+#   'model_year': tabla particionada por rango con una partición por año del modelo
+DB_PARTITIONING = os.getenv('DB_PARTITIONING', 'none').lower()
+
+# Exportación para Power BI
+# Cantidad máxima de consultas que se ejecutan en paralelo
+EXPORT_MAX_WORKERS = int(os.getenv('EXPORT_MAX_WORKERS', 4))
+# Tiempo máximo de cada consulta en segundos (0 para no limitarla)
+EXPORT_QUERY_TIMEOUT = int(os.getenv('EXPORT_QUERY_TIMEOUT', 120))
+# Motor de las exportaciones para Power BI:
+#   'postgres': consultas SQL sobre las vistas materializadas de resumen
+#   'pandas': agregaciones en el proceso sobre el dataset procesado, sin consultar la base de datos
+#   'copy': las mismas consultas SQL, escritas por PostgreSQL en cada CSV con COPY ... TO STDOUT
+EXPORT_BACKEND = os.getenv('EXPORT_BACKEND', 'postgres').lower()
+
+# Métricas de ejecución
+# Reporte JSON con tiempos, memoria, filas y bytes de cada etapa de la última ejecución
+RUN_REPORT_FILE = os.getenv('RUN_REPORT_FILE', os.path.join(LOGS_DIR, 'run_report.json'))
+# Etapa que se perfila con cProfile y tracemalloc (por ejemplo 'apply_column_specs'); vacío para ninguna
+PROFILE_STAGE = os.getenv('PROFILE_STAGE', '')
+
 # Logger para usar en otros módulos
 logger = logging.getLogger(__name__)
@@ -1,30 +1,144 @@
+import time
+import atexit
+import itertools
+import threading
+from contextlib import contextmanager
+import pandas as pd
 import psycopg2
-from psycopg2 import sql
-from config import DB_CONFIG, logger
+from psycopg2 import sql, pool, extensions
+from profiling import profiled_step
+from config import (DB_CONFIG, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_TIMEOUT,
+                    DB_POOL_HEALTHCHECK_INTERVAL, DB_QUERY_ITERSIZE, DB_SCHEMA_LAYOUT, DB_PARTITIONING, logger)
 
-def get_connection():
+# Pool de conexiones compartido por todos los módulos (se crea al primer uso)
+_connection_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = None
+# Momento en que cada conexión se devolvió al pool, para el chequeo de salud
+_last_used = {}
+# Numeración de los cursores del lado del servidor (cada uno necesita un nombre único)
+_cursor_ids = itertools.count(1)
+
+# Formatos en que iterate_query entrega cada bloque de filas
+QUERY_BATCH_FORMATS = ('tuples', 'dataframe', 'numpy')
+
+def get_connection_pool():
+    """
+    Devuelve el pool de conexiones a la base de datos PostgreSQL, creándolo si no existe.
+    Es seguro usarlo desde varios hilos.
+    """
+    global _connection_pool, _pool_slots
+    with _pool_lock:
+        if _connection_pool is None or _connection_pool.closed:
+            try:
+                _connection_pool = pool.ThreadedConnectionPool(
+                    DB_POOL_MIN_SIZE,
+                    DB_POOL_MAX_SIZE,
+                    host=DB_CONFIG['host'],
+                    port=DB_CONFIG['port'],
+                    database=DB_CONFIG['database'],
+                    user=DB_CONFIG['user'],
+                    password=DB_CONFIG['password']
+                )
+            except psycopg2.Error as e:
+                logger.error(f"Error al conectar a la base de datos: {e}")
+                raise
+            # Limita las conexiones en uso para esperar en lugar de fallar si el pool se agota
+            _pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_SIZE)
+            _last_used.clear()
+            logger.info(f"Conexión a la base de datos establecida correctamente "
+                        f"(pool de {DB_POOL_MIN_SIZE} a {DB_POOL_MAX_SIZE} conexiones)")
+        return _connection_pool
+
+def close_connection_pool():
+    """
+    Cierra todas las conexiones del pool.
     """
-    Establece y retorna una conexión a la base de datos PostgreSQL.
+    global _connection_pool
+    with _pool_lock:
+        if _connection_pool is not None and not _connection_pool.closed:
+            _connection_pool.closeall()
+        _connection_pool = None
+
+atexit.register(close_connection_pool)
+
+def is_connection_healthy(connection):
     """
+    Verifica que una conexión del pool siga abierta. Si estuvo inactiva más de
+    DB_POOL_HEALTHCHECK_INTERVAL segundos, además se comprueba con un SELECT 1.
+    """
+    if connection.closed:
+        return False
+    idle_time = time.time() - _last_used.get(id(connection), time.time())
+    if idle_time < DB_POOL_HEALTHCHECK_INTERVAL:
+        return True
     try:
-        connection = psycopg2.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database=DB_CONFIG['database'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password']
-        )
-        logger.info("Conexión a la base de datos establecida correctamente")
-        return connection
-    except psycopg2.Error as e:
-        logger.error(f"Error al conectar a la base de datos: {e}")
-        raise
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        connection.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def pooled_connection(autocommit=False):
+    """
+    Obtiene una conexión del pool y la devuelve al terminar el bloque with. Si quedó una
+    transacción abierta (por ejemplo, por un error) se deshace antes de devolverla, y las
+    conexiones rotas se descartan en lugar de volver al pool.
+    
+    Args:
+        autocommit (bool): Activa el modo autocommit durante el bloque
+        
+    Yields:
+        connection: Conexión a la base de datos
+    """
+    connection_pool = get_connection_pool()
+    slots = _pool_slots
+    if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+        raise pool.PoolError(f"No hay conexiones libres en el pool después de {DB_POOL_TIMEOUT} segundos")
+    
+    connection = None
+    try:
+        connection = connection_pool.getconn()
+        # Reemplazar conexiones que se cerraron mientras estaban en el pool
+        while not is_connection_healthy(connection):
+            logger.warning("Conexión del pool no disponible. Se abre una nueva.")
+            _last_used.pop(id(connection), None)
+            connection_pool.putconn(connection, close=True)
+            connection = connection_pool.getconn()
+        connection.autocommit = autocommit
+        yield connection
+    finally:
+        if connection is not None:
+            close = bool(connection.closed)
+            if not close:
+                try:
+                    if connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                        connection.rollback()
+                    connection.autocommit = False
+                except psycopg2.Error:
+                    close = True
+            if close:
+                _last_used.pop(id(connection), None)
+            else:
+                _last_used[id(connection)] = time.time()
+            connection_pool.putconn(connection, close=close)
+        slots.release()
 
 def create_database_if_not_exists():
     """
     Crea la base de datos si no existe.
     """
-    # Primero conectamos a la base de datos predeterminada 'postgres'
+    # Si ya podemos conectarnos a la base de datos, existe y no hace falta otra conexión
+    try:
+        get_connection_pool()
+        logger.info(f"Base de datos '{DB_CONFIG['database']}' ya existe")
+        return
+    except psycopg2.OperationalError:
+        pass
+    
+    # Si no, conectamos a la base de datos predeterminada 'postgres'
     connection = None
     try:
         # Conectar a la base de datos postgres para poder crear nuestra DB
@@ -61,20 +175,96 @@ def create_database_if_not_exists():
         if connection:
             connection.close()
 
-def create_tables():
+# Tablas de dimensiones del esquema 'star': columna -> tipo de la clave sustituta
+# Cada dimensión dim_<columna> guarda los valores distintos de la columna, y la tabla de
+# hechos guarda sólo <columna>_id. Las dimensiones sólo crecen: un valor conserva su clave
+# entre cargas, así todas las generaciones de la tabla de hechos comparten las dimensiones.
+DIMENSION_TABLES = {
+    'county': 'SMALLINT',
+    'city': 'INTEGER',
+    'state': 'SMALLINT',
+    'make': 'SMALLINT',
+    'model': 'SMALLINT',
+    'electric_vehicle_type': 'SMALLINT',
+    'cafv_eligibility': 'SMALLINT',
+}
+
+def get_dimension_tables_ddl():
     """
-    Crea las tablas necesarias en la base de datos, optimizadas para las consultas analíticas requeridas.
+    Devuelve las sentencias para crear las tablas de dimensiones del esquema 'star'.
+    
+    Returns:
+        list: Sentencias CREATE TABLE
     """
-    connection = None
-    try:
-        connection = get_connection()
-        cursor = connection.cursor()
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS dim_{column} (
+            {column}_id {key_type} GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            {column} VARCHAR(100) NOT NULL UNIQUE
+        );
+        """
+        for column, key_type in DIMENSION_TABLES.items()
+    ]
+
+def get_electric_vehicles_ddl(table_name='electric_vehicles', index_suffix='', layout=DB_SCHEMA_LAYOUT,
+                              partitioning=DB_PARTITIONING):
+    """
+    Devuelve las sentencias para crear la tabla de vehículos eléctricos y sus índices.
+    Se usa tanto para la tabla principal como para la tabla sombra de la carga por intercambio.
+    
+    Args:
+        table_name (str): Nombre de la tabla a crear
+        index_suffix (str): Sufijo para los nombres de los índices (deben ser únicos en el esquema)
+        layout (str): 'flat' para la tabla original, 'star' para la tabla de hechos con
+            claves hacia las tablas de dimensiones (que se crean también si no existen)
+        partitioning (str): 'model_year' para crearla particionada por año del modelo
+            (las particiones se crean al cargar, ver get_year_partition_ddl), 'none' si no
         
+    Returns:
+        tuple: (sentencia CREATE TABLE, lista de sentencias CREATE INDEX)
+    """
+    # En una tabla particionada la clave primaria tiene que incluir la columna de partición.
+    # Los índices se crean sobre la tabla particionada y PostgreSQL los crea en cada partición
+    if partitioning == 'model_year':
+        id_column = "id SERIAL"
+        table_options = ",\n            PRIMARY KEY (id, model_year)\n        ) PARTITION BY RANGE (model_year);"
+    else:
+        id_column = "id SERIAL PRIMARY KEY"
+        table_options = "\n        );"
+    
+    if layout == 'star':
+        # Tabla de hechos angosta: los textos se reemplazan por claves enteras, el año del
+        # modelo se guarda como número y el código postal como entero. Las columnas están
+        # ordenadas por alineación (8, 4 y 2 bytes) para que no haya relleno entre ellas.
+        # No se declaran claves foráneas para no verificar cada fila durante el COPY.
+        create_table_query = "".join(get_dimension_tables_ddl()) + f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            dol_vehicle_id BIGINT,
+            {id_column},
+            city_id INTEGER,
+            postal_code INTEGER,
+            model_year SMALLINT,
+            county_id SMALLINT,
+            state_id SMALLINT,
+            make_id SMALLINT,
+            model_id SMALLINT,
+            electric_vehicle_type_id SMALLINT,
+            cafv_eligibility_id SMALLINT,
+            electric_range SMALLINT{table_options}
+        """
+        index_columns = {
+            'idx_ev_model_year': 'model_year',
+            'idx_ev_model': 'model_id',
+            'idx_ev_county': 'county_id',
+            'idx_ev_cafv': 'cafv_eligibility_id',
+            'idx_ev_dol_vehicle_id': 'dol_vehicle_id',
+        }
+    else:
         # Crear tabla optimizada con solo las columnas necesarias para el análisis requerido
         # Eliminamos columnas innecesarias para las preguntas específicas
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS electric_vehicles (
-            id SERIAL PRIMARY KEY,
+        create_table_query = f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            {id_column},
             dol_vehicle_id NUMERIC,
             county VARCHAR(100),
             city VARCHAR(100),
@@ -85,30 +275,239 @@ def create_tables():
             model VARCHAR(100),
             electric_vehicle_type VARCHAR(100),
             cafv_eligibility VARCHAR(100),
-            electric_range NUMERIC
-        );
-        
-        -- Crear índices para mejorar rendimiento de consultas
-        CREATE INDEX IF NOT EXISTS idx_ev_model_year ON electric_vehicles(model_year);
-        CREATE INDEX IF NOT EXISTS idx_ev_model ON electric_vehicles(model);
-        CREATE INDEX IF NOT EXISTS idx_ev_county ON electric_vehicles(county);
-        CREATE INDEX IF NOT EXISTS idx_ev_cafv ON electric_vehicles(cafv_eligibility);
+            electric_range NUMERIC{table_options}
         """
-        cursor.execute(create_table_query)
         
-        # Confirmar cambios
-        connection.commit()
-        logger.info("Tablas e índices creados correctamente")
+        # Crear índices para mejorar rendimiento de consultas
+        index_columns = {
+            'idx_ev_model_year': 'model_year',
+            'idx_ev_model': 'model',
+            'idx_ev_county': 'county',
+            'idx_ev_cafv': 'cafv_eligibility',
+            # Índice por clave natural, usado por la carga incremental
+            'idx_ev_dol_vehicle_id': 'dol_vehicle_id',
+        }
+    create_index_queries = [
+        f"CREATE INDEX IF NOT EXISTS {index_name}{index_suffix} ON {table_name}({column});"
+        for index_name, column in index_columns.items()
+    ]
+    return create_table_query, create_index_queries
+
+def get_year_partition_ddl(table_name, year, key_type):
+    """
+    Devuelve la sentencia para crear la partición de un año del modelo, que se llama
+    {table_name}_y{year}.
+    
+    Args:
+        table_name (str): Tabla particionada
+        year (int): Año del modelo
+        key_type (str): Tipo de model_year en la tabla ('date' en 'flat', 'smallint' en 'star')
+        
+    Returns:
+        str: Sentencia CREATE TABLE ... PARTITION OF
+    """
+    if key_type == 'date':
+        lower_bound, upper_bound = f"'{year}-01-01'", f"'{year + 1}-01-01'"
+    else:
+        lower_bound, upper_bound = year, year + 1
+    return (f"CREATE TABLE IF NOT EXISTS {table_name}_y{year} PARTITION OF {table_name} "
+            f"FOR VALUES FROM ({lower_bound}) TO ({upper_bound})")
+
+def get_year_partitions(table_name, cursor):
+    """
+    Indica si la tabla está particionada y qué particiones por año tiene.
+    
+    Args:
+        table_name (str): Nombre de la tabla
+        cursor: Cursor de la conexión a la base de datos
+        
+    Returns:
+        tuple: (tipo de model_year, conjunto de años con partición), o (None, None) si la
+            tabla no está particionada
+    """
+    cursor.execute("""
+        SELECT format_type(a.atttypid, a.atttypmod)
+        FROM pg_partitioned_table p
+        JOIN pg_attribute a ON a.attrelid = p.partrelid AND a.attname = 'model_year'
+        WHERE p.partrelid = to_regclass(%s)
+    """, (table_name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None, None
+    
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table_name,))
+    prefix = f"{table_name}_y"
+    years = {int(name[len(prefix):]) for (name,) in cursor.fetchall()
+             if name.startswith(prefix) and name[len(prefix):].isdigit()}
+    return row[0], years
+
+# Vistas materializadas con los agregados que usan el dashboard y powerbi_prep:
+# nombre -> (consulta sobre {table}, columnas de la clave única)
+# La clave única es necesaria para poder refrescarlas con REFRESH ... CONCURRENTLY
+SUMMARY_VIEWS = {
+    'mv_ev_by_year': ("""
+        SELECT
+            EXTRACT(YEAR FROM model_year)::INT AS registration_year,
+            COUNT(*) AS vehicle_count
+        FROM {table}
+        WHERE model_year IS NOT NULL
+        GROUP BY registration_year
+    """, ['registration_year']),
+    'mv_ev_by_make_model': ("""
+        SELECT
+            make,
+            model,
+            COUNT(*) AS registration_count
+        FROM {table}
+        GROUP BY make, model
+    """, ['make', 'model']),
+    'mv_ev_cafv_by_location': ("""
+        SELECT
+            county,
+            city,
+            cafv_eligibility,
+            COUNT(*) AS vehicle_count
+        FROM {table}
+        GROUP BY county, city, cafv_eligibility
+    """, ['county', 'city', 'cafv_eligibility']),
+    'mv_ev_by_county_year': ("""
+        SELECT
+            county,
+            EXTRACT(YEAR FROM model_year)::INT AS year,
+            COUNT(*) AS registration_count
+        FROM {table}
+        WHERE model_year IS NOT NULL
+        GROUP BY county, year
+    """, ['county', 'year']),
+}
+
+# Las mismas vistas sobre el esquema 'star': se agrupa por las claves enteras de la tabla
+# de hechos y recién después se unen los textos de las dimensiones. Devuelven las mismas
+# columnas que SUMMARY_VIEWS, así las consultas de powerbi_prep no dependen del esquema.
+STAR_SUMMARY_VIEWS = {
+    'mv_ev_by_year': """
+        SELECT
+            model_year::INT AS registration_year,
+            COUNT(*) AS vehicle_count
+        FROM {table}
+        WHERE model_year IS NOT NULL
+        GROUP BY model_year
+    """,
+    'mv_ev_by_make_model': """
+        SELECT
+            make,
+            model,
+            f.registration_count
+        FROM (
+            SELECT make_id, model_id, COUNT(*) AS registration_count
+            FROM {table}
+            GROUP BY make_id, model_id
+        ) f
+        LEFT JOIN dim_make USING (make_id)
+        LEFT JOIN dim_model USING (model_id)
+    """,
+    'mv_ev_cafv_by_location': """
+        SELECT
+            county,
+            city,
+            cafv_eligibility,
+            f.vehicle_count
+        FROM (
+            SELECT county_id, city_id, cafv_eligibility_id, COUNT(*) AS vehicle_count
+            FROM {table}
+            GROUP BY county_id, city_id, cafv_eligibility_id
+        ) f
+        LEFT JOIN dim_county USING (county_id)
+        LEFT JOIN dim_city USING (city_id)
+        LEFT JOIN dim_cafv_eligibility USING (cafv_eligibility_id)
+    """,
+    'mv_ev_by_county_year': """
+        SELECT
+            county,
+            f.year,
+            f.registration_count
+        FROM (
+            SELECT county_id, model_year::INT AS year, COUNT(*) AS registration_count
+            FROM {table}
+            WHERE model_year IS NOT NULL
+            GROUP BY county_id, model_year
+        ) f
+        LEFT JOIN dim_county USING (county_id)
+    """,
+}
+
+def get_summary_views_ddl(table_name='electric_vehicles', suffix='', layout=DB_SCHEMA_LAYOUT):
+    """
+    Devuelve las sentencias para crear las vistas materializadas de SUMMARY_VIEWS sobre
+    una tabla, junto con sus índices únicos.
+    
+    Args:
+        table_name (str): Tabla sobre la que se calculan los agregados
+        suffix (str): Sufijo para los nombres de las vistas (por ejemplo, para la tabla sombra)
+        layout (str): Esquema de la tabla, 'flat' o 'star' (ver STAR_SUMMARY_VIEWS)
+        
+    Returns:
+        list: Sentencias CREATE MATERIALIZED VIEW y CREATE UNIQUE INDEX
+    """
+    statements = []
+    for view_name, (query, key_columns) in SUMMARY_VIEWS.items():
+        if layout == 'star':
+            query = STAR_SUMMARY_VIEWS[view_name]
+        statements.append(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view_name}{suffix} AS {query.format(table=table_name)}"
+        )
+        statements.append(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS {view_name}{suffix}_key "
+            f"ON {view_name}{suffix} ({', '.join(key_columns)})"
+        )
+    return statements
+
+@profiled_step
+def refresh_summary_views(cursor, concurrently=True):
+    """
+    Refresca las vistas materializadas de SUMMARY_VIEWS dentro de la transacción actual.
+    Con concurrently=True los lectores pueden seguir consultándolas mientras se refrescan.
+    
+    Args:
+        cursor: Cursor de la conexión a la base de datos
+        concurrently (bool): Usa REFRESH MATERIALIZED VIEW CONCURRENTLY
+    """
+    start_time = time.time()
+    mode = 'CONCURRENTLY ' if concurrently else ''
+    for view_name in SUMMARY_VIEWS:
+        cursor.execute(f"REFRESH MATERIALIZED VIEW {mode}{view_name}")
+    logger.info(f"Vistas materializadas refrescadas en {time.time() - start_time:.2f} segundos")
+
+def create_tables():
+    """
+    Crea las tablas necesarias en la base de datos, optimizadas para las consultas analíticas requeridas.
+    """
+    try:
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            
+            create_table_query, create_index_queries = get_electric_vehicles_ddl()
+            cursor.execute(create_table_query)
+            for create_index_query in create_index_queries:
+                cursor.execute(create_index_query)
+            
+            # Vistas materializadas con los agregados para el dashboard
+            for statement in get_summary_views_ddl():
+                cursor.execute(statement)
+            
+            # Confirmar cambios
+            connection.commit()
+            logger.info("Tablas e índices creados correctamente")
         
     except psycopg2.Error as e:
+        # La transacción se deshace al devolver la conexión al pool
         logger.error(f"Error al crear las tablas: {e}")
-        if connection:
-            connection.rollback()
         raise
-    finally:
-        if connection:
-            connection.close()
 
+@profiled_step
 def initialize_database():
     """
     Inicializa la base de datos creándola si no existe y generando las tablas necesarias.
@@ -129,28 +528,87 @@ def execute_query(query, params=None):
     Returns:
         list: Resultados de la consulta
     """
-    connection = None
     try:
-        connection = get_connection()
-        cursor = connection.cursor()
-        
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
             
-        # Obtener resultados
-        results = cursor.fetchall()
-        column_names = [desc[0] for desc in cursor.description]
-        
-        return {'columns': column_names, 'data': results}
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+                
+            # Obtener resultados
+            results = cursor.fetchall()
+            column_names = [desc[0] for desc in cursor.description]
+            
+            return {'columns': column_names, 'data': results}
         
     except psycopg2.Error as e:
         logger.error(f"Error al ejecutar consulta: {e}")
         return None
-    finally:
-        if connection:
-            connection.close()
+
+def iterate_query(query, params=None, itersize=DB_QUERY_ITERSIZE, output='tuples'):
+    """
+    Ejecuta una consulta SQL con un cursor del lado del servidor y entrega los resultados
+    en bloques de a lo sumo itersize filas, de modo que la memoria no depende del tamaño
+    del resultado (a diferencia de execute_query, que trae todas las filas juntas).
+    
+    La conexión queda tomada del pool hasta que se recorren todos los bloques o se cierra
+    el generador; conviene recorrerlo completo o cerrarlo explícitamente. A diferencia de
+    execute_query, los errores se registran y se relanzan, porque un resultado parcial no
+    se puede distinguir de uno completo.
+    
+    Args:
+        query (str): Consulta SQL a ejecutar (una sola sentencia SELECT)
+        params (tuple, optional): Parámetros para la consulta
+        itersize (int): Filas por bloque, que se traen del servidor en un solo viaje
+        output (str): Formato de cada bloque: 'tuples' (lista de tuplas), 'dataframe'
+            (pd.DataFrame) o 'numpy' (diccionario de columna -> np.ndarray)
+        
+    Yields:
+        tuple: (nombres de las columnas, bloque de filas en el formato indicado)
+    """
+    if output not in QUERY_BATCH_FORMATS:
+        raise ValueError(f"Formato de bloques no soportado: {output}")
+    
+    try:
+        # Los cursores con nombre necesitan una transacción, así que no se usa autocommit
+        with pooled_connection() as connection:
+            with connection.cursor(name=f"iterate_query_{next(_cursor_ids)}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                total_rows = 0
+                while True:
+                    rows = cursor.fetchmany(itersize)
+                    if not rows:
+                        break
+                    total_rows += len(rows)
+                    column_names = [desc[0] for desc in cursor.description]
+                    yield column_names, format_query_batch(rows, column_names, output)
+                logger.info(f"Consulta recorrida por bloques. Filas obtenidas: {total_rows}")
+    
+    except psycopg2.Error as e:
+        logger.error(f"Error al ejecutar consulta por bloques: {e}")
+        raise
+
+def format_query_batch(rows, column_names, output='tuples'):
+    """
+    Convierte un bloque de filas de iterate_query al formato pedido.
+    
+    Args:
+        rows (list): Filas como tuplas
+        column_names (list): Nombres de las columnas
+        output (str): 'tuples', 'dataframe' o 'numpy'
+        
+    Returns:
+        list, pd.DataFrame o dict: Bloque convertido
+    """
+    if output == 'tuples':
+        return rows
+    df = pd.DataFrame.from_records(rows, columns=column_names)
+    if output == 'dataframe':
+        return df
+    return {name: df[name].to_numpy() for name in column_names}
 
 if __name__ == "__main__":
     # Si este script se ejecuta directamente, inicializa la base de datos
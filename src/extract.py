@@ -1,36 +1,92 @@
 import os
+import gzip
+import json
+import shutil
+import hashlib
+from datetime import datetime
 import requests
-from config import RAW_DATA_DIR, RAW_DATA_FILENAME, EV_DATA_URL, logger
+from profiling import profiled_step, record_metrics
+from config import (RAW_DATA_DIR, RAW_DATA_FILENAME, RAW_SNAPSHOTS_DIR, EV_DATA_URL, EXTRACT_REFRESH,
+                    DOWNLOAD_CHUNK_SIZE, DOWNLOAD_TIMEOUT, RAW_DATA_COMPRESSION, RAW_SNAPSHOTS_KEEP, logger)
 
-def download_ev_data():
+try:
+    import zstandard
+except ImportError:
+    # Opcional: sólo hace falta con RAW_DATA_COMPRESSION=zstd
+    zstandard = None
+
+# Sufijos de los archivos auxiliares de la descarga
+METADATA_SUFFIX = '.meta.json'
+PARTIAL_SUFFIX = '.part'
+
+# Extensión del CSV crudo según la compresión con que se guarda
+RAW_COMPRESSION_SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+# Nivel de compresión gzip (el de gzip.open por defecto, 9, es mucho más lento y comprime apenas más)
+GZIP_LEVEL = 6
+# Codificaciones que se aceptan en la transferencia; requests las descomprime al leer
+TRANSFER_ENCODINGS = 'gzip, deflate'
+# Índice de las versiones guardadas en RAW_SNAPSHOTS_DIR
+SNAPSHOT_MANIFEST = 'manifest.json'
+
+@profiled_step
+def download_ev_data(url=EV_DATA_URL, output_dir=RAW_DATA_DIR, file_name=RAW_DATA_FILENAME,
+                     refresh=EXTRACT_REFRESH, chunk_size=DOWNLOAD_CHUNK_SIZE, sink=None,
+                     compression=RAW_DATA_COMPRESSION):
     """
     Descarga los datos de vehículos eléctricos desde la URL configurada
     y los guarda en el directorio de datos crudos.
     
+    Si refresh está activo y el archivo ya existe, se hace una solicitud condicional
+    (If-None-Match / If-Modified-Since) y sólo se descarga si el servidor informa cambios.
+    La descarga se escribe en un archivo temporal (.part) que reemplaza al definitivo al
+    terminar; si se interrumpe, la siguiente ejecución la continúa con una solicitud Range.
+    Al terminar se guarda en un archivo .meta.json el ETag, Last-Modified y el hash SHA-256
+    del contenido, que las etapas siguientes pueden usar para saber si los datos cambiaron.
+    
+    El archivo se guarda con la compresión indicada (agregando .gz o .zst al nombre) y, si
+    RAW_SNAPSHOTS_KEEP es mayor que 0, cada versión nueva se conserva además en
+    RAW_SNAPSHOTS_DIR (ver save_raw_snapshot).
+    
+    Args:
+        url (str): URL del archivo a descargar
+        output_dir (str): Directorio donde se guarda el archivo
+        file_name (str): Nombre del archivo
+        refresh (bool): Si es False y el archivo existe, se omite la descarga
+        chunk_size (int): Tamaño del buffer de lectura/escritura en bytes
+        sink (pipelining.ByteStreamQueue, optional): Si se descarga el archivo completo, los
+            bytes se envían también a este flujo a medida que llegan (ver fetch_if_changed)
+        compression (str): Compresión del archivo guardado ('none', 'gzip' o 'zstd')
+    
     Returns:
         str: Ruta al archivo descargado
     """
     # Ruta completa donde se guardará el archivo
-    output_file_path = os.path.join(RAW_DATA_DIR, RAW_DATA_FILENAME)
+    output_file_path = os.path.join(output_dir, get_raw_file_name(file_name, compression))
     
     try:
+        # Si el archivo se guardó con otra compresión, se convierte en lugar de descargarlo de nuevo
+        if not os.path.exists(output_file_path):
+            convert_raw_file(output_dir, file_name, output_file_path, chunk_size)
+        
         # Verificar si el archivo ya existe
-        if os.path.exists(output_file_path):
-            logger.info(f"El archivo {RAW_DATA_FILENAME} ya existe. Omitiendo descarga.")
+        if os.path.exists(output_file_path) and not refresh:
+            logger.info(f"El archivo {file_name} ya existe. Omitiendo descarga.")
             return output_file_path
         
-        logger.info(f"Descargando datos desde {EV_DATA_URL}")
-        
-        # Realizar la solicitud GET
-        response = requests.get(EV_DATA_URL, stream=True)
-        response.raise_for_status()  # Lanza una excepción si la solicitud falla
+        try:
+            changed = fetch_if_changed(url, output_file_path, chunk_size, sink)
+        except requests.exceptions.RequestException as e:
+            # Si ya tenemos una copia, se sigue trabajando con ella (salvo que el consumidor
+            # del flujo ya haya empezado a recibir el contenido nuevo)
+            if os.path.exists(output_file_path) and not (sink is not None and sink.started):
+                logger.warning(f"No se pudo verificar si hay datos nuevos ({e}). Se usa el archivo existente.")
+                return output_file_path
+            raise
         
-        # Guardar el archivo
-        with open(output_file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        logger.info(f"Datos descargados correctamente en {output_file_path}")
+        if changed:
+            logger.info(f"Datos descargados correctamente en {output_file_path}")
+        else:
+            logger.info(f"El archivo {file_name} no cambió en el servidor. Omitiendo descarga.")
         return output_file_path
     
     except requests.exceptions.RequestException as e:
@@ -43,6 +99,419 @@ def download_ev_data():
         logger.error(f"Error inesperado durante la descarga: {e}")
         raise
 
+def fetch_if_changed(url, output_file_path, chunk_size=DOWNLOAD_CHUNK_SIZE, sink=None):
+    """
+    Descarga el archivo si cambió respecto de la última descarga, continuando una descarga
+    parcial si la hay.
+    
+    Si se indica sink y el servidor envía el archivo completo, cada bloque se envía también
+    al flujo a medida que se escribe en disco, para que las etapas siguientes empiecen a
+    procesarlo sin esperar a que termine la descarga. Una descarga parcial continuada no
+    se envía, porque el flujo no tendría el principio del archivo.
+    
+    Args:
+        url (str): URL del archivo a descargar
+        output_file_path (str): Ruta del archivo definitivo
+        chunk_size (int): Tamaño del buffer de lectura/escritura en bytes
+        sink (pipelining.ByteStreamQueue, optional): Flujo que recibe los bytes descargados
+        
+    Returns:
+        bool: True si se descargó contenido nuevo, False si el servidor indicó que no cambió
+    """
+    partial_path = get_partial_path(output_file_path)
+    metadata = read_download_metadata(output_file_path) if os.path.exists(output_file_path) else {}
+    partial_metadata = read_download_metadata(partial_path)
+    
+    # Se pide el contenido comprimido para transferir menos bytes; requests lo descomprime al
+    # leerlo, así que la descarga parcial (.part) queda siempre sin comprimir
+    headers = {'Accept-Encoding': TRANSFER_ENCODINGS}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('last_modified'):
+        headers['If-Modified-Since'] = metadata['last_modified']
+    
+    # Continuar una descarga parcial sólo si el recurso sigue siendo el mismo (If-Range)
+    resume_from = 0
+    validator = partial_metadata.get('etag') or partial_metadata.get('last_modified')
+    if os.path.exists(partial_path) and validator:
+        resume_from = os.path.getsize(partial_path)
+        headers['Range'] = f'bytes={resume_from}-'
+        headers['If-Range'] = validator
+        # Los rangos tienen que coincidir con los bytes del archivo sin comprimir
+        headers['Accept-Encoding'] = 'identity'
+    
+    logger.info(f"Descargando datos desde {url}")
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 304:
+            return False
+        if response.status_code == 416:
+            # Si el servidor informa un tamaño igual al de la parte descargada, ya estaba completa
+            if response.headers.get('Content-Range') == f'bytes */{resume_from}':
+                logger.info("La descarga parcial ya estaba completa")
+                response.close()
+                validators = {key: partial_metadata.get(key) for key in ('url', 'etag', 'last_modified')}
+                finish_download(partial_path, output_file_path, validators, metadata, chunk_size)
+                return True
+            # La parte descargada no corresponde al archivo actual: se descarta
+            logger.warning("La descarga parcial no es válida. Se descarga el archivo completo.")
+            response.close()
+            os.remove(partial_path)
+            os.remove(partial_path + METADATA_SUFFIX)
+            return fetch_if_changed(url, output_file_path, chunk_size, sink)
+        response.raise_for_status()  # Lanza una excepción si la solicitud falla
+        
+        if response.status_code == 206:
+            logger.info(f"Continuando descarga parcial desde el byte {resume_from}")
+            mode = 'ab'
+        else:
+            # El servidor envía el archivo completo: se empieza de cero
+            resume_from = 0
+            mode = 'wb'
+            if sink is not None:
+                sink.begin()
+        
+        validators = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        write_download_metadata(partial_path, validators)
+        
+        # Content-Length es el tamaño transferido, que sólo coincide con el del archivo sin codificación
+        content_encoding = response.headers.get('Content-Encoding', 'identity')
+        expected_size = None
+        if response.headers.get('Content-Length') and content_encoding == 'identity':
+            expected_size = resume_from + int(response.headers['Content-Length'])
+        
+        # Guardar el archivo
+        transferred = 0
+        with open(partial_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                if sink is not None and mode == 'wb':
+                    sink.write(chunk)
+                # Se registran los bytes recibidos por la red, que con compresión son menos que los escritos
+                received = response.raw.tell()
+                record_metrics(bytes_read=received - transferred, bytes_written=len(chunk))
+                transferred = received
+        if content_encoding != 'identity':
+            logger.info(f"Transferencia con codificación {content_encoding}: {transferred} bytes recibidos")
+    
+    size = os.path.getsize(partial_path)
+    if expected_size is not None and size != expected_size:
+        raise IOError(f"Descarga incompleta: {size} de {expected_size} bytes")
+    
+    finish_download(partial_path, output_file_path, validators, metadata, chunk_size)
+    return True
+
+def finish_download(partial_path, output_file_path, validators, previous_metadata, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Mueve una descarga completa (.part) al archivo definitivo y guarda sus metadatos.
+    
+    Args:
+        partial_path (str): Ruta de la descarga parcial, ya completa
+        output_file_path (str): Ruta del archivo definitivo
+        validators (dict): URL, ETag y Last-Modified de la descarga
+        previous_metadata (dict): Metadatos del archivo anterior, vacío si no existía
+        chunk_size (int): Tamaño del buffer de lectura/escritura en bytes
+    """
+    size = os.path.getsize(partial_path)
+    # Se guarda con la compresión del archivo definitivo; el hash es el del contenido sin comprimir
+    content_hash, _ = store_raw_file(partial_path, output_file_path, chunk_size)
+    if content_hash == previous_metadata.get('sha256'):
+        logger.info("El contenido descargado es idéntico al anterior")
+    
+    if os.path.exists(partial_path + METADATA_SUFFIX):
+        os.remove(partial_path + METADATA_SUFFIX)
+    new_metadata = {
+        **validators,
+        'sha256': content_hash,
+        'size': size,
+        'stored_size': os.path.getsize(output_file_path),
+        'compression': get_file_compression(output_file_path),
+        'downloaded_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    write_download_metadata(output_file_path, new_metadata)
+    save_raw_snapshot(output_file_path, new_metadata)
+
+def get_raw_file_name(file_name=RAW_DATA_FILENAME, compression=RAW_DATA_COMPRESSION):
+    """
+    Devuelve el nombre del CSV crudo guardado con la compresión indicada.
+    
+    Args:
+        file_name (str): Nombre del archivo sin comprimir
+        compression (str): 'none', 'gzip' o 'zstd'
+        
+    Returns:
+        str: Nombre del archivo, con la extensión de la compresión
+    """
+    if compression not in RAW_COMPRESSION_SUFFIXES:
+        raise ValueError(f"Compresión de datos crudos no soportada: {compression}")
+    return file_name + RAW_COMPRESSION_SUFFIXES[compression]
+
+def get_file_compression(file_path):
+    """
+    Deduce la compresión de un archivo crudo a partir de su extensión.
+    
+    Args:
+        file_path (str): Ruta al archivo
+        
+    Returns:
+        str: 'none', 'gzip' o 'zstd'
+    """
+    for compression, suffix in RAW_COMPRESSION_SUFFIXES.items():
+        if suffix and str(file_path).endswith(suffix):
+            return compression
+    return 'none'
+
+def get_partial_path(output_file_path):
+    """
+    Devuelve la ruta de la descarga parcial, que siempre se guarda sin comprimir y con el
+    mismo nombre aunque cambie la compresión configurada.
+    """
+    suffix = RAW_COMPRESSION_SUFFIXES[get_file_compression(output_file_path)]
+    return output_file_path[:len(output_file_path) - len(suffix)] + PARTIAL_SUFFIX
+
+def open_raw_file(file_path, mode='rb', compression=None):
+    """
+    Abre un archivo crudo en modo binario, comprimiendo o descomprimiendo al vuelo.
+    
+    Args:
+        file_path (str): Ruta al archivo
+        mode (str): 'rb' o 'wb'
+        compression (str, optional): Compresión del archivo. Si es None se deduce de la extensión
+        
+    Returns:
+        archivo binario
+    """
+    if compression is None:
+        compression = get_file_compression(file_path)
+    if compression == 'gzip':
+        return gzip.open(file_path, mode, compresslevel=GZIP_LEVEL)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("Para leer o guardar archivos zstd hace falta instalar el paquete zstandard")
+        return zstandard.open(file_path, mode)
+    return open(file_path, mode)
+
+@profiled_step
+def store_raw_file(source_path, output_file_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Mueve un archivo crudo a su ubicación definitiva con la compresión que corresponde a su
+    extensión, calculando en la misma pasada el hash del contenido sin comprimir. Si ninguno
+    de los dos está comprimido, el archivo sólo se renombra.
+    
+    Args:
+        source_path (str): Archivo de origen, que se elimina al terminar
+        output_file_path (str): Ruta del archivo definitivo
+        chunk_size (int): Tamaño del buffer de lectura/escritura en bytes
+        
+    Returns:
+        tuple: (hash SHA-256 del contenido, tamaño del contenido sin comprimir)
+    """
+    output_compression = get_file_compression(output_file_path)
+    if output_compression == 'none' and get_file_compression(source_path) == 'none':
+        content_hash = compute_file_hash(source_path, chunk_size)
+        size = os.path.getsize(source_path)
+        os.replace(source_path, output_file_path)
+        return content_hash, size
+    
+    logger.info(f"Guardando {output_file_path} con compresión {output_compression}")
+    sha256 = hashlib.sha256()
+    size = 0
+    temp_path = output_file_path + '.tmp'
+    with open_raw_file(source_path, 'rb') as source, open_raw_file(temp_path, 'wb', output_compression) as output:
+        for block in iter(lambda: source.read(chunk_size), b''):
+            sha256.update(block)
+            output.write(block)
+            size += len(block)
+    record_metrics(bytes_read=os.path.getsize(source_path), bytes_written=os.path.getsize(temp_path))
+    os.replace(temp_path, output_file_path)
+    os.remove(source_path)
+    return sha256.hexdigest(), size
+
+def convert_raw_file(output_dir, file_name, output_file_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Si el CSV crudo existe guardado con otra compresión (por ejemplo, de antes de cambiar
+    RAW_DATA_COMPRESSION), lo convierte a la compresión de output_file_path junto con sus
+    metadatos de descarga.
+    
+    Args:
+        output_dir (str): Directorio de los datos crudos
+        file_name (str): Nombre del archivo sin comprimir
+        output_file_path (str): Ruta del archivo con la compresión configurada
+        chunk_size (int): Tamaño del buffer de lectura/escritura en bytes
+        
+    Returns:
+        bool: True si se convirtió un archivo existente
+    """
+    for compression in RAW_COMPRESSION_SUFFIXES:
+        existing_path = os.path.join(output_dir, get_raw_file_name(file_name, compression))
+        if existing_path == output_file_path or not os.path.exists(existing_path):
+            continue
+        
+        logger.info(f"Convirtiendo {existing_path} a {output_file_path}")
+        metadata = read_download_metadata(existing_path)
+        content_hash, size = store_raw_file(existing_path, output_file_path, chunk_size)
+        write_download_metadata(output_file_path, {
+            **metadata,
+            'sha256': content_hash,
+            'size': size,
+            'stored_size': os.path.getsize(output_file_path),
+            'compression': get_file_compression(output_file_path),
+        })
+        if os.path.exists(existing_path + METADATA_SUFFIX):
+            os.remove(existing_path + METADATA_SUFFIX)
+        return True
+    return False
+
+def save_raw_snapshot(file_path, metadata, keep=RAW_SNAPSHOTS_KEEP, snapshots_dir=RAW_SNAPSHOTS_DIR):
+    """
+    Conserva la versión recién descargada del CSV crudo en snapshots_dir y la registra en
+    el índice (manifest.json) con su hash, tamaños y validadores. Se guarda como enlace
+    al archivo actual, que en cada descarga se reemplaza en lugar de modificarse, así que
+    no ocupa espacio extra hasta la descarga siguiente; con el CSV comprimido, conservar
+    versiones anteriores cuesta sólo su tamaño comprimido. Se eliminan las más antiguas
+    para conservar a lo sumo keep versiones.
+    
+    Args:
+        file_path (str): Ruta al CSV crudo descargado
+        metadata (dict): Metadatos de la descarga (ver fetch_if_changed)
+        keep (int): Cantidad de versiones a conservar; con 0 no se guarda ninguna
+        snapshots_dir (str): Directorio de las versiones
+        
+    Returns:
+        str: Ruta a la versión guardada, None si no se guardó
+    """
+    if keep <= 0:
+        return None
+    
+    manifest_path = os.path.join(snapshots_dir, SNAPSHOT_MANIFEST)
+    manifest = read_snapshot_manifest(snapshots_dir)
+    if any(entry['sha256'] == metadata['sha256'] for entry in manifest['snapshots']):
+        logger.info("La versión descargada ya está guardada entre las versiones anteriores")
+        return None
+    
+    os.makedirs(snapshots_dir, exist_ok=True)
+    downloaded_at = datetime.fromisoformat(metadata['downloaded_at'])
+    snapshot_name = f"{downloaded_at:%Y%m%dT%H%M%S}_{os.path.basename(file_path)}"
+    snapshot_path = os.path.join(snapshots_dir, snapshot_name)
+    try:
+        os.link(file_path, snapshot_path)
+    except OSError:
+        # Sistemas de archivos sin enlaces duros
+        shutil.copy2(file_path, snapshot_path)
+    
+    manifest['snapshots'].append({'file': snapshot_name, **metadata})
+    for entry in manifest['snapshots'][:-keep]:
+        old_path = os.path.join(snapshots_dir, entry['file'])
+        if os.path.exists(old_path):
+            os.remove(old_path)
+        logger.info(f"Versión anterior eliminada: {entry['file']}")
+    manifest['snapshots'] = manifest['snapshots'][-keep:]
+    write_json_file(manifest_path, manifest)
+    
+    logger.info(f"Versión de los datos crudos guardada en {snapshot_path}")
+    return snapshot_path
+
+def read_snapshot_manifest(snapshots_dir=RAW_SNAPSHOTS_DIR):
+    """
+    Lee el índice de las versiones guardadas del CSV crudo.
+    
+    Args:
+        snapshots_dir (str): Directorio de las versiones
+        
+    Returns:
+        dict: {'snapshots': [metadatos de cada versión, de la más antigua a la más nueva]}
+    """
+    manifest_path = os.path.join(snapshots_dir, SNAPSHOT_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {'snapshots': []}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        logger.warning(f"No se pudo leer el índice de versiones {manifest_path}: {e}")
+        return {'snapshots': []}
+
+@profiled_step
+def compute_file_hash(file_path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo (sin comprimir, si está comprimido).
+    
+    Args:
+        file_path (str): Ruta al archivo
+        chunk_size (int): Tamaño del buffer de lectura en bytes
+        
+    Returns:
+        str: Hash en hexadecimal
+    """
+    sha256 = hashlib.sha256()
+    with open_raw_file(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(block)
+            record_metrics(bytes_read=len(block))
+    return sha256.hexdigest()
+
+def read_download_metadata(file_path):
+    """
+    Lee los metadatos de descarga (.meta.json) asociados a un archivo.
+    
+    Args:
+        file_path (str): Ruta al archivo descargado
+        
+    Returns:
+        dict: Metadatos (etag, last_modified, sha256, ...), vacío si no existen
+    """
+    metadata_path = file_path + METADATA_SUFFIX
+    if not os.path.exists(metadata_path):
+        return {}
+    try:
+        with open(metadata_path) as f:
+            return json.load(f)
+    except (IOError, ValueError) as e:
+        logger.warning(f"No se pudieron leer los metadatos de {file_path}: {e}")
+        return {}
+
+def write_download_metadata(file_path, metadata):
+    """
+    Guarda los metadatos de descarga de un archivo de forma atómica.
+    
+    Args:
+        file_path (str): Ruta al archivo descargado
+        metadata (dict): Metadatos a guardar
+    """
+    write_json_file(file_path + METADATA_SUFFIX, metadata)
+
+def write_json_file(file_path, data):
+    """
+    Guarda datos en formato JSON de forma atómica.
+    
+    Args:
+        file_path (str): Ruta del archivo
+        data (dict): Datos a guardar
+    """
+    with open(file_path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(file_path + '.tmp', file_path)
+
+def get_raw_data_hash(file_path):
+    """
+    Devuelve el hash SHA-256 del contenido del archivo de datos crudos. Usa el valor
+    registrado en la descarga si el tamaño en disco coincide; si no, lo calcula.
+    
+    Args:
+        file_path (str): Ruta al archivo de datos crudos
+        
+    Returns:
+        str: Hash en hexadecimal
+    """
+    metadata = read_download_metadata(file_path)
+    stored_size = metadata.get('stored_size', metadata.get('size'))
+    if metadata.get('sha256') and stored_size == os.path.getsize(file_path):
+        return metadata['sha256']
+    return compute_file_hash(file_path)
+
 def validate_file(file_path):
     """
     Valida que el archivo descargado exista y no esté vacío.
@@ -71,6 +540,7 @@ def validate_file(file_path):
         logger.error(f"Error al validar el archivo: {e}")
         return False
 
+@profiled_step
 def extract_data():
     """
     Función principal que orquesta la extracción de datos.
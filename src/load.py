@@ -1,16 +1,45 @@
+import time
+import threading
+import contextvars
 import pandas as pd
 import psycopg2
-from io import StringIO
-from database import get_connection
-from config import logger
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from io import StringIO, BytesIO
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from database import (pooled_connection, get_electric_vehicles_ddl, get_summary_views_ddl,
+                      refresh_summary_views, get_year_partition_ddl, get_year_partitions,
+                      SUMMARY_VIEWS, DIMENSION_TABLES)
+from transform import read_processed_data, PROCESSED_FILE_EXTENSIONS
+from profiling import profiled_step, track_step, record_metrics
+from config import LOAD_METHOD, LOAD_STRATEGY, LOAD_BATCH_SIZE, LOAD_WORKERS, DB_POOL_MAX_SIZE, logger
 
-def load_data_to_database(df, table_name='electric_vehicles'):
+# Tamaño de lectura que usa COPY sobre el flujo de datos (1 MB)
+COPY_READ_SIZE = 1024 * 1024
+
+# Memoria de trabajo para reconstruir los índices después de una carga masiva
+INDEX_BUILD_MEMORY = '256MB'
+
+# Sufijos de las generaciones de la tabla en la carga por intercambio ('swap')
+SHADOW_SUFFIX = '_new'
+PREVIOUS_SUFFIX = '_old'
+# Tiempo máximo de espera del bloqueo al intercambiar las tablas
+SWAP_LOCK_TIMEOUT = '10s'
+
+@profiled_step
+def load_data_to_database(df, table_name='electric_vehicles', method=LOAD_METHOD, strategy=LOAD_STRATEGY,
+                          workers=LOAD_WORKERS):
     """
     Carga los datos del DataFrame a la tabla especificada en la base de datos PostgreSQL.
     
     Args:
         df (pd.DataFrame): DataFrame con los datos procesados
         table_name (str): Nombre de la tabla en la base de datos
+        method (str): 'bulk' para la carga por lotes sin índices, 'copy' para el método original
+        strategy (str): 'replace' para reemplazar todo el contenido, 'incremental' para aplicar
+            sólo las diferencias por dol_vehicle_id, 'swap' para cargar una tabla sombra e
+            intercambiarla con la actual
+        workers (int): Conexiones que copian en paralelo a la tabla sombra (sólo con 'swap')
         
     Returns:
         bool: True si la carga fue exitosa, False en caso contrario
@@ -19,51 +48,752 @@ def load_data_to_database(df, table_name='electric_vehicles'):
         logger.error("No hay datos para cargar en la base de datos")
         return False
     
-    connection = None
+    return load_chunks_to_database([df], table_name, method, strategy, workers) is not None
+
+@profiled_step
+def load_chunks_to_database(chunks, table_name='electric_vehicles', method=LOAD_METHOD, strategy=LOAD_STRATEGY,
+                            workers=LOAD_WORKERS):
+    """
+    Carga en la base de datos una secuencia de bloques de datos (por ejemplo, los generados
+    por transform.transform_data_in_chunks). Todos los bloques se cargan en una única
+    transacción, así que si algún bloque falla la tabla queda como estaba.
+    
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        method (str): 'bulk' para la carga por lotes sin índices, 'copy' para el método original
+        strategy (str): 'replace' para reemplazar todo el contenido, 'incremental' para aplicar
+            sólo las diferencias por dol_vehicle_id, 'swap' para cargar una tabla sombra e
+            intercambiarla con la actual
+        workers (int): Conexiones que copian en paralelo a la tabla sombra (sólo con 'swap')
+        
+    Returns:
+        int: Cantidad de filas cargadas, None si hubo un error
+    """
+    if workers > 1 and strategy != 'swap':
+        # Con 'replace' e 'incremental' los datos se copian en la transacción de la carga,
+        # que las otras conexiones no pueden ver
+        logger.warning(f"La carga en paralelo sólo se usa con la estrategia 'swap'. "
+                       f"Se carga con una conexión (estrategia: {strategy})")
+    
     try:
-        # Establecer conexión
-        connection = get_connection()
-        cursor = connection.cursor()
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            
+            start_time = time.time()
+            if strategy == 'incremental':
+                total_rows = load_incremental(chunks, table_name, cursor, method)
+            elif strategy == 'swap':
+                total_rows = load_swap(chunks, table_name, cursor, method, workers)
+            else:
+                total_rows = load_replace(chunks, table_name, cursor, method)
+            
+            if total_rows == 0:
+                logger.error("No hay datos para cargar en la base de datos")
+                connection.rollback()
+                return None
+            
+            # Las vistas de resumen se actualizan en la misma transacción que los datos
+            # (en 'swap' ya se calcularon sobre la tabla sombra)
+            if strategy != 'swap':
+                refresh_summary_views(cursor)
+            
+            log_load_throughput(total_rows, time.time() - start_time)
+            record_metrics(rows_out=total_rows)
+            
+            # Confirmar la transacción
+            connection.commit()
+            logger.info(f"Datos cargados exitosamente en la tabla {table_name}: {total_rows} filas")
+            return total_rows
+    
+    # Ante un error la transacción se deshace al devolver la conexión al pool
+    except psycopg2.Error as e:
+        logger.error(f"Error al cargar datos en la base de datos: {e}")
+        return None
+    
+    except Exception as e:
+        logger.error(f"Error inesperado durante la carga de datos: {e}")
+        return None
+
+@profiled_step
+def load_replace(chunks, table_name, cursor, method=LOAD_METHOD):
+    """
+    Reemplaza todo el contenido de la tabla por los bloques recibidos, dentro de la
+    transacción actual.
+    
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        method (str): 'bulk' o 'copy'
         
-        # Truncar la tabla si existe para evitar duplicados
-        logger.info(f"Eliminando datos existentes de la tabla {table_name}")
-        cursor.execute(f"TRUNCATE TABLE {table_name}")
+    Returns:
+        int: Cantidad de filas cargadas
+    """
+    # Truncar la tabla una sola vez antes del primer bloque
+    logger.info(f"Eliminando datos existentes de la tabla {table_name}")
+    cursor.execute(f"TRUNCATE TABLE {table_name}")
+    
+    index_definitions = []
+    if method == 'bulk':
+        # Los índices se eliminan durante la carga y se reconstruyen al final
+        index_definitions = drop_secondary_indexes(table_name, cursor)
+    
+    # La tabla se truncó en esta transacción, así que se puede usar COPY FREEZE
+    total_rows = copy_chunks(chunks, table_name, cursor, method, freeze=True)
+    
+    rebuild_indexes(index_definitions, cursor)
+    return total_rows
+
+@profiled_step
+def load_incremental(chunks, table_name, cursor, method=LOAD_METHOD):
+    """
+    Aplica sobre la tabla sólo las diferencias con los bloques recibidos, usando
+    dol_vehicle_id como clave. Los bloques se copian a una tabla temporal de staging y
+    a partir de ella se eliminan los vehículos que ya no están, se actualizan los que
+    cambiaron y se insertan los nuevos, todo dentro de la transacción actual. Las filas
+    que no cambiaron no se reescriben, y los lectores ven la tabla anterior hasta el commit.
+    
+    Si la tabla está particionada por año, un vehículo se identifica por dol_vehicle_id y
+    model_year (si cambia de año se elimina de una partición y se inserta en otra), y las
+    comparaciones sólo leen las particiones de los años del lote.
+    
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        method (str): 'bulk' o 'copy' (para copiar a la tabla de staging)
         
-        # Verificar y ajustar los nombres de columnas si es necesario
-        df_copy = prepare_dataframe_for_db(df, table_name, cursor)
+    Returns:
+        int: Cantidad de filas del lote nuevo
+    """
+    staging_table = f"{table_name}_staging"
+    cursor.execute(f"""
+        CREATE TEMP TABLE {staging_table} ON COMMIT DROP AS
+        SELECT * FROM {table_name} WITH NO DATA
+    """)
+    cursor.execute(f"ALTER TABLE {staging_table} DROP COLUMN id")
+    
+    total_rows = copy_chunks(chunks, staging_table, cursor, method, freeze=True)
+    if total_rows == 0:
+        return 0
+    
+    # Estadísticas para que el planificador elija joins por hash contra la tabla principal
+    cursor.execute(f"ANALYZE {staging_table}")
+    
+    # Si la tabla está particionada por año, crear las particiones de los años nuevos
+    cursor.execute(f"SELECT DISTINCT model_year FROM {staging_table} WHERE model_year IS NOT NULL")
+    staged_years = [row[0] for row in cursor.fetchall()]
+    _, partition_years = get_year_partitions(table_name, cursor)
+    create_year_partitions(table_name, get_model_years(staged_years), cursor)
+    
+    cursor.execute(f"SELECT * FROM {staging_table} LIMIT 0")
+    columns = [desc[0] for desc in cursor.description]
+    value_columns = [col for col in columns if col != 'dol_vehicle_id']
+    
+    # En una tabla particionada el año es parte de la clave y las comparaciones se limitan a
+    # los años del lote, para que PostgreSQL sólo lea esas particiones
+    key_condition = "s.dol_vehicle_id = t.dol_vehicle_id"
+    year_filter = ""
+    params = None
+    deleted = 0
+    if partition_years is not None:
+        key_condition += " AND s.model_year = t.model_year"
+        year_filter = "AND t.model_year = ANY(%(years)s)"
+        params = {'years': staged_years}
+        # Los años que ya no están en el lote se vacían sin compararlos con el staging
+        for year in sorted(partition_years - get_model_years(staged_years)):
+            cursor.execute(f"DELETE FROM {table_name}_y{year}")
+            deleted += cursor.rowcount
+    
+    # Vehículos que ya no están en el lote nuevo
+    cursor.execute(f"""
+        DELETE FROM {table_name} t
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {staging_table} s WHERE {key_condition}
+        ) {year_filter}
+    """, params)
+    deleted += cursor.rowcount
+    
+    # Vehículos con algún valor distinto
+    assignments = ', '.join(f"{col} = s.{col}" for col in value_columns)
+    target_values = ', '.join(f"t.{col}" for col in value_columns)
+    staging_values = ', '.join(f"s.{col}" for col in value_columns)
+    cursor.execute(f"""
+        UPDATE {table_name} t
+        SET {assignments}
+        FROM {staging_table} s
+        WHERE {key_condition} {year_filter}
+          AND ({target_values}) IS DISTINCT FROM ({staging_values})
+    """, params)
+    updated = cursor.rowcount
+    
+    # Vehículos nuevos
+    column_list = ', '.join(columns)
+    cursor.execute(f"""
+        INSERT INTO {table_name} ({column_list})
+        SELECT {column_list} FROM {staging_table} s
+        WHERE NOT EXISTS (
+            SELECT 1 FROM {table_name} t WHERE {key_condition} {year_filter}
+        )
+    """, params)
+    inserted = cursor.rowcount
+    
+    logger.info(f"Carga incremental en {table_name}: {inserted} insertadas, "
+                f"{updated} actualizadas, {deleted} eliminadas, "
+                f"{total_rows - inserted - updated} sin cambios")
+    return total_rows
+
+@profiled_step
+def load_swap(chunks, table_name, cursor, method=LOAD_METHOD, workers=1):
+    """
+    Carga los bloques en una tabla sombra con la misma estructura e índices que la tabla
+    principal y luego la intercambia con ella mediante renombres. La tabla sombra se
+    construye y confirma sin bloquear a los lectores; el intercambio ocurre en una
+    transacción corta, junto con las vistas materializadas de resumen, que también se
+    calculan sobre la tabla sombra. La generación anterior queda como {table_name}_old
+    para poder volver atrás con restore_previous_generation.
+    
+    Con más de un worker la tabla sombra vacía se confirma antes de copiar los datos, para
+    que las otras conexiones puedan verla, y se llena con copy_chunks_in_parallel. Los
+    lectores siguen sin verla hasta el intercambio, así que la carga sigue apareciendo
+    como una única generación nueva.
+    
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        method (str): 'bulk' o 'copy'
+        workers (int): Conexiones que copian en paralelo a la tabla sombra
+        
+    Returns:
+        int: Cantidad de filas cargadas
+    """
+    workers = limit_load_workers(workers)
+    shadow_table = table_name + SHADOW_SUFFIX
+    logger.info(f"Construyendo la tabla sombra {shadow_table}")
+    # CASCADE elimina también las vistas materializadas de la tabla sombra anterior
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow_table} CASCADE")
+    create_table_query, create_index_queries = get_electric_vehicles_ddl(shadow_table, SHADOW_SUFFIX)
+    cursor.execute(create_table_query)
+    
+    if workers > 1:
+        cursor.connection.commit()
+        try:
+            total_rows = copy_chunks_in_parallel(chunks, shadow_table, cursor, method, workers)
+        except Exception:
+            # No dejar una tabla sombra a medio cargar
+            cursor.connection.rollback()
+            cursor.execute(f"DROP TABLE IF EXISTS {shadow_table} CASCADE")
+            cursor.connection.commit()
+            raise
+    else:
+        # La tabla se creó en esta transacción, así que se puede usar COPY FREEZE
+        total_rows = copy_chunks(chunks, shadow_table, cursor, method, freeze=True)
+    if total_rows == 0:
+        return 0
+    
+    # Crear los índices después de la carga y actualizar estadísticas
+    rebuild_indexes([(None, query) for query in create_index_queries], cursor)
+    cursor.execute(f"ANALYZE {shadow_table}")
+    
+    # Vistas materializadas de resumen calculadas sobre la tabla sombra
+    for statement in get_summary_views_ddl(shadow_table, SHADOW_SUFFIX):
+        cursor.execute(statement)
+    
+    # Confirmar la tabla sombra antes del intercambio: si éste falla, se puede reintentar
+    cursor.connection.commit()
+    
+    # Intercambio en una transacción corta
+    start_time = time.time()
+    cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+    cursor.execute(f"DROP TABLE IF EXISTS {table_name + PREVIOUS_SUFFIX} CASCADE")
+    rename_table_generation(table_name, '', PREVIOUS_SUFFIX, cursor)
+    rename_table_generation(table_name, SHADOW_SUFFIX, '', cursor)
+    logger.info(f"Tabla {shadow_table} intercambiada con {table_name} en {time.time() - start_time:.3f} segundos. "
+                f"Generación anterior disponible en {table_name + PREVIOUS_SUFFIX}")
+    return total_rows
+
+def limit_load_workers(workers, pool_size=DB_POOL_MAX_SIZE):
+    """
+    Limita los workers de la carga en paralelo a las conexiones del pool que quedan libres
+    además de la de la carga. Con más, los que sobran esperarían una conexión hasta
+    DB_POOL_TIMEOUT y la carga fallaría.
+    
+    Args:
+        workers (int): Workers pedidos (LOAD_WORKERS)
+        pool_size (int): Conexiones máximas del pool (DB_POOL_MAX_SIZE)
+        
+    Returns:
+        int: Workers que se pueden usar (1 significa copiar con la conexión de la carga)
+    """
+    max_workers = max(pool_size - 1, 1)
+    if workers > max_workers:
+        logger.warning(f"LOAD_WORKERS ({workers}) supera las conexiones libres del pool "
+                       f"(DB_POOL_MAX_SIZE - 1 = {max_workers}). Se usan {max_workers} workers")
+        return max_workers
+    return workers
+
+def rename_table_generation(table_name, from_suffix, to_suffix, cursor):
+    """
+    Renombra una generación de la tabla (por ejemplo electric_vehicles_new -> electric_vehicles)
+    junto con sus índices, su clave primaria, su secuencia, sus particiones por año y sus
+    vistas materializadas de resumen, para que los nombres coincidan siempre con los que
+    crean database.create_tables y create_year_partitions.
+    
+    Args:
+        table_name (str): Nombre base de la tabla
+        from_suffix (str): Sufijo actual de la generación ('' para la tabla principal)
+        to_suffix (str): Sufijo nuevo de la generación
+        cursor: Cursor de la conexión a la base de datos
+    """
+    relations = [('TABLE', table_name)] + [('MATERIALIZED VIEW', view_name) for view_name in SUMMARY_VIEWS]
+    
+    for relation_kind, base_name in relations:
+        source_name = base_name + from_suffix
+        target_name = base_name + to_suffix
+        cursor.execute("SELECT to_regclass(%s)", (source_name,))
+        if cursor.fetchone()[0] is None:
+            continue
+        
+        def renamed(object_name):
+            # Objetos nombrados a partir de la relación (clave primaria, secuencia, clave única)
+            if object_name.startswith(source_name + '_'):
+                return target_name + object_name[len(source_name):]
+            # Índices con sufijo de generación (idx_ev_model_year_new)
+            if from_suffix and object_name.endswith(from_suffix):
+                object_name = object_name[:-len(from_suffix)]
+            return object_name + to_suffix
         
-        # Usar copy_from para carga eficiente
-        logger.info(f"Cargando {len(df_copy)} filas en la tabla {table_name}")
+        def rename_indexes(relation_name):
+            cursor.execute("""
+                SELECT indexname FROM pg_indexes
+                WHERE schemaname = current_schema() AND tablename = %s
+            """, (relation_name,))
+            for (index_name,) in cursor.fetchall():
+                cursor.execute(f"ALTER INDEX {index_name} RENAME TO {renamed(index_name)}")
         
-        # Convertir DataFrame a CSV en memoria( Hago coincidir mi dataframe con la tabla para no recibir errores en copy_from)
-        buffer = StringIO()
-        df_copy.to_csv(buffer, index=False, header=False, na_rep='NULL')
-        buffer.seek(0) # Pongo el cursor al inicio del buffer
+        rename_indexes(source_name)
         
-        # Copiar del buffer a la tabla
-        cursor.copy_from(buffer, table_name, sep=',', null='NULL', columns=df_copy.columns.tolist())
+        if relation_kind == 'TABLE':
+            # Particiones por año ({tabla}_y2020) y sus índices
+            cursor.execute("""
+                SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(%s)
+            """, (source_name,))
+            for (partition_name,) in cursor.fetchall():
+                rename_indexes(partition_name)
+                cursor.execute(f"ALTER TABLE {partition_name} RENAME TO {renamed(partition_name)}")
+            
+            cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (source_name,))
+            sequence = cursor.fetchone()[0]
+            if sequence:
+                sequence_name = sequence.split('.')[-1]
+                cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {renamed(sequence_name)}")
         
-        # Confirmar la transacción
-        connection.commit()
-        logger.info(f"Datos cargados exitosamente en la tabla {table_name}")
-        return True
+        cursor.execute(f"ALTER {relation_kind} {source_name} RENAME TO {target_name}")
+
+def restore_previous_generation(table_name='electric_vehicles'):
+    """
+    Vuelve a poner en uso la generación anterior de la tabla ({table_name}_old), dejada por
+    una carga con estrategia 'swap'. La generación que estaba en uso pasa a ser la anterior,
+    así que la operación se puede deshacer llamándola de nuevo.
+    
+    Args:
+        table_name (str): Nombre de la tabla en la base de datos
+        
+    Returns:
+        bool: True si se restauró la generación anterior, False en caso contrario
+    """
+    try:
+        with pooled_connection() as connection:
+            cursor = connection.cursor()
+            
+            cursor.execute("SELECT to_regclass(%s)", (table_name + PREVIOUS_SUFFIX,))
+            if cursor.fetchone()[0] is None:
+                logger.error(f"No existe una generación anterior de la tabla {table_name}")
+                return False
+            
+            cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name + SHADOW_SUFFIX} CASCADE")
+            rename_table_generation(table_name, '', SHADOW_SUFFIX, cursor)
+            rename_table_generation(table_name, PREVIOUS_SUFFIX, '', cursor)
+            rename_table_generation(table_name, SHADOW_SUFFIX, PREVIOUS_SUFFIX, cursor)
+            connection.commit()
+            logger.info(f"Generación anterior de la tabla {table_name} restaurada")
+            return True
     
     except psycopg2.Error as e:
-        logger.error(f"Error al cargar datos en la base de datos: {e}")
-        if connection:
-            connection.rollback()
+        logger.error(f"Error al restaurar la generación anterior: {e}")
         return False
+
+def copy_chunks(chunks, table_name, cursor, method=LOAD_METHOD, freeze=False):
+    """
+    Copia una secuencia de bloques a la tabla con el método indicado.
     
-    except Exception as e:
-        logger.error(f"Error inesperado durante la carga de datos: {e}")
-        if connection:
-            connection.rollback()
-        return False
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        method (str): 'bulk' o 'copy'
+        freeze (bool): Usa COPY ... FREEZE en el método 'bulk' (ver copy_dataframe_in_batches).
+            Se ignora si la tabla está particionada, porque PostgreSQL no lo admite
+        
+    Returns:
+        int: Cantidad de filas copiadas
+    """
+    partitioned = get_year_partitions(table_name, cursor)[0] is not None
+    freeze = freeze and not partitioned
+    total_rows = 0
+    for chunk in chunks:
+        if chunk is None or chunk.empty:
+            continue
+        # Verificar y ajustar los nombres de columnas si es necesario
+        df_copy = prepare_dataframe_for_db(chunk, table_name, cursor)
+        if partitioned:
+            create_year_partitions(table_name, get_model_years(df_copy['model_year']), cursor)
+        logger.info(f"Cargando {len(df_copy)} filas en la tabla {table_name} (método: {method})")
+        copy_dataframe_with_method(df_copy, table_name, cursor, method, freeze)
+        total_rows += len(df_copy)
+    return total_rows
+
+def get_model_years(values):
+    """
+    Devuelve los años distintos de una columna model_year, sea de fechas o de años.
+    
+    Args:
+        values (iterable): Valores de model_year
+        
+    Returns:
+        set: Años (int), sin los nulos
+    """
+    return {value.year if hasattr(value, 'year') else int(value)
+            for value in pd.Series(values).dropna().drop_duplicates()}
+
+def create_year_partitions(table_name, years, cursor):
+    """
+    Crea las particiones de los años que todavía no tienen una, si la tabla está
+    particionada por año del modelo (ver DB_PARTITIONING). Los índices de la tabla
+    particionada se crean también en las particiones nuevas.
+    
+    Args:
+        table_name (str): Nombre de la tabla
+        years (iterable): Años que se van a cargar
+        cursor: Cursor de la conexión a la base de datos
+        
+    Returns:
+        list: Años cuyas particiones se crearon
+    """
+    key_type, existing_years = get_year_partitions(table_name, cursor)
+    if key_type is None:
+        return []
+    missing_years = sorted(set(years) - existing_years)
+    for year in missing_years:
+        cursor.execute(get_year_partition_ddl(table_name, year, key_type))
+    if missing_years:
+        logger.info(f"Particiones creadas en {table_name} para los años: {missing_years}")
+    return missing_years
+
+def copy_dataframe_with_method(df_copy, table_name, cursor, method=LOAD_METHOD, freeze=False):
+    """
+    Copia un DataFrame ya preparado a la tabla con el método indicado ('bulk' o 'copy').
+    """
+    if method == 'bulk':
+        copy_dataframe_in_batches(df_copy, table_name, cursor, freeze=freeze)
+    else:
+        copy_dataframe(df_copy, table_name, cursor)
+
+def split_dataframe(df, partitions, min_rows=LOAD_BATCH_SIZE):
+    """
+    Divide un DataFrame en hasta partitions partes consecutivas de tamaño parecido, sin
+    bajar de min_rows filas por parte.
+    
+    Args:
+        df (pd.DataFrame): DataFrame a dividir
+        partitions (int): Cantidad máxima de partes
+        min_rows (int): Cantidad mínima de filas por parte
+        
+    Returns:
+        list: Partes del DataFrame
+    """
+    partitions = max(1, min(partitions, len(df) // max(min_rows, 1)))
+    bounds = [len(df) * part // partitions for part in range(partitions + 1)]
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+@profiled_step
+def copy_chunks_in_parallel(chunks, table_name, cursor, method=LOAD_METHOD, workers=LOAD_WORKERS):
+    """
+    Copia una secuencia de bloques a la tabla con varios COPY simultáneos, cada uno en su
+    propia conexión del pool y su propia transacción. La tabla tiene que estar confirmada
+    (las otras conexiones no ven lo que no se confirmó) y no estar en uso por los lectores,
+    porque cada partición es visible apenas se confirma.
+    
+    Los bloques se preparan con el cursor de la carga (en el esquema 'star' las dimensiones
+    nuevas se insertan en su transacción) y se dividen en particiones que copian los workers.
+    Si la tabla está particionada por año, las particiones de los años nuevos se crean y
+    confirman con la conexión de la carga antes de copiar el bloque.
+    Como mucho hay 2 particiones por worker en espera, para que la memoria no crezca con
+    una secuencia larga de bloques.
+    
+    Cada worker ocupa una conexión del pool durante todo su COPY y la carga ya tiene otra,
+    así que workers no debe superar DB_POOL_MAX_SIZE - 1 (ver limit_load_workers).
+    
+    Args:
+        chunks (iterable): Bloques (pd.DataFrame) con los datos procesados
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión de la carga
+        method (str): 'bulk' o 'copy'
+        workers (int): Cantidad de conexiones que copian en paralelo
+        
+    Returns:
+        int: Cantidad de filas copiadas
+    """
+    worker_stats = {}
+    stats_lock = threading.Lock()
+    
+    def copy_partition(partition):
+        start_time = time.time()
+        with track_step('copy_partition'):
+            record_metrics(rows_in=len(partition))
+            with pooled_connection() as connection:
+                copy_dataframe_with_method(partition, table_name, connection.cursor(), method)
+                connection.commit()
+        with stats_lock:
+            stats = worker_stats.setdefault(threading.current_thread().name, {'rows': 0, 'seconds': 0.0})
+            stats['rows'] += len(partition)
+            stats['seconds'] += time.time() - start_time
+        return len(partition)
+    
+    logger.info(f"Cargando en la tabla {table_name} con {workers} conexiones en paralelo (método: {method})")
+    total_rows = 0
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='copy') as executor:
+        try:
+            for chunk in chunks:
+                if chunk is None or chunk.empty:
+                    continue
+                df_copy = prepare_dataframe_for_db(chunk, table_name, cursor)
+                if create_year_partitions(table_name, get_model_years(df_copy['model_year']), cursor):
+                    cursor.connection.commit()
+                for partition in split_dataframe(df_copy, workers):
+                    # Cada partición se mide dentro de la etapa de la carga
+                    context = contextvars.copy_context()
+                    pending.add(executor.submit(context.run, copy_partition, partition))
+                    if len(pending) >= 2 * workers:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        total_rows += sum(future.result() for future in done)
+            done, pending = wait(pending)
+            total_rows += sum(future.result() for future in done)
+        except Exception:
+            # No seguir copiando las particiones que todavía no empezaron
+            for future in pending:
+                future.cancel()
+            raise
+    
+    for worker_name, stats in sorted(worker_stats.items()):
+        rows_per_second = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else float('inf')
+        logger.info(f"Worker {worker_name}: {stats['rows']} filas en {stats['seconds']:.2f} segundos "
+                    f"({rows_per_second:,.0f} filas/s)")
+    return total_rows
+
+@profiled_step
+def map_dimension_keys(df, cursor):
+    """
+    Convierte un DataFrame al formato de la tabla de hechos del esquema 'star'. Los valores
+    nuevos de cada columna de DIMENSION_TABLES se agregan a su tabla dim_<columna>, y los
+    códigos de la categoría de pandas se traducen a las claves sustitutas con una tabla de
+    búsqueda (un valor por categoría, no por fila). El año del modelo pasa a número y las
+    columnas numéricas a enteros.
+    
+    Args:
+        df (pd.DataFrame): DataFrame con los datos procesados (se modifica)
+        cursor: Cursor de la conexión a la base de datos
+        
+    Returns:
+        pd.DataFrame: DataFrame con las columnas <columna>_id en lugar de los textos
+    """
+    for column, key_type in DIMENSION_TABLES.items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+        categories = [str(value) for value in values.cat.categories]
+        
+        # Sólo se insertan los valores que faltan, para no consumir claves de la secuencia
+        cursor.execute(f"""
+            INSERT INTO dim_{column} ({column})
+            SELECT value FROM unnest(%s::text[]) AS value
+            WHERE NOT EXISTS (SELECT 1 FROM dim_{column} d WHERE d.{column} = value)
+            ON CONFLICT ({column}) DO NOTHING
+        """, (categories,))
+        cursor.execute(f"SELECT {column}, {column}_id FROM dim_{column} WHERE {column} = ANY(%s)",
+                       (categories,))
+        key_by_value = dict(cursor.fetchall())
+        
+        # Clave de cada categoría; el código -1 (nulo) queda como NULL
+        key_dtype = 'Int32' if key_type == 'INTEGER' else 'Int16'
+        keys = pd.array([key_by_value[value] for value in categories], dtype=key_dtype)
+        df[f"{column}_id"] = keys.take(values.cat.codes.to_numpy(), allow_fill=True)
+        df = df.drop(columns=column)
     
-    finally:
-        if connection:
-            connection.close()
+    if 'model_year' in df.columns and pd.api.types.is_datetime64_any_dtype(df['model_year']):
+        df['model_year'] = df['model_year'].dt.year.astype('Int16')
+    integer_columns = {'dol_vehicle_id': 'Int64', 'postal_code': 'Int32', 'electric_range': 'Int16'}
+    for column, dtype in integer_columns.items():
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').round().astype(dtype)
+    return df
 
+@profiled_step
+def copy_dataframe(df_copy, table_name, cursor):
+    """
+    Copia un DataFrame ya preparado (ver prepare_dataframe_for_db) a la tabla usando COPY.
+    
+    Args:
+        df_copy (pd.DataFrame): DataFrame con las columnas en el orden de la tabla
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+    """
+    # Convertir DataFrame a CSV en memoria( Hago coincidir mi dataframe con la tabla para no recibir errores en copy_from)
+    buffer = StringIO()
+    df_copy.to_csv(buffer, index=False, header=False, na_rep='NULL')
+    record_metrics(bytes_written=buffer.tell())
+    buffer.seek(0) # Pongo el cursor al inicio del buffer
+    
+    # Copiar del buffer a la tabla
+    cursor.copy_from(buffer, table_name, sep=',', null='NULL', columns=df_copy.columns.tolist())
+
+def dataframe_to_csv_bytes(df):
+    """
+    Convierte un DataFrame a CSV (sin encabezado) usando el escritor de pyarrow, que es
+    mucho más rápido que DataFrame.to_csv. Las categorías se escriben como texto, las
+    fechas como YYYY-MM-DD y los nulos como campo vacío (el NULL por defecto de COPY csv).
+    
+    Args:
+        df (pd.DataFrame): DataFrame a convertir
+        
+    Returns:
+        bytes: Contenido CSV
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    columns = []
+    for column in table.columns:
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(column.type.value_type)
+        elif pa.types.is_timestamp(column.type):
+            column = column.cast(pa.date32())
+        columns.append(column)
+    
+    sink = BytesIO()
+    pa_csv.write_csv(pa.table(columns, names=table.column_names), sink,
+                     pa_csv.WriteOptions(include_header=False))
+    return sink.getvalue()
+
+class DataFrameCSVStream:
+    """
+    Objeto tipo archivo que genera el CSV de un DataFrame por lotes a medida que COPY lo lee,
+    para no tener el CSV completo en memoria. Sólo se mantiene el texto de un lote a la vez.
+    """
+    
+    def __init__(self, df, batch_size=LOAD_BATCH_SIZE):
+        self._batches = (df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size))
+        self._buffer = b''
+        self._position = 0
+        self.bytes_read = 0
+    
+    def read(self, size=-1):
+        # Generar el siguiente lote cuando se consumió el actual
+        if self._position >= len(self._buffer):
+            batch = next(self._batches, None)
+            if batch is None:
+                return b''
+            self._buffer = dataframe_to_csv_bytes(batch)
+            self._position = 0
+        
+        end = len(self._buffer) if size is None or size < 0 else self._position + size
+        data = self._buffer[self._position:end]
+        self._position += len(data)
+        self.bytes_read += len(data)
+        return data
+
+@profiled_step
+def copy_dataframe_in_batches(df_copy, table_name, cursor, batch_size=LOAD_BATCH_SIZE, freeze=False):
+    """
+    Copia un DataFrame ya preparado a la tabla con un único COPY alimentado por lotes.
+    
+    Args:
+        df_copy (pd.DataFrame): DataFrame con las columnas en el orden de la tabla
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        batch_size (int): Filas que se convierten a CSV en cada lote
+        freeze (bool): Usa COPY ... FREEZE. Sólo es válido si la tabla se creó o truncó en
+            la misma transacción, y evita que las filas se vuelvan a escribir al hacer VACUUM
+    """
+    columns = ', '.join(df_copy.columns)
+    options = "FORMAT csv" + (', FREEZE' if freeze else '')
+    copy_query = f"COPY {table_name} ({columns}) FROM STDIN WITH ({options})"
+    stream = DataFrameCSVStream(df_copy, batch_size)
+    cursor.copy_expert(copy_query, stream, size=COPY_READ_SIZE)
+    record_metrics(bytes_written=stream.bytes_read)
+
+def drop_secondary_indexes(table_name, cursor):
+    """
+    Elimina los índices secundarios de la tabla (los que no respaldan una restricción,
+    como la clave primaria) para que no se mantengan fila por fila durante la carga.
+    
+    Args:
+        table_name (str): Nombre de la tabla en la base de datos
+        cursor: Cursor de la conexión a la base de datos
+        
+    Returns:
+        list: Definiciones (nombre, sentencia CREATE INDEX) de los índices eliminados
+    """
+    cursor.execute("""
+        SELECT indexname, indexdef
+        FROM pg_indexes
+        WHERE schemaname = current_schema()
+          AND tablename = %s
+          AND indexname NOT IN (
+              SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass
+          )
+    """, (table_name, table_name))
+    # En una tabla particionada la definición dice ON ONLY, que crearía el índice sin las
+    # particiones; se quita para que al reconstruirlo se cree también en cada partición
+    index_definitions = [(index_name, index_definition.replace(' ON ONLY ', ' ON ', 1))
+                         for index_name, index_definition in cursor.fetchall()]
+    
+    for index_name, _ in index_definitions:
+        cursor.execute(f"DROP INDEX {index_name}")
+    logger.info(f"Índices eliminados durante la carga: {[name for name, _ in index_definitions]}")
+    return index_definitions
+
+@profiled_step
+def rebuild_indexes(index_definitions, cursor):
+    """
+    Vuelve a crear los índices eliminados con drop_secondary_indexes.
+    
+    Args:
+        index_definitions (list): Definiciones (nombre, sentencia CREATE INDEX)
+        cursor: Cursor de la conexión a la base de datos
+    """
+    if not index_definitions:
+        return
+    start_time = time.time()
+    # Más memoria para ordenar evita que la construcción de los índices use disco
+    cursor.execute(f"SET LOCAL maintenance_work_mem = '{INDEX_BUILD_MEMORY}'")
+    for _, index_definition in index_definitions:
+        cursor.execute(index_definition)
+    logger.info(f"Índices reconstruidos en {time.time() - start_time:.2f} segundos")
+
+def log_load_throughput(rows, elapsed):
+    """
+    Registra el tiempo de carga y el rendimiento en filas por segundo.
+    """
+    rows_per_second = rows / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Carga de {rows} filas completada en {elapsed:.2f} segundos ({rows_per_second:,.0f} filas/s)")
+
+@profiled_step
 def prepare_dataframe_for_db(df, table_name, cursor):
     """
     Prepara el DataFrame para la carga en la base de datos, asegurando
@@ -88,6 +818,10 @@ def prepare_dataframe_for_db(df, table_name, cursor):
         # Crear una copia del DataFrame para no modificar el original
         df_copy = df.copy()
         
+        # Tabla con esquema 'star': los textos se reemplazan por las claves de las dimensiones
+        if any(f"{column}_id" in db_columns for column in DIMENSION_TABLES):
+            df_copy = map_dimension_keys(df_copy, cursor)
+        
         # Solo mantener las columnas que existen en la tabla
         common_columns = [col for col in df_copy.columns if col in db_columns]
         df_copy = df_copy[common_columns]
@@ -110,23 +844,24 @@ def prepare_dataframe_for_db(df, table_name, cursor):
         logger.error(f"Error al preparar DataFrame para la base de datos: {e}")
         raise
 
-def load_data_from_file(file_path, table_name='electric_vehicles'):
+def load_data_from_file(file_path, table_name='electric_vehicles', columns=None):
     """
-    Carga datos desde un archivo CSV procesado a la base de datos.
+    Carga datos desde un archivo procesado (parquet o CSV) a la base de datos.
     
     Args:
-        file_path (str): Ruta al archivo CSV procesado
+        file_path (str): Ruta al archivo procesado
         table_name (str): Nombre de la tabla en la base de datos
+        columns (list, optional): Columnas a leer del archivo. Si es None se leen todas
         
     Returns:
         bool: True si la carga fue exitosa, False en caso contrario
     """
     try:
         logger.info(f"Leyendo datos procesados desde {file_path}")
-        df = pd.read_csv(file_path)
+        df = read_processed_data(file_path, columns=columns)
         
         if df.empty:
-            logger.warning("El archivo CSV está vacío")
+            logger.warning("El archivo procesado está vacío")
             return False
         
         logger.info(f"Archivo leído correctamente. Filas: {len(df)}")
@@ -146,7 +881,8 @@ if __name__ == "__main__":
     initialize_database()
     
     # Buscar el archivo procesado más reciente
-    processed_files = [f for f in os.listdir(PROCESSED_DATA_DIR) if f.endswith('.csv')]
+    processed_extensions = tuple(PROCESSED_FILE_EXTENSIONS.values())
+    processed_files = [f for f in os.listdir(PROCESSED_DATA_DIR) if f.endswith(processed_extensions)]
     
     if processed_files:
         # Ordenar por fecha de modificación, el más reciente primero
@@ -161,4 +897,4 @@ if __name__ == "__main__":
         else:
             logger.error("Falló la carga de datos")
     else:
-        logger.warning(f"No se encontraron archivos CSV procesados en {PROCESSED_DATA_DIR}")
+        logger.warning(f"No se encontraron archivos procesados en {PROCESSED_DATA_DIR}")
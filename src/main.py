@@ -1,16 +1,226 @@
 import os
+import io
 import time
-from config import logger
-from database import initialize_database
-from extract import extract_data
-from transform import transform_data
-from load import load_data_to_database
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import database
+import transform
+import load
+import powerbi_prep
+import analytics
+from config import (DB_CONFIG, TRANSFORM_STREAMING, TRANSFORM_CHUNK_SIZE, TRANSFORM_WORKERS, CSV_ENGINE,
+                    RAW_ARROW_CACHE, PIPELINE_OVERLAP, DOWNLOAD_CHUNK_SIZE, PROCESSED_DATA_FORMAT, PROCESSED_DATA_COMPRESSION, DB_SCHEMA_LAYOUT, DB_PARTITIONING,
+                    SAVE_FULL_PROCESSED_DATA, EXPORT_BACKEND, RUN_REPORT_FILE, logger)
+from database import initialize_database, execute_query
+from extract import extract_data, download_ev_data, validate_file, get_raw_data_hash
+from transform import (transform_data, transform_data_in_chunks, read_processed_data, get_processed_file_path,
+                       export_full_data)
+from load import load_data_to_database, load_chunks_to_database
 from powerbi_prep import save_query_results
+from cache import compute_stage_key, get_cached_stage, save_stage
+from pipelining import ByteStreamQueue, iterate_in_background
+from profiling import reported_run, set_profile_stage
 
-def run_pipeline():
+# Los modos por bloques y superpuesto generan los datos procesados con la transformación por bloques
+CHUNKED_TRANSFORM = TRANSFORM_STREAMING or PIPELINE_OVERLAP
+
+def get_stage_keys(raw_data_hash):
+    """
+    Calcula las claves de caché de las etapas de transformación, carga y exportación.
+    Cada etapa depende de la clave de la anterior, así que un cambio en los datos crudos
+    o en el código de una etapa invalida también las etapas siguientes.
+    
+    Args:
+        raw_data_hash (str): Hash del contenido del archivo de datos crudos
+        
+    Returns:
+        dict: Clave de cada etapa
+    """
+    # Los parámetros de lectura y de paralelismo no cambian el resultado, pero sí el código
+    # que lo genera, así que también forman parte de la clave
+    transform_key = compute_stage_key('transform_data', raw_data_hash, [transform], {
+        'streaming': CHUNKED_TRANSFORM,
+        'chunk_size': TRANSFORM_CHUNK_SIZE if CHUNKED_TRANSFORM else None,
+        'workers': None if CHUNKED_TRANSFORM else TRANSFORM_WORKERS,
+        'raw_arrow_cache': None if CHUNKED_TRANSFORM else RAW_ARROW_CACHE,
+        'csv_engine': CSV_ENGINE,
+        'format': PROCESSED_DATA_FORMAT,
+        'compression': PROCESSED_DATA_COMPRESSION,
+    })
+    # La carga depende también de la base de datos de destino y del esquema de la tabla
+    load_key = compute_stage_key('load_data_to_database', transform_key, [load, database], {
+        'host': DB_CONFIG['host'],
+        'port': DB_CONFIG['port'],
+        'database': DB_CONFIG['database'],
+        'layout': DB_SCHEMA_LAYOUT,
+        'partitioning': DB_PARTITIONING,
+    })
+    export_key = compute_stage_key('save_query_results', load_key, [powerbi_prep, analytics], {
+        'backend': EXPORT_BACKEND,
+    })
+    return {
+        'transform_data': transform_key,
+        'load_data_to_database': load_key,
+        'save_query_results': export_key,
+    }
+
+def run_full_export_stage(raw_file_path, raw_data_hash, force=False):
+    """
+    Genera la versión completa de los datos (ver transform.export_full_data), salvo que
+    ya se haya generado para el mismo CSV crudo y la misma configuración.
+    
+    Args:
+        raw_file_path (str): Ruta al archivo de datos crudos
+        raw_data_hash (str): Hash del contenido del archivo de datos crudos
+        force (bool): Si es True, se genera sin consultar la caché
+        
+    Returns:
+        str: Ruta al archivo generado, None si hubo un error
+    """
+    stage_key = compute_stage_key('export_full_data', raw_data_hash, [transform], {
+        'format': PROCESSED_DATA_FORMAT,
+        'compression': PROCESSED_DATA_COMPRESSION,
+    })
+    cached = None if force else get_cached_stage('export_full_data', stage_key)
+    if cached:
+        logger.info("Versión completa de los datos omitida, los datos crudos no cambiaron")
+        return cached['full_file_path']
+    
+    full_file_path = export_full_data(raw_file_path)
+    if full_file_path:
+        save_stage('export_full_data', stage_key, {'full_file_path': full_file_path}, [full_file_path])
+    return full_file_path
+
+def save_chunked_stages(stage_keys, rows_loaded):
+    """
+    Registra en caché la transformación y la carga hechas juntas por bloques.
+    
+    Args:
+        stage_keys (dict): Clave de cada etapa (ver get_stage_keys)
+        rows_loaded (int): Filas cargadas
+        
+    Returns:
+        tuple: (salidas de la transformación, salidas de la carga)
+    """
+    processed_file_path, _ = get_processed_file_path('processed_ev_data')
+    transform_outputs = {'processed_file_path': processed_file_path, 'rows': rows_loaded, 'columns': None}
+    load_outputs = {'rows': rows_loaded}
+    save_stage('transform_data', stage_keys['transform_data'], transform_outputs, [processed_file_path])
+    save_stage('load_data_to_database', stage_keys['load_data_to_database'], load_outputs)
+    return transform_outputs, load_outputs
+
+def download_to_stream(stream):
+    """
+    Descarga los datos enviando los bytes al flujo, y le avisa al lector cuando termina.
+    
+    Args:
+        stream (ByteStreamQueue): Flujo que lee la transformación
+        
+    Returns:
+        str: Ruta al archivo de datos crudos
+    """
+    try:
+        file_path = download_ev_data(sink=stream)
+    except Exception as e:
+        stream.fail(e)
+        raise
+    stream.finish(file_path)
+    return file_path
+
+def run_overlapped_stages():
+    """
+    Descarga, transforma y carga los datos a la vez (modo PIPELINE_OVERLAP). La descarga
+    corre en un hilo y envía los bytes a un flujo acotado, la transformación por bloques
+    lee ese flujo en otro hilo y la carga consume los bloques transformados en este. Cada
+    etapa sólo espera a la anterior cuando su cola está vacía, así que el tiempo total se
+    acerca al de la etapa más lenta en lugar de a la suma de las tres.
+    
+    Si el servidor no envía un archivo completo nuevo (no cambió, se continuó una descarga
+    parcial o EXTRACT_REFRESH está desactivado), no se transforma ni se carga nada y el
+    pipeline sigue con el flujo normal sobre el archivo en disco.
+    
+    Returns:
+        tuple: (ruta al archivo de datos crudos, None si algo falló;
+                filas cargadas, None si no se recibieron datos nuevos)
+    """
+    stream = ByteStreamQueue(name='download_ev_data')
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='download') as executor:
+        download = executor.submit(contextvars.copy_context().run, download_to_stream, stream)
+        try:
+            source = stream.wait_for_source()
+        except Exception as e:
+            logger.error(f"Error en el proceso de extracción: {e}")
+            return None, None
+        
+        if source is not stream:
+            if not validate_file(source):
+                logger.error("Falló la validación del archivo descargado")
+                return None, None
+            return source, None
+        
+        logger.info("Transformando y cargando los datos a medida que se descargan")
+        reader = io.BufferedReader(stream, DOWNLOAD_CHUNK_SIZE)
+        chunks = iterate_in_background(transform_data_in_chunks(reader), name='transform_data_in_chunks')
+        try:
+            rows_loaded = load_chunks_to_database(chunks)
+        finally:
+            # Detiene la transformación y la descarga si la carga terminó antes
+            chunks.close()
+            stream.close()
+        
+        try:
+            raw_file_path = download.result()
+        except Exception as e:
+            logger.error(f"Error en el proceso de extracción: {e}")
+            return None, None
+    
+    if not rows_loaded or not validate_file(raw_file_path):
+        return None, None
+    return raw_file_path, rows_loaded
+
+def is_table_loaded(expected_rows, table_name='electric_vehicles'):
+    """
+    Verifica que la tabla de la última carga registrada en caché siga existiendo y tenga
+    datos (por ejemplo, que la base no se haya recreado). Sólo lee la primera fila, así que
+    no depende del tamaño de la tabla.
+    """
+    if not expected_rows:
+        return False
+    result = execute_query(f"SELECT EXISTS (SELECT 1 FROM {table_name})")
+    return result is not None and result['data'][0][0]
+
+@reported_run
+def run_full_export(force=False):
+    """
+    Genera sólo la versión completa de los datos, sin transformar, cargar ni exportar,
+    para poder programarla por separado del pipeline.
+    
+    Args:
+        force (bool): Si es True, se genera aunque los datos crudos no hayan cambiado
+    
+    Returns:
+        bool: True si se generó correctamente, False en caso contrario
+    """
+    raw_file_path = extract_data()
+    if not raw_file_path:
+        logger.error("Fallo en la extracción de datos. No se generó la versión completa.")
+        return False
+    return run_full_export_stage(raw_file_path, get_raw_data_hash(raw_file_path), force) is not None
+
+@reported_run
+def run_pipeline(force=False, full_export=SAVE_FULL_PROCESSED_DATA):
     """
     Ejecuta el pipeline completo de ETL para datos de vehículos eléctricos.
     
+    Las etapas de transformación, carga y exportación se omiten si sus entradas y su
+    código no cambiaron desde la última ejecución (ver cache.py). Las métricas de cada
+    etapa se guardan en RUN_REPORT_FILE (ver profiling.py).
+    
+    Args:
+        force (bool): Si es True, se ejecutan todas las etapas sin consultar la caché
+        full_export (bool): Si es True, al final se genera también la versión completa de los datos
+    
     Returns:
         bool: True si el pipeline se ejecutó correctamente, False en caso contrario
     """
@@ -18,36 +228,104 @@ def run_pipeline():
     logger.info("Iniciando pipeline de análisis de vehículos eléctricos")
     
     try:
-        # Paso 1: Inicializar la base de datos
-        logger.info("Paso 1/5: Inicializando base de datos")
-        initialize_database()
+        # Paso 1: Inicializar la base de datos. En el modo superpuesto la carga puede empezar
+        # durante la descarga; en los demás se inicializa recién si hay que cargar datos
+        if PIPELINE_OVERLAP:
+            logger.info("Paso 1/5: Inicializando base de datos")
+            initialize_database()
         
-        # Paso 2: Extraer datos
-        logger.info("Paso 2/5: Extrayendo datos")
-        raw_file_path = extract_data()
+        # Paso 2: Extraer datos (en el modo superpuesto, también se transforman y se cargan
+        # mientras se descargan si el servidor envía un archivo nuevo)
+        rows_loaded = None
+        if PIPELINE_OVERLAP:
+            logger.info("Pasos 2-4/5: Extrayendo, transformando y cargando datos a la vez")
+            raw_file_path, rows_loaded = run_overlapped_stages()
+        else:
+            logger.info("Paso 2/5: Extrayendo datos")
+            raw_file_path = extract_data()
         if not raw_file_path:
             logger.error("Fallo en la extracción de datos. Deteniendo el pipeline.")
             return False
         
-        # Paso 3: Transformar datos
-        logger.info("Paso 3/5: Transformando datos")
-        df, processed_file_path = transform_data(raw_file_path)
-        if df is None or processed_file_path is None:
-            logger.error("Fallo en la transformación de datos. Deteniendo el pipeline.")
-            return False
+        # Consultar la caché de cada etapa
+        raw_data_hash = get_raw_data_hash(raw_file_path)
+        stage_keys = get_stage_keys(raw_data_hash)
+        cached = {stage: None if force else get_cached_stage(stage, key) for stage, key in stage_keys.items()}
+        if rows_loaded:
+            cached['transform_data'], cached['load_data_to_database'] = save_chunked_stages(stage_keys, rows_loaded)
+        elif cached['load_data_to_database'] and not is_table_loaded(cached['load_data_to_database']['rows']):
+            logger.info("La tabla de la última carga registrada no existe o está vacía. Se vuelve a cargar.")
+            cached['load_data_to_database'] = None
+            cached['save_query_results'] = None
         
-        # Paso 4: Cargar datos a la base de datos
-        logger.info("Paso 4/5: Cargando datos en la base de datos")
-        load_success = load_data_to_database(df)
-        if not load_success:
-            logger.error("Fallo en la carga de datos. Deteniendo el pipeline.")
-            return False
+        transform_outputs = cached['transform_data']
+        load_outputs = cached['load_data_to_database']
+        
+        needs_load = not load_outputs or (CHUNKED_TRANSFORM and not transform_outputs)
+        if needs_load and not PIPELINE_OVERLAP:
+            logger.info("Paso 1/5: Inicializando base de datos")
+            initialize_database()
+        
+        if CHUNKED_TRANSFORM and not (transform_outputs and load_outputs):
+            # Pasos 3 y 4 por bloques: cada bloque transformado se carga directamente
+            logger.info("Pasos 3-4/5: Transformando y cargando datos por bloques")
+            rows_loaded = load_chunks_to_database(transform_data_in_chunks(raw_file_path))
+            if not rows_loaded:
+                logger.error("Fallo en la transformación o carga de datos. Deteniendo el pipeline.")
+                return False
+            transform_outputs, load_outputs = save_chunked_stages(stage_keys, rows_loaded)
+        else:
+            df = None
+            # Paso 3: Transformar datos
+            if transform_outputs:
+                logger.info("Paso 3/5: Transformación omitida, los datos crudos no cambiaron")
+            else:
+                logger.info("Paso 3/5: Transformando datos")
+                df, processed_file_path = transform_data(raw_file_path)
+                if df is None or processed_file_path is None:
+                    logger.error("Fallo en la transformación de datos. Deteniendo el pipeline.")
+                    return False
+                transform_outputs = {'processed_file_path': processed_file_path,
+                                     'rows': len(df), 'columns': len(df.columns)}
+                save_stage('transform_data', stage_keys['transform_data'], transform_outputs, [processed_file_path])
+            
+            # Paso 4: Cargar datos a la base de datos
+            if load_outputs:
+                logger.info("Paso 4/5: Carga omitida, los datos procesados no cambiaron")
+            else:
+                logger.info("Paso 4/5: Cargando datos en la base de datos")
+                if df is None:
+                    df = read_processed_data(transform_outputs['processed_file_path'])
+                load_success = load_data_to_database(df)
+                if not load_success:
+                    logger.error("Fallo en la carga de datos. Deteniendo el pipeline.")
+                    return False
+                load_outputs = {'rows': len(df)}
+                save_stage('load_data_to_database', stage_keys['load_data_to_database'], load_outputs)
+        
+        processed_summary = f"{transform_outputs['rows']} filas"
+        if transform_outputs.get('columns'):
+            processed_summary += f", {transform_outputs['columns']} columnas"
         
         # Paso 5: Preparar datos para Power BI
-        logger.info("Paso 5/5: Preparando datos para Power BI")
-        query_results = save_query_results()
-        if not query_results:
-            logger.warning("No se generaron todos los resultados para Power BI")
+        query_results = cached['save_query_results']
+        if query_results:
+            logger.info("Paso 5/5: Exportación para Power BI omitida, los datos cargados no cambiaron")
+        else:
+            logger.info("Paso 5/5: Preparando datos para Power BI")
+            query_results = save_query_results()
+            if not query_results or 'errors' in query_results:
+                logger.warning("No se generaron todos los resultados para Power BI")
+            elif set(query_results) == set(powerbi_prep.EXPORT_NAMES):
+                # Sólo se guarda en caché una exportación completa
+                save_stage('save_query_results', stage_keys['save_query_results'], query_results,
+                           list(query_results.values()))
+        
+        # Versión completa de los datos, sólo si se pidió
+        if full_export:
+            logger.info("Generando la versión completa de los datos")
+            if not run_full_export_stage(raw_file_path, raw_data_hash, force):
+                logger.warning("No se generó la versión completa de los datos")
         
         # Pipeline completado
         execution_time = time.time() - start_time
@@ -58,10 +336,11 @@ def run_pipeline():
         print("RESUMEN DEL PIPELINE")
         print("="*50)
         print(f"1. Datos extraídos: {os.path.basename(raw_file_path)}")
-        print(f"2. Datos procesados: {len(df)} filas, {len(df.columns)} columnas")
+        print(f"2. Datos procesados: {processed_summary}")
         print(f"3. Datos cargados en la base de datos: Éxito")
-        print(f"4. Consultas generadas para Power BI: {len(query_results)}")
+        print(f"4. Consultas generadas para Power BI: {len(query_results) - ('errors' in query_results)}")
         print(f"Tiempo total de ejecución: {execution_time:.2f} segundos")
+        print(f"Métricas por etapa: {RUN_REPORT_FILE}")
         print("="*50)
         print("\nAhora puedes usar Power BI para conectarte a la base de datos")
         print("o importar los archivos CSV generados en el directorio 'data/processed/power_bi'")
@@ -76,4 +355,17 @@ def run_pipeline():
         return False
 
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Pipeline ETL de datos de vehículos eléctricos")
+    parser.add_argument('--force', action='store_true',
+                        help="Ejecuta todas las etapas aunque sus entradas no hayan cambiado")
+    parser.add_argument('--full-export', action='store_true',
+                        help="Genera sólo la versión completa de los datos (todas las columnas del CSV crudo)")
+    parser.add_argument('--profile', metavar='ETAPA',
+                        help="Perfila la etapa indicada con cProfile y tracemalloc (por ejemplo apply_column_specs)")
+    args = parser.parse_args()
+    if args.profile:
+        set_profile_stage(args.profile)
+    if args.full_export:
+        run_full_export(force=args.force)
+    else:
+        run_pipeline(force=args.force)
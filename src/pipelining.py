@@ -0,0 +1,223 @@
+import io
+import queue
+import threading
+import contextvars
+from profiling import track_step
+from config import PIPELINE_QUEUE_SIZE, logger
+
+# Intervalo en segundos con el que un productor bloqueado revisa si el consumidor abandonó la cola
+PUT_POLL_INTERVAL = 0.1
+
+# Marca de fin de los datos en las colas
+_END = object()
+
+class _Failure:
+    """
+    Error del productor, que se entrega al consumidor en lugar del siguiente elemento.
+    """
+    def __init__(self, error):
+        self.error = error
+
+def put_until_stopped(items, item, stopped):
+    """
+    Agrega un elemento a una cola acotada, esperando mientras esté llena (contrapresión)
+    salvo que el consumidor haya dejado de leer.
+    
+    Args:
+        items (queue.Queue): Cola acotada
+        item: Elemento a agregar
+        stopped (threading.Event): Se activa cuando el consumidor deja de leer
+    
+    Returns:
+        bool: True si se agregó, False si el consumidor dejó de leer
+    """
+    while not stopped.is_set():
+        try:
+            items.put(item, timeout=PUT_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def iterate_in_background(iterable, max_pending=PIPELINE_QUEUE_SIZE, name='producer'):
+    """
+    Recorre un iterable en un hilo aparte y entrega sus elementos a través de una cola
+    acotada, de modo que el productor (por ejemplo la transformación por bloques) avanza
+    mientras el consumidor (la carga) procesa el elemento anterior. Si la cola se llena
+    el productor espera, así que la memoria queda acotada a max_pending elementos.
+    
+    El productor empieza en cuanto se llama a la función y se mide como la etapa name.
+    Sus errores se relanzan en el consumidor. Si el consumidor deja de iterar (o cierra
+    el generador devuelto), el productor se detiene en el siguiente elemento y se cierra
+    el iterable.
+    
+    Args:
+        iterable (iterable): Elementos a producir
+        max_pending (int): Elementos producidos que pueden esperar en la cola
+        name (str): Nombre del hilo productor y de su etapa en el reporte
+    
+    Returns:
+        generator: Elementos del iterable, en el mismo orden
+    """
+    items = queue.Queue(maxsize=max(max_pending, 1))
+    stopped = threading.Event()
+    
+    def produce():
+        iterator = iter(iterable)
+        try:
+            with track_step(name):
+                for item in iterator:
+                    if not put_until_stopped(items, item, stopped):
+                        return
+            put_until_stopped(items, _END, stopped)
+        except BaseException as e:
+            put_until_stopped(items, _Failure(e), stopped)
+        finally:
+            # Libera los recursos del generador (por ejemplo archivos temporales) si no terminó
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+    
+    # El hilo hereda el contexto de las métricas para registrar sus etapas en el reporte
+    context = contextvars.copy_context()
+    producer = threading.Thread(target=context.run, args=(produce,), name=name, daemon=True)
+    producer.start()
+    return _consume(items, stopped, producer)
+
+def _consume(items, stopped, producer):
+    """
+    Entrega los elementos que produce iterate_in_background y detiene al productor al terminar.
+    """
+    try:
+        while True:
+            item = items.get()
+            if item is _END:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+class ByteStreamQueue(io.RawIOBase):
+    """
+    Flujo de bytes entre un hilo que escribe (la descarga) y uno que lee (el lector de CSV),
+    con una cola acotada de max_blocks bloques: si el lector se atrasa, la escritura espera.
+    
+    El escritor llama a begin() cuando empieza a enviar el contenido completo del archivo y
+    a finish() o fail() al terminar. Si termina sin haber llamado a begin() (el archivo no
+    cambió o se completó una descarga parcial), el lector debe usar el archivo en disco
+    (ver wait_for_source).
+    """
+    def __init__(self, max_blocks=PIPELINE_QUEUE_SIZE, name='stream'):
+        super().__init__()
+        self.name = name
+        self.file_path = None
+        self.error = None
+        self._blocks = queue.Queue(maxsize=max(max_blocks, 1))
+        self._current = memoryview(b'')
+        self._ended = False
+        self._started = threading.Event()
+        self._source_ready = threading.Event()
+        self._stopped = threading.Event()
+    
+    @property
+    def started(self):
+        """
+        True si el escritor empezó a enviar el contenido por el flujo.
+        """
+        return self._started.is_set()
+    
+    def readable(self):
+        return True
+    
+    def begin(self):
+        """
+        Indica que el contenido completo se va a enviar por el flujo.
+        """
+        self._started.set()
+        self._source_ready.set()
+    
+    def write(self, data):
+        """
+        Agrega un bloque de bytes, esperando si la cola está llena.
+        
+        Args:
+            data (bytes): Bloque de bytes
+        
+        Returns:
+            int: Bytes agregados
+        """
+        if not put_until_stopped(self._blocks, bytes(data), self._stopped):
+            raise IOError("El lector del flujo de datos dejó de leer")
+        return len(data)
+    
+    def finish(self, file_path):
+        """
+        Indica que el escritor terminó correctamente.
+        
+        Args:
+            file_path (str): Ruta al archivo escrito en disco
+        """
+        self.file_path = file_path
+        if self.started:
+            put_until_stopped(self._blocks, _END, self._stopped)
+        self._source_ready.set()
+    
+    def fail(self, error):
+        """
+        Indica que el escritor falló; el lector recibe el error.
+        
+        Args:
+            error (Exception): Error del escritor
+        """
+        self.error = error
+        if self.started:
+            put_until_stopped(self._blocks, _END, self._stopped)
+        self._source_ready.set()
+    
+    def wait_for_source(self):
+        """
+        Espera a saber de dónde leer el contenido.
+        
+        Returns:
+            ByteStreamQueue o str: El propio flujo si el contenido se envía por él, o la ruta
+            al archivo en disco si el escritor terminó sin enviarlo
+        """
+        self._source_ready.wait()
+        if self.started:
+            return self
+        if self.error is not None:
+            raise self.error
+        return self.file_path
+    
+    def readinto(self, buffer):
+        """
+        Copia en buffer los siguientes bytes del flujo, esperando al escritor si hace falta.
+        
+        Returns:
+            int: Bytes copiados, 0 al final del flujo
+        """
+        while not self._current and not self._ended:
+            block = self._blocks.get()
+            if block is _END:
+                self._ended = True
+            else:
+                self._current = memoryview(block)
+        if self._ended and self.error is not None:
+            raise IOError(f"La descarga falló: {self.error}")
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+    
+    def close(self):
+        """
+        Deja de leer el flujo: si el escritor sigue enviando bytes, recibe un error.
+        """
+        if not self._stopped.is_set():
+            self._stopped.set()
+            if self.started and not self._ended:
+                logger.warning(f"Se dejó de leer {self.name} antes de terminar")
+        super().close()
@@ -1,28 +1,38 @@
 import pandas as pd
 import psycopg2
-from database import get_connection
-from config import PROCESSED_DATA_DIR, logger
+from psycopg2 import sql
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+import analytics
+from database import pooled_connection
+from profiling import profiled_step, track_step, record_metrics
+from config import PROCESSED_DATA_DIR, EXPORT_MAX_WORKERS, EXPORT_QUERY_TIMEOUT, EXPORT_BACKEND, logger
 import os
+import time
 
-def execute_query(query):
+@profiled_step
+def execute_query(query, timeout=EXPORT_QUERY_TIMEOUT):
     """
     Ejecuta una consulta SQL y devuelve los resultados como DataFrame.
     
     Args:
         query (str): Consulta SQL a ejecutar
+        timeout (int): Tiempo máximo de la consulta en segundos (0 para no limitarla)
         
     Returns:
         pd.DataFrame: DataFrame con los resultados de la consulta
     """
-    connection = None
     try:
-        connection = get_connection()
-        logger.info("Ejecutando consulta SQL")
-        
-        # Ejecutar consulta y devolver como DataFrame
-        df = pd.read_sql_query(query, connection)
-        logger.info(f"Consulta ejecutada con éxito. Filas obtenidas: {len(df)}")
-        return df
+        with pooled_connection() as connection:
+            logger.info("Ejecutando consulta SQL")
+            if timeout:
+                # Límite sólo para esta transacción; se descarta al devolver la conexión
+                connection.cursor().execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            
+            # Ejecutar consulta y devolver como DataFrame
+            df = pd.read_sql_query(query, connection)
+            logger.info(f"Consulta ejecutada con éxito. Filas obtenidas: {len(df)}")
+            return df
     
     except psycopg2.Error as e:
         logger.error(f"Error al ejecutar consulta: {e}")
@@ -31,63 +41,128 @@ def execute_query(query):
     except Exception as e:
         logger.error(f"Error inesperado al ejecutar consulta: {e}")
         return None
+
+@profiled_step
+def copy_query_to_csv(query, file_path, timeout=EXPORT_QUERY_TIMEOUT):
+    """
+    Ejecuta una consulta con COPY (consulta) TO STDOUT y escribe el CSV que genera
+    PostgreSQL directamente en el archivo, sin armar un DataFrame: las filas no se
+    convierten a objetos de Python y se escriben a medida que llegan, así que la memoria
+    no depende del tamaño del resultado (sirve también para extractos de millones de filas,
+    como uno por vehículo).
+    
+    Args:
+        query (str): Consulta SQL a ejecutar (una sola sentencia SELECT)
+        file_path (str): Archivo CSV de salida, con encabezado
+        timeout (int): Tiempo máximo de la consulta en segundos (0 para no limitarla)
+        
+    Returns:
+        int: Filas escritas, None si hubo un error
+    """
+    temp_path = f"{file_path}.tmp"
+    try:
+        with pooled_connection() as connection:
+            logger.info("Ejecutando consulta SQL con COPY")
+            cursor = connection.cursor()
+            if timeout:
+                cursor.execute("SET LOCAL statement_timeout = %s", (int(timeout * 1000),))
+            
+            copy_query = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER)").format(
+                sql.SQL(query.strip().rstrip(';')))
+            with open(temp_path, 'wb') as f:
+                cursor.copy_expert(copy_query, f)
+            rows = cursor.rowcount
+        
+        # El archivo sólo reemplaza al anterior si la consulta terminó
+        os.replace(temp_path, file_path)
+        record_metrics(rows_out=rows, bytes_written=os.path.getsize(file_path))
+        logger.info(f"Consulta ejecutada con éxito. Filas escritas: {rows}")
+        return rows
+    
+    except (psycopg2.Error, IOError) as e:
+        logger.error(f"Error al exportar consulta con COPY: {e}")
+        return None
     
     finally:
-        if connection:
-            connection.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
-def get_vehicles_by_year():
+def run_export_query(query, output_file=None):
+    """
+    Ejecuta una consulta de exportación: devuelve el resultado como DataFrame o, si se
+    indica output_file, lo escribe directamente en el archivo con copy_query_to_csv.
+    
+    Args:
+        query (str): Consulta SQL a ejecutar
+        output_file (str, optional): Archivo CSV de salida
+        
+    Returns:
+        pd.DataFrame o int: Resultado de la consulta, o filas escritas si se indicó
+            output_file; None si hubo un error
+    """
+    if output_file is None:
+        return execute_query(query)
+    return copy_query_to_csv(query, output_file)
+
+def get_vehicles_by_year(output_file=None):
     """
     Obtiene el conteo de vehículos eléctricos registrados por año.
     
+    Args:
+        output_file (str, optional): Si se indica, el resultado se escribe en este CSV con COPY
+    
     Returns:
         pd.DataFrame: DataFrame con el conteo por año
+            (o filas escritas, si se indica output_file)
     """
+    # Se lee de la vista materializada mv_ev_by_year (ver database.SUMMARY_VIEWS)
     query = """
     SELECT 
-        EXTRACT(YEAR FROM model_year)::INT AS registration_year,
-        COUNT(*) AS vehicle_count
+        registration_year,
+        vehicle_count
     FROM 
-        electric_vehicles
-    WHERE 
-        model_year IS NOT NULL
-    GROUP BY 
-        registration_year
+        mv_ev_by_year
     ORDER BY 
         registration_year;
     """
     logger.info("Consultando vehículos por año")
-    return execute_query(query)
+    return run_export_query(query, output_file)
 
-def get_top_models():
+def get_top_models(output_file=None):
     """
     Obtiene los 10 modelos de vehículos eléctricos más registrados.
     
+    Args:
+        output_file (str, optional): Si se indica, el resultado se escribe en este CSV con COPY
+    
     Returns:
         pd.DataFrame: DataFrame con los 10 modelos principales
+            (o filas escritas, si se indica output_file)
     """
     query = """
     SELECT 
         make, 
         model, 
-        COUNT(*) AS registration_count
+        registration_count
     FROM 
-        electric_vehicles
-    GROUP BY 
-        make, model
+        mv_ev_by_make_model
     ORDER BY 
-        registration_count DESC
+        registration_count DESC, make COLLATE "C", model COLLATE "C"
     LIMIT 10;
     """
     logger.info("Consultando top 10 modelos")
-    return execute_query(query)
+    return run_export_query(query, output_file)
 
-def get_cafv_by_location():
+def get_cafv_by_location(output_file=None):
     """
     Obtiene la concentración geográfica de vehículos elegibles para CAFV.
     
+    Args:
+        output_file (str, optional): Si se indica, el resultado se escribe en este CSV con COPY
+    
     Returns:
         pd.DataFrame: DataFrame con conteo por ubicación
+            (o filas escritas, si se indica output_file)
     """
     query = """
     SELECT 
@@ -95,40 +170,31 @@ def get_cafv_by_location():
         county, 
         city, 
         cafv_eligibility,
-        COUNT(*) AS vehicle_count
+        vehicle_count
     FROM 
-        electric_vehicles
+        mv_ev_cafv_by_location
     WHERE 
         cafv_eligibility = 'Clean Alternative Fuel Vehicle Eligible'
-    GROUP BY 
-        county, city, cafv_eligibility
     ORDER BY 
-        vehicle_count DESC;
+        vehicle_count DESC, county COLLATE "C", city COLLATE "C";
     """
     logger.info("Consultando concentración geográfica de vehículos CAFV")
-    return execute_query(query)
+    return run_export_query(query, output_file)
 
-def get_yoy_change():
+def get_yoy_change(output_file=None):
     """
     Obtiene el cambio año tras año en los registros de vehículos eléctricos por condado.
     
+    Args:
+        output_file (str, optional): Si se indica, el resultado se escribe en este CSV con COPY
+    
     Returns:
         pd.DataFrame: DataFrame con cambio interanual por condado
+            (o filas escritas, si se indica output_file)
     """
+    # mv_ev_by_county_year ya tiene los registros por condado y año
     query = """
-    WITH yearly_registrations AS (
-        SELECT 
-            county,
-            EXTRACT(YEAR FROM model_year)::INT AS year,
-            COUNT(*) AS registration_count
-        FROM 
-            electric_vehicles
-        WHERE 
-            model_year IS NOT NULL
-        GROUP BY 
-            county, year
-    ),
-    yearly_changes AS (
+    WITH yearly_changes AS (
         SELECT 
             yr1.county,
             yr1.year,
@@ -140,9 +206,9 @@ def get_yoy_change():
                 ELSE ROUND(((yr1.registration_count - yr2.registration_count)::numeric / yr2.registration_count) * 100, 2)
             END AS percentage_change
         FROM 
-            yearly_registrations yr1
+            mv_ev_by_county_year yr1
         LEFT JOIN 
-            yearly_registrations yr2 
+            mv_ev_by_county_year yr2 
         ON 
             yr1.county = yr2.county AND yr1.year = yr2.year + 1
     )
@@ -156,64 +222,131 @@ def get_yoy_change():
     FROM 
         yearly_changes
     ORDER BY 
-        county, year;
+        county COLLATE "C", year;
     """
     logger.info("Consultando cambio interanual por condado")
-    return execute_query(query)
+    return run_export_query(query, output_file)
+
+# Resultados que genera save_query_results y la función que obtiene cada uno
+EXPORT_QUERIES = {
+    'vehicles_by_year': get_vehicles_by_year,
+    'top_models': get_top_models,
+    'cafv_by_location': get_cafv_by_location,
+    'yoy_change': get_yoy_change,
+}
+EXPORT_NAMES = list(EXPORT_QUERIES)
+
+def export_query_result(name, output_dir, data=None, backend=EXPORT_BACKEND):
+    """
+    Ejecuta una de las consultas de EXPORT_QUERIES y guarda el resultado en un archivo CSV.
+    
+    Args:
+        name (str): Nombre del resultado (clave de EXPORT_QUERIES)
+        output_dir (str): Directorio de salida
+        data (pd.DataFrame, optional): Dataset procesado. Si se indica, el resultado se
+            calcula con analytics.EXPORT_FUNCTIONS en lugar de consultar la base de datos
+        backend (str): Con 'copy', PostgreSQL escribe el CSV con COPY sin pasar por un DataFrame
+        
+    Returns:
+        str: Ruta al archivo guardado
+    """
+    start_time = time.time()
+    file_path = os.path.join(output_dir, f'{name}.csv')
+    # Cada consulta se registra como una etapa propia en el reporte de la ejecución
+    with track_step(name):
+        if data is None and backend == 'copy':
+            # copy_query_to_csv registra las filas y los bytes escritos
+            result = EXPORT_QUERIES[name](output_file=file_path)
+        elif data is None:
+            result = EXPORT_QUERIES[name]()
+        else:
+            result = analytics.EXPORT_FUNCTIONS[name](data)
+        if result is None:
+            raise RuntimeError(f"La consulta {name} no devolvió resultados (ver el detalle en el log)")
+        
+        if isinstance(result, pd.DataFrame):
+            result.to_csv(file_path, index=False)
+            record_metrics(rows_out=len(result), bytes_written=os.path.getsize(file_path))
+    logger.info(f"Resultados guardados en {file_path} ({time.time() - start_time:.2f} segundos)")
+    return file_path
 
-def save_query_results():
+@profiled_step
+def save_query_results(max_workers=EXPORT_MAX_WORKERS, query_timeout=EXPORT_QUERY_TIMEOUT,
+                       backend=EXPORT_BACKEND):
     """
-    Ejecuta todas las consultas y guarda los resultados en archivos CSV.
+    Ejecuta todas las consultas y guarda los resultados en archivos CSV. Las consultas se
+    ejecutan en paralelo, cada una con su propia conexión del pool, así que el tiempo total
+    se acerca al de la consulta más lenta. Un error en una consulta no afecta a las demás.
+    
+    En la base de datos cada consulta se limita con statement_timeout. Además, la función
+    devuelve a más tardar 2 * query_timeout segundos después de empezar, con un error por
+    cada consulta sin terminar, aunque el cálculo siga en su hilo (con backend='pandas' no
+    se puede interrumpir).
+    
+    Con backend='pandas' los resultados se calculan en el proceso sobre el dataset
+    procesado (ver analytics.py), que se lee una sola vez, sin consultar la base de datos.
+    Con backend='copy' cada consulta se exporta con COPY ... TO STDOUT directamente al
+    archivo (ver copy_query_to_csv), sin convertir las filas a un DataFrame.
+    
+    Args:
+        max_workers (int): Cantidad máxima de consultas simultáneas
+        query_timeout (int): Tiempo máximo de cada consulta en segundos (0 para no limitarla)
+        backend (str): 'postgres', 'pandas' o 'copy'
     
     Returns:
-        dict: Diccionario con rutas a los archivos guardados
+        dict: Diccionario con rutas a los archivos guardados. Si alguna consulta falló, la
+            clave 'errors' contiene el mensaje de error de cada una
     """
     # Asegurarse que el directorio existe
     output_dir = os.path.join(PROCESSED_DATA_DIR, 'power_bi')
     os.makedirs(output_dir, exist_ok=True)
     
     results = {}
+    errors = {}
+    start_time = time.time()
     
-    # Ejecutar y guardar cada consulta
+    data = None
+    if backend == 'pandas':
+        try:
+            data = analytics.load_analytics_data()
+        except Exception as e:
+            logger.error(f"Error al leer los datos procesados para las exportaciones: {e}")
+            return {'errors': {name: str(e) for name in EXPORT_QUERIES}}
+    
+    # Ejecutar y guardar cada consulta en paralelo
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='powerbi_export')
     try:
-        # Vehículos por año
-        df_by_year = get_vehicles_by_year()
-        if df_by_year is not None:
-            file_path = os.path.join(output_dir, 'vehicles_by_year.csv')
-            df_by_year.to_csv(file_path, index=False)
-            results['vehicles_by_year'] = file_path
-            logger.info(f"Resultados guardados en {file_path}")
-        
-        # Top 10 modelos
-        df_top_models = get_top_models()
-        if df_top_models is not None:
-            file_path = os.path.join(output_dir, 'top_models.csv')
-            df_top_models.to_csv(file_path, index=False)
-            results['top_models'] = file_path
-            logger.info(f"Resultados guardados en {file_path}")
-        
-        # Concentración CAFV
-        df_cafv = get_cafv_by_location()
-        if df_cafv is not None:
-            file_path = os.path.join(output_dir, 'cafv_by_location.csv')
-            df_cafv.to_csv(file_path, index=False)
-            results['cafv_by_location'] = file_path
-            logger.info(f"Resultados guardados en {file_path}")
+        # Cada tarea corre en una copia del contexto actual para que sus métricas queden
+        # registradas dentro de esta etapa
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, export_query_result, name, output_dir, data,
+                                  backend)
+            for name in EXPORT_QUERIES
+        }
         
-        # Cambio interanual
-        df_yoy = get_yoy_change()
-        if df_yoy is not None:
-            file_path = os.path.join(output_dir, 'yoy_change.csv')
-            df_yoy.to_csv(file_path, index=False)
-            results['yoy_change'] = file_path
-            logger.info(f"Resultados guardados en {file_path}")
-        
-        logger.info("Todos los resultados de consultas guardados correctamente")
-        return results
+        # Límite de toda la exportación; el doble del de cada consulta deja margen a las que esperan un hilo
+        deadline = start_time + query_timeout * 2 if query_timeout else None
+        for name, future in futures.items():
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            try:
+                results[name] = future.result(timeout=remaining)
+            except FuturesTimeoutError:
+                errors[name] = f"Tiempo de espera agotado ({query_timeout} segundos)"
+            except Exception as e:
+                errors[name] = str(e)
+    finally:
+        # No se espera a las tareas que superaron el límite: las que no empezaron se cancelan y
+        # las que siguen corriendo terminan en su hilo (en PostgreSQL las corta statement_timeout)
+        executor.shutdown(wait=False, cancel_futures=True)
     
-    except Exception as e:
-        logger.error(f"Error al guardar resultados de consultas: {e}")
-        return results
+    if errors:
+        for name, error in errors.items():
+            logger.error(f"Error al guardar resultados de la consulta {name}: {error}")
+        results['errors'] = errors
+    else:
+        logger.info("Todos los resultados de consultas guardados correctamente")
+    logger.info(f"Exportación para Power BI completada en {time.time() - start_time:.2f} segundos")
+    return results
 
 if __name__ == "__main__":
     # Si se ejecuta directamente este script
@@ -222,6 +355,7 @@ if __name__ == "__main__":
     if results:
         logger.info("Datos preparados para Power BI")
         for query_name, file_path in results.items():
-            logger.info(f"  - {query_name}: {file_path}")
+            if query_name != 'errors':
+                logger.info(f"  - {query_name}: {file_path}")
     else:
         logger.warning("No se generaron resultados para Power BI")
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+from config import LOGS_DIR, RUN_REPORT_FILE, PROFILE_STAGE, logger
+
+try:
+    import resource
+except ImportError:
+    # No disponible en Windows: el reporte se genera sin la memoria máxima
+    resource = None
+
+# Cantidad de funciones y de líneas de asignación de memoria que se guardan al perfilar
+PROFILE_TOP_ENTRIES = 15
+
+# Etapa en curso en el contexto actual, como ruta ('run_pipeline', 'transform_data', ...)
+_current_path = contextvars.ContextVar('profiling_path', default=())
+# Métricas de la llamada en curso, que record_metrics completa
+_current_metrics = contextvars.ContextVar('profiling_metrics', default=None)
+
+# Métricas acumuladas por ruta de etapa durante la ejecución actual
+_steps = {}
+_steps_lock = threading.Lock()
+_run_started_at = None
+
+# Etapa a perfilar; sólo se perfila una llamada a la vez (cProfile no admite perfiles simultáneos)
+_profile_stage = PROFILE_STAGE
+_profile_lock = threading.Lock()
+_profile_results = {}
+
+def get_peak_rss_mb():
+    """
+    Devuelve la memoria residente máxima del proceso hasta el momento.
+    
+    Returns:
+        float: Memoria en MB, None si no se puede medir en esta plataforma
+    """
+    if resource is None:
+        return None
+    # ru_maxrss está en KB en Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def set_profile_stage(name):
+    """
+    Cambia la etapa que se perfila con cProfile y tracemalloc (ver PROFILE_STAGE).
+    
+    Args:
+        name (str): Nombre de la etapa, o vacío para no perfilar ninguna
+    """
+    global _profile_stage
+    _profile_stage = name or ''
+
+def start_run_report():
+    """
+    Descarta las métricas de la ejecución anterior y empieza un reporte nuevo.
+    """
+    global _run_started_at
+    with _steps_lock:
+        _steps.clear()
+        _profile_results.clear()
+    _run_started_at = datetime.now()
+
+def record_metrics(rows_in=None, rows_out=None, bytes_read=0, bytes_written=0):
+    """
+    Agrega filas o bytes a la etapa en curso, para los valores que track_step no puede
+    deducir solo (por ejemplo el tamaño del archivo leído o del CSV enviado con COPY).
+    
+    Args:
+        rows_in (int, optional): Filas recibidas
+        rows_out (int, optional): Filas generadas
+        bytes_read (int): Bytes leídos
+        bytes_written (int): Bytes escritos
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    if rows_in is not None:
+        metrics['rows_in'] = rows_in
+    if rows_out is not None:
+        metrics['rows_out'] = rows_out
+    metrics['bytes_read'] += bytes_read
+    metrics['bytes_written'] += bytes_written
+
+def _get_step(path):
+    """
+    Devuelve el registro de métricas de una etapa, creándolo la primera vez que empieza.
+    """
+    with _steps_lock:
+        return _steps.setdefault(path, {
+            'step': '/'.join(path),
+            'calls': 0,
+            'wall_time_s': 0.0,
+            'cpu_time_s': 0.0,
+            'rss_growth_mb': None,
+            'rows_in': None,
+            'rows_out': None,
+            'bytes_read': 0,
+            'bytes_written': 0,
+        })
+
+def _add_call(step, wall_time, cpu_time, rss_growth, metrics):
+    """
+    Acumula las métricas de una llamada en el registro de su etapa.
+    """
+    with _steps_lock:
+        step['calls'] += 1
+        step['wall_time_s'] += wall_time
+        step['cpu_time_s'] += cpu_time
+        if rss_growth is not None:
+            step['rss_growth_mb'] = round((step['rss_growth_mb'] or 0) + rss_growth, 1)
+        for key in ('rows_in', 'rows_out'):
+            if metrics[key] is not None:
+                step[key] = (step[key] or 0) + metrics[key]
+        step['bytes_read'] += metrics['bytes_read']
+        step['bytes_written'] += metrics['bytes_written']
+
+@contextmanager
+def track_step(name):
+    """
+    Mide una etapa o subetapa del pipeline: tiempo real, tiempo de CPU del proceso,
+    crecimiento de la memoria residente máxima, filas y bytes. Las etapas anidadas se registran con la ruta
+    completa (por ejemplo 'run_pipeline/transform_data/apply_column_specs') y las llamadas
+    repetidas a la misma ruta (un bloque por llamada) se acumulan.
+    
+    rss_growth_mb es cuánto subió durante la etapa la memoria residente máxima del proceso
+    (ru_maxrss), que nunca baja: 0 indica que la etapa no superó el máximo de las anteriores.
+    Con etapas en paralelo el crecimiento se atribuye a todas las que estaban en curso.
+    
+    Si name es la etapa configurada en PROFILE_STAGE, la llamada se perfila con cProfile y tracemalloc.
+    
+    Args:
+        name (str): Nombre de la etapa
+    
+    Yields:
+        dict: Métricas de la llamada (rows_in, rows_out, bytes_read, bytes_written)
+    """
+    path = _current_path.get() + (name,)
+    step = _get_step(path)
+    metrics = {'rows_in': None, 'rows_out': None, 'bytes_read': 0, 'bytes_written': 0}
+    path_token = _current_path.set(path)
+    metrics_token = _current_metrics.set(metrics)
+    
+    profiler = None
+    if _profile_stage == name and _profile_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        profiler.enable()
+    
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    start_rss = get_peak_rss_mb()
+    try:
+        yield metrics
+    finally:
+        wall_time = time.perf_counter() - start_time
+        cpu_time = time.process_time() - start_cpu
+        rss_growth = None if start_rss is None else get_peak_rss_mb() - start_rss
+        if profiler is not None:
+            profiler.disable()
+            _save_profile(name, profiler)
+            _profile_lock.release()
+        _current_metrics.reset(metrics_token)
+        _current_path.reset(path_token)
+        _add_call(step, wall_time, cpu_time, rss_growth, metrics)
+
+def _save_profile(name, profiler):
+    """
+    Guarda las estadísticas de cProfile en logs/profile_<etapa>.prof y agrega al reporte
+    las funciones con más tiempo acumulado y las líneas con más memoria asignada.
+    """
+    _, traced_peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    
+    stats_file = os.path.join(LOGS_DIR, f'profile_{name}.prof')
+    profiler.dump_stats(stats_file)
+    
+    stats = pstats.Stats(profiler).stats
+    top_functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP_ENTRIES]
+    top_allocations = snapshot.statistics('lineno')[:PROFILE_TOP_ENTRIES]
+    
+    with _steps_lock:
+        _profile_results[name] = {
+            'stats_file': stats_file,
+            'tracemalloc_peak_mb': round(traced_peak / 1024 / 1024, 1),
+            'top_functions': [
+                {
+                    'function': f"{function} ({os.path.basename(file_name)}:{line})",
+                    'calls': calls,
+                    'own_time_s': round(own_time, 4),
+                    'cumulative_time_s': round(cumulative_time, 4),
+                }
+                for (file_name, line, function), (_, calls, own_time, cumulative_time, _) in top_functions
+            ],
+            # Memoria que sigue asignada al terminar la etapa, por línea de código
+            'top_allocations': [
+                {'location': str(stat.traceback), 'size_mb': round(stat.size / 1024 / 1024, 2),
+                 'count': stat.count}
+                for stat in top_allocations
+            ],
+        }
+    logger.info(f"Perfil de {name} guardado en {stats_file}")
+
+def _infer_rows(value):
+    """
+    Devuelve las filas de un DataFrame (o del primer elemento de una tupla), si lo es.
+    """
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    return None
+
+def profiled_step(func):
+    """
+    Decorador que mide cada llamada a la función con track_step, usando su nombre como
+    etapa. Si el primer argumento o el resultado son DataFrames, se registran sus filas.
+    
+    Args:
+        func (callable): Función a medir
+    
+    Returns:
+        callable: Función decorada
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with track_step(func.__name__) as metrics:
+            if args:
+                metrics['rows_in'] = _infer_rows(args[0])
+            result = func(*args, **kwargs)
+            if metrics['rows_out'] is None:
+                metrics['rows_out'] = _infer_rows(result)
+            return result
+    return wrapper
+
+def reported_run(func):
+    """
+    Decorador para la función principal: empieza un reporte nuevo, mide la ejecución
+    completa y al terminar escribe el reporte en RUN_REPORT_FILE (también si falla).
+    
+    Args:
+        func (callable): Función que ejecuta el pipeline y devuelve True si tuvo éxito
+    
+    Returns:
+        callable: Función decorada
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start_run_report()
+        result = None
+        try:
+            with track_step(func.__name__):
+                result = func(*args, **kwargs)
+            return result
+        finally:
+            write_run_report('success' if result else 'failed')
+    return wrapper
+
+def get_run_report(status=None):
+    """
+    Arma el reporte de la ejecución actual.
+    
+    Args:
+        status (str, optional): Resultado de la ejecución
+    
+    Returns:
+        dict: Reporte con las métricas de cada etapa, en el orden en que empezaron
+    """
+    with _steps_lock:
+        steps = [
+            dict(step, wall_time_s=round(step['wall_time_s'], 4), cpu_time_s=round(step['cpu_time_s'], 4))
+            for step in _steps.values()
+        ]
+        profiles = dict(_profile_results)
+    report = {
+        'started_at': _run_started_at.isoformat() if _run_started_at else None,
+        'finished_at': datetime.now().isoformat(),
+        'status': status,
+        'peak_rss_mb': get_peak_rss_mb(),
+        'steps': steps,
+    }
+    if profiles:
+        report['profiles'] = profiles
+    return report
+
+def write_run_report(status=None, file_path=RUN_REPORT_FILE):
+    """
+    Escribe el reporte de la ejecución actual en formato JSON.
+    
+    Args:
+        status (str, optional): Resultado de la ejecución
+        file_path (str): Ruta del archivo de salida
+    
+    Returns:
+        str: Ruta al reporte, None si hubo un error
+    """
+    try:
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(get_run_report(status), f, indent=2)
+        os.replace(temp_path, file_path)
+        logger.info(f"Reporte de la ejecución guardado en {file_path}")
+        return file_path
+    except IOError as e:
+        logger.error(f"Error al guardar el reporte de la ejecución: {e}")
+        return None
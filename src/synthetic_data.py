@@ -0,0 +1,317 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from config import RAW_DATA_DIR, logger
+
+# Columnas del CSV del Departamento de Licencias de Washington, en el orden original
+RAW_COLUMNS = [
+    'VIN (1-10)', 'County', 'City', 'State', 'Postal Code', 'Model Year', 'Make', 'Model',
+    'Electric Vehicle Type', 'Clean Alternative Fuel Vehicle (CAFV) Eligibility',
+    'Electric Range', 'Base MSRP', 'Legislative District', 'DOL Vehicle ID',
+    'Vehicle Location', 'Electric Utility', '2020 Census Tract'
+]
+
+BEV = 'Battery Electric Vehicle (BEV)'
+PHEV = 'Plug-in Hybrid Electric Vehicle (PHEV)'
+
+CAFV_ELIGIBLE = 'Clean Alternative Fuel Vehicle Eligible'
+CAFV_LOW_RANGE = 'Not eligible due to low battery range'
+CAFV_UNKNOWN = 'Eligibility unknown as battery range has not been researched'
+
+# Marcas y modelos: marca -> [(modelo, tipo, autonomía en millas)], ordenados por popularidad
+# (unas 40 marcas y 140 modelos, como el registro real)
+MAKES = {
+    'TESLA': [('MODEL Y', BEV, 291), ('MODEL 3', BEV, 266), ('MODEL S', BEV, 234), ('MODEL X', BEV, 238),
+              ('CYBERTRUCK', BEV, 0), ('ROADSTER', BEV, 245)],
+    'CHEVROLET': [('BOLT EV', BEV, 259), ('VOLT', PHEV, 53), ('BOLT EUV', BEV, 247), ('EQUINOX EV', BEV, 0),
+                  ('BLAZER EV', BEV, 0), ('SILVERADO EV', BEV, 0), ('SPARK', BEV, 82)],
+    'NISSAN': [('LEAF', BEV, 150), ('ARIYA', BEV, 0)],
+    'FORD': [('MUSTANG MACH-E', BEV, 0), ('F-150', BEV, 0), ('ESCAPE', PHEV, 37), ('FUSION', PHEV, 19),
+             ('C-MAX', PHEV, 19), ('FOCUS', BEV, 76), ('TRANSIT', BEV, 0), ('RANGER', PHEV, 0)],
+    'KIA': [('NIRO', BEV, 239), ('EV6', BEV, 0), ('SOUL', BEV, 111), ('SPORTAGE', PHEV, 34),
+            ('SORENTO', PHEV, 32), ('OPTIMA', PHEV, 29), ('EV9', BEV, 0), ('SOUL EV PLUS', BEV, 243)],
+    'TOYOTA': [('RAV4 PRIME', PHEV, 42), ('PRIUS PRIME', PHEV, 25), ('PRIUS PLUG-IN', PHEV, 6),
+               ('BZ4X', BEV, 0), ('RAV4', BEV, 103)],
+    'HYUNDAI': [('IONIQ 5', BEV, 0), ('KONA ELECTRIC', BEV, 258), ('IONIQ', PHEV, 29), ('IONIQ 6', BEV, 0),
+                ('TUCSON', PHEV, 33), ('SANTA FE', PHEV, 31), ('SONATA', PHEV, 27), ('KONA', BEV, 258)],
+    'BMW': [('X5', PHEV, 30), ('I3', BEV, 153), ('330E', PHEV, 22), ('I4', BEV, 0), ('IX', BEV, 0),
+            ('530E', PHEV, 21), ('X3', PHEV, 18), ('I8', PHEV, 18), ('I7', BEV, 0), ('I5', BEV, 0),
+            ('740E', PHEV, 14), ('X1', PHEV, 0)],
+    'VOLKSWAGEN': [('ID.4', BEV, 0), ('E-GOLF', BEV, 125), ('ID.BUZZ', BEV, 0)],
+    'JEEP': [('WRANGLER', PHEV, 21), ('GRAND CHEROKEE', PHEV, 25)],
+    'RIVIAN': [('R1S', BEV, 0), ('R1T', BEV, 0), ('EDV', BEV, 0)],
+    'VOLVO': [('XC90', PHEV, 18), ('XC60', PHEV, 17), ('XC40', BEV, 0), ('C40', BEV, 0), ('S60', PHEV, 22),
+              ('V60', PHEV, 22), ('S90', PHEV, 21), ('EX30', BEV, 0)],
+    'AUDI': [('E-TRON', BEV, 222), ('Q5 E', PHEV, 20), ('E-TRON GT', BEV, 0), ('Q4', BEV, 0), ('A3', PHEV, 16),
+             ('E-TRON SPORTBACK', BEV, 218), ('Q8', BEV, 0), ('A7 E', PHEV, 0)],
+    'CHRYSLER': [('PACIFICA', PHEV, 32)],
+    'MERCEDES-BENZ': [('EQS-CLASS SUV', BEV, 0), ('EQB-CLASS', BEV, 0), ('EQE-CLASS SUV', BEV, 0),
+                      ('GLC-CLASS', PHEV, 10), ('EQS-CLASS SEDAN', BEV, 0), ('B-CLASS', BEV, 87),
+                      ('EQE-CLASS SEDAN', BEV, 0), ('S-CLASS', PHEV, 14), ('C-CLASS', PHEV, 8), ('GLE-CLASS', PHEV, 0)],
+    'POLESTAR': [('PS2', BEV, 0), ('PS3', BEV, 0)],
+    'PORSCHE': [('TAYCAN', BEV, 0), ('CAYENNE', PHEV, 14), ('PANAMERA', PHEV, 14), ('MACAN', BEV, 0)],
+    'MITSUBISHI': [('OUTLANDER', PHEV, 22), ('I-MIEV', BEV, 62)],
+    'LEXUS': [('NX', PHEV, 37), ('RZ', BEV, 0), ('TX', PHEV, 0), ('RX', PHEV, 0)],
+    'CADILLAC': [('LYRIQ', BEV, 0), ('ELR', PHEV, 37), ('CT6', PHEV, 31), ('OPTIQ', BEV, 0)],
+    'HONDA': [('CLARITY', PHEV, 48), ('PROLOGUE', BEV, 0), ('FIT', BEV, 82)],
+    'LINCOLN': [('AVIATOR', PHEV, 21), ('CORSAIR', PHEV, 28)],
+    'MINI': [('HARDTOP', BEV, 110), ('COUNTRYMAN', PHEV, 12)],
+    'SUBARU': [('SOLTERRA', BEV, 0), ('CROSSTREK', PHEV, 17)],
+    'GENESIS': [('GV60', BEV, 0), ('GV70', BEV, 0), ('G80', BEV, 0)],
+    'FIAT': [('500', BEV, 84), ('500E', BEV, 0)],
+    'JAGUAR': [('I-PACE', BEV, 234)],
+    'SMART': [('FORTWO ELECTRIC DRIVE', BEV, 58), ('EQ FORTWO', BEV, 57)],
+    'MAZDA': [('CX-90', PHEV, 0), ('MX-30', BEV, 0), ('CX-70', PHEV, 0)],
+    'DODGE': [('HORNET', PHEV, 0)],
+    'LUCID': [('AIR', BEV, 0), ('GRAVITY', BEV, 0)],
+    'GMC': [('HUMMER EV PICKUP', BEV, 0), ('HUMMER EV SUV', BEV, 0), ('SIERRA EV', BEV, 0)],
+    'FISKER': [('OCEAN', BEV, 0), ('KARMA', PHEV, 33)],
+    'LAND ROVER': [('RANGE ROVER', PHEV, 0), ('RANGE ROVER SPORT', PHEV, 0)],
+    'ALFA ROMEO': [('TONALE', PHEV, 0)],
+    'BENTLEY': [('BENTAYGA', PHEV, 0), ('FLYING SPUR', PHEV, 0)],
+    'AZURE DYNAMICS': [('TRANSIT CONNECT ELECTRIC', BEV, 56)],
+    'TH!NK': [('CITY', BEV, 100)],
+}
+
+# Condados de Washington (código FIPS) ordenados por cantidad de registros
+WA_COUNTIES = [
+    ('King', '033'), ('Snohomish', '061'), ('Pierce', '053'), ('Clark', '011'), ('Thurston', '067'),
+    ('Kitsap', '035'), ('Spokane', '063'), ('Whatcom', '073'), ('Benton', '005'), ('Skagit', '057'),
+    ('Island', '029'), ('San Juan', '055'), ('Chelan', '007'), ('Yakima', '077'), ('Jefferson', '031'),
+    ('Clallam', '009'), ('Mason', '045'), ('Cowlitz', '015'), ('Lewis', '041'), ('Walla Walla', '071'),
+    ('Franklin', '021'), ('Kittitas', '037'), ('Grant', '025'), ('Douglas', '017'), ('Klickitat', '039'),
+    ('Grays Harbor', '027'), ('Whitman', '075'), ('Okanogan', '047'), ('Skamania', '059'), ('Stevens', '065'),
+    ('Pacific', '049'), ('Asotin', '003'), ('Wahkiakum', '069'), ('Adams', '001'), ('Pend Oreille', '051'),
+    ('Lincoln', '043'), ('Columbia', '013'), ('Ferry', '019'), ('Garfield', '023'),
+]
+
+# Registros de vehículos con domicilio fuera de Washington (una fracción muy chica)
+OTHER_STATES = [
+    ('CA', 'San Diego'), ('CA', 'Orange'), ('VA', 'Fairfax'), ('TX', 'Bexar'), ('MD', 'Anne Arundel'),
+    ('NC', 'Onslow'), ('OR', 'Multnomah'), ('CO', 'El Paso'), ('FL', 'Duval'), ('HI', 'Honolulu'),
+    ('IL', 'Cook'), ('NY', 'Kings'), ('AZ', 'Maricopa'), ('GA', 'Fulton'), ('ID', 'Ada'),
+]
+
+UTILITIES = [
+    'PUGET SOUND ENERGY INC||CITY OF TACOMA - (WA)', 'CITY OF SEATTLE - (WA)|CITY OF TACOMA - (WA)',
+    'PUGET SOUND ENERGY INC', 'BONNEVILLE POWER ADMINISTRATION||PUD NO 1 OF CLARK COUNTY - (WA)',
+    'BONNEVILLE POWER ADMINISTRATION||CITY OF TACOMA - (WA)||PENINSULA LIGHT COMPANY',
+    'MODERN ELECTRIC WATER COMPANY', 'AVISTA CORP', 'PACIFICORP',
+    'BONNEVILLE POWER ADMINISTRATION||PUD NO 1 OF CHELAN COUNTY', 'PUD NO 1 OF WHATCOM COUNTY',
+    'BONNEVILLE POWER ADMINISTRATION||PUD 1 OF SNOHOMISH COUNTY', 'CITY OF RICHLAND - (WA)',
+]
+
+# Sílabas para formar nombres de ciudades con la longitud de los reales
+CITY_PREFIXES = ['Ced', 'Mar', 'Bell', 'Ken', 'Ren', 'Oak', 'Silver', 'Lake', 'Port', 'Fall', 'Red', 'Sea',
+                 'Ever', 'Puy', 'Sno', 'Mon', 'Ridge', 'Black', 'Green', 'Sum', 'Lyn', 'Fern', 'Elm', 'Cam']
+CITY_SUFFIXES = ['dale', 'ton', 'wood', 'ville', 'view', 'ford', 'mond', 'allup', 'homish', 'roe', 'ner',
+                 ' City', ' Falls', ' Harbor', ' Island', ' Valley', ' Point', ' Bay', 'ingham', 'field']
+
+# Cantidad aproximada de ciudades y de códigos postales del registro real
+CITY_COUNT = 700
+POSTAL_CODES_PER_CITY = (1, 3)
+
+# Probabilidad de nulos en las columnas de ubicación y en la autonomía
+LOCATION_NULL_RATE = 0.0001
+RANGE_NULL_RATE = 0.0002
+
+# Fracción de filas que repiten el DOL Vehicle ID de otra fila, como los duplicados del registro
+# real (alrededor del 0,1%), para que la transformación tenga que eliminarlos
+DUPLICATE_RATIO = 0.001
+
+def zipf_weights(count, exponent=1.1):
+    """
+    Devuelve probabilidades decrecientes (ley de Zipf) para count valores ordenados por popularidad.
+    
+    Args:
+        count (int): Cantidad de valores
+        exponent (float): Qué tan concentrada está la distribución en los primeros valores
+    
+    Returns:
+        np.ndarray: Probabilidades que suman 1
+    """
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+def build_catalog(rng):
+    """
+    Arma las tablas de valores posibles (modelos, ciudades y códigos postales) con sus
+    probabilidades. Depende sólo de la semilla, así el mismo catálogo se obtiene siempre.
+    
+    Args:
+        rng (np.random.Generator): Generador de números aleatorios
+    
+    Returns:
+        dict: Tablas de modelos y de ubicaciones (una fila por código postal)
+    """
+    models = pd.DataFrame(
+        [(make, model, ev_type, electric_range, make_rank)
+         for make_rank, (make, make_models) in enumerate(MAKES.items())
+         for model, ev_type, electric_range in make_models],
+        columns=['make', 'model', 'ev_type', 'electric_range', 'make_rank']
+    )
+    # Popularidad de la marca repartida entre sus modelos, también con Zipf
+    make_weights = zipf_weights(len(MAKES), 1.4)
+    model_weights = np.concatenate([
+        make_weights[rank] * zipf_weights(len(make_models), 1.2)
+        for rank, make_models in enumerate(MAKES.values())
+    ])
+    models['weight'] = model_weights / model_weights.sum()
+    models['vin_prefix'] = [
+        ''.join(rng.choice(list('123456789ABCDEFGHJKLMNPRSTUVWXYZ'), 7)) for _ in range(len(models))
+    ]
+    
+    # Ciudades repartidas entre los condados según su popularidad
+    counties = [('WA', name, fips) for name, fips in WA_COUNTIES]
+    counties += [(state, name, None) for state, name in OTHER_STATES]
+    county_weights = np.concatenate([zipf_weights(len(WA_COUNTIES), 1.3) * 0.998,
+                                     np.full(len(OTHER_STATES), 0.002 / len(OTHER_STATES))])
+    city_county = rng.choice(len(counties), CITY_COUNT, p=county_weights)
+    city_county[:len(counties)] = np.arange(len(counties))  # Al menos una ciudad por condado
+    
+    locations = []
+    used_names = set()
+    next_postal_code = 98001
+    for city_number, county_index in enumerate(city_county):
+        state, county, fips = counties[county_index]
+        name = f"{rng.choice(CITY_PREFIXES)}{rng.choice(CITY_SUFFIXES)}"
+        if name in used_names:
+            name = f"{name} {city_number}"
+        used_names.add(name)
+        
+        city_weight = county_weights[county_index] * rng.pareto(1.5)
+        longitude = -124 + rng.random() * 7
+        latitude = 45.6 + rng.random() * 3.4
+        district = rng.integers(1, 50)
+        utility = UTILITIES[rng.integers(len(UTILITIES))]
+        for _ in range(rng.integers(POSTAL_CODES_PER_CITY[0], POSTAL_CODES_PER_CITY[1] + 1)):
+            if state == 'WA':
+                postal_code = next_postal_code
+                next_postal_code += 1
+                census_tract = f"53{fips}{rng.integers(100, 99999):06d}"
+            else:
+                postal_code = rng.integers(10000, 97999)
+                census_tract = f"{rng.integers(1, 56):02d}{rng.integers(1, 999):03d}{rng.integers(100, 99999):06d}"
+            locations.append((county, name, state, postal_code, district,
+                              f"POINT ({longitude:.5f} {latitude:.5f})", utility, census_tract, city_weight))
+            longitude += rng.normal(0, 0.05)
+            latitude += rng.normal(0, 0.05)
+    
+    locations = pd.DataFrame(locations, columns=['county', 'city', 'state', 'postal_code', 'district',
+                                                 'location', 'utility', 'census_tract', 'weight'])
+    locations['weight'] = locations['weight'] / locations['weight'].sum()
+    return {'models': models, 'locations': locations}
+
+def generate_chunk(rng, catalog, start_row, rows, duplicate_ratio=DUPLICATE_RATIO):
+    """
+    Genera un bloque de filas sintéticas con el esquema del CSV crudo.
+    
+    Args:
+        rng (np.random.Generator): Generador de números aleatorios
+        catalog (dict): Catálogo armado con build_catalog
+        start_row (int): Número de la primera fila del bloque (para los IDs únicos)
+        rows (int): Cantidad de filas del bloque
+        duplicate_ratio (float): Fracción de filas que repiten el ID de otra fila del bloque
+    
+    Returns:
+        pd.DataFrame: Bloque con las columnas de RAW_COLUMNS
+    """
+    models = catalog['models'].iloc[rng.choice(len(catalog['models']), rows, p=catalog['models']['weight'])]
+    locations = catalog['locations'].iloc[rng.choice(len(catalog['locations']), rows,
+                                                     p=catalog['locations']['weight'])]
+    
+    # Los registros crecen año a año, la mayoría son de modelos recientes
+    years = np.arange(2010, 2026)
+    model_year = rng.choice(years, rows, p=zipf_weights(len(years), 1.0)[::-1])
+    
+    # La autonomía sólo está informada para los modelos más viejos
+    electric_range = models['electric_range'].to_numpy().copy()
+    electric_range[model_year >= 2021] = 0
+    cafv = np.where(electric_range == 0, CAFV_UNKNOWN,
+                    np.where(electric_range >= 30, CAFV_ELIGIBLE, CAFV_LOW_RANGE))
+    
+    # IDs únicos: cada fila toma un valor de su propio intervalo y luego se mezclan
+    dol_vehicle_id = 100000000 + np.arange(start_row, start_row + rows) * 37 + rng.integers(0, 37, rows)
+    rng.shuffle(dol_vehicle_id)
+    if duplicate_ratio > 0:
+        # Las filas repetidas toman el ID de otra fila al azar, que puede estar lejos en el archivo
+        duplicates = rng.random(rows) < duplicate_ratio
+        dol_vehicle_id[duplicates] = dol_vehicle_id[rng.integers(0, rows, int(duplicates.sum()))]
+    
+    vin_suffix = rng.integers(0, 1000, rows)
+    base_msrp = np.where(rng.random(rows) < 0.01, rng.choice([31950, 36900, 52900, 69900], rows), 0)
+    
+    chunk = pd.DataFrame({
+        'VIN (1-10)': models['vin_prefix'].to_numpy() + pd.Series(vin_suffix).map('{:03d}'.format).to_numpy(),
+        'County': locations['county'].to_numpy(),
+        'City': locations['city'].to_numpy(),
+        'State': locations['state'].to_numpy(),
+        'Postal Code': locations['postal_code'].to_numpy(),
+        'Model Year': model_year,
+        'Make': models['make'].to_numpy(),
+        'Model': models['model'].to_numpy(),
+        'Electric Vehicle Type': models['ev_type'].to_numpy(),
+        'Clean Alternative Fuel Vehicle (CAFV) Eligibility': cafv,
+        'Electric Range': pd.array(electric_range, dtype='Int64'),
+        'Base MSRP': pd.array(base_msrp, dtype='Int64'),
+        'Legislative District': pd.array(locations['district'].to_numpy(), dtype='Int64'),
+        'DOL Vehicle ID': dol_vehicle_id,
+        'Vehicle Location': locations['location'].to_numpy(),
+        'Electric Utility': locations['utility'].to_numpy(),
+        '2020 Census Tract': locations['census_tract'].to_numpy(),
+    })
+    
+    # Algunos nulos, como en el registro real
+    for column in ['County', 'City', 'Postal Code', 'Legislative District', 'Vehicle Location']:
+        chunk.loc[rng.random(rows) < LOCATION_NULL_RATE, column] = None
+    for column in ['Electric Range', 'Base MSRP']:
+        chunk.loc[rng.random(rows) < RANGE_NULL_RATE, column] = None
+    return chunk
+
+def generate_synthetic_data(file_path, rows, seed=42, chunk_size=500000, duplicate_ratio=DUPLICATE_RATIO):
+    """
+    Genera un CSV sintético con el esquema del registro de vehículos eléctricos de Washington
+    (el que espera transform.clean_column_names) y cardinalidades realistas: unas 40 marcas,
+    140 modelos, 54 condados, 700 ciudades y 1400 códigos postales. El resultado depende sólo
+    de la semilla y de la cantidad de filas, así se puede comparar entre versiones del código.
+    
+    Args:
+        file_path (str): Ruta del CSV a generar
+        rows (int): Cantidad de filas
+        seed (int): Semilla del generador de números aleatorios
+        chunk_size (int): Filas que se generan y escriben por bloque
+        duplicate_ratio (float): Fracción de filas con un DOL Vehicle ID repetido (0 para IDs únicos)
+    
+    Returns:
+        str: Ruta al archivo generado
+    """
+    rng = np.random.default_rng(seed)
+    catalog = build_catalog(rng)
+    
+    logger.info(f"Generando {rows} filas sintéticas en {file_path}")
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write((','.join(RAW_COLUMNS) + '\n').encode())
+        for start_row in range(0, rows, chunk_size):
+            chunk = generate_chunk(rng, catalog, start_row, min(chunk_size, rows - start_row), duplicate_ratio)
+            # Sin comillas, igual que el archivo original (ningún valor contiene comas)
+            pa_csv.write_csv(pa.Table.from_pandas(chunk, preserve_index=False), f,
+                             pa_csv.WriteOptions(include_header=False, quoting_style='none'))
+    os.replace(temp_path, file_path)
+    logger.info(f"Archivo sintético generado: {file_path} ({os.path.getsize(file_path) / 1024 / 1024:.1f} MB)")
+    return file_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de vehículos eléctricos")
+    parser.add_argument('rows', type=int, help="Cantidad de filas")
+    parser.add_argument('--seed', type=int, default=42, help="Semilla del generador")
+    parser.add_argument('--duplicate-ratio', type=float, default=DUPLICATE_RATIO,
+                        help="Fracción de filas con un DOL Vehicle ID repetido")
+    parser.add_argument('--output', help="Ruta del CSV (por defecto en data/raw/)")
+    args = parser.parse_args()
+    
+    output = args.output or os.path.join(RAW_DATA_DIR, f'synthetic_{args.rows}_{args.seed}.csv')
+    generate_synthetic_data(output, args.rows, args.seed, duplicate_ratio=args.duplicate_ratio)
@@ -1,22 +1,129 @@
 import os
+import io
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime
-from config import PROCESSED_DATA_DIR, logger
+from concurrent.futures import ProcessPoolExecutor
+from pandas.api.types import union_categoricals
+from profiling import profiled_step, track_step, record_metrics
+from extract import get_file_compression, get_raw_data_hash
+from cache import compute_stage_key
+from config import (PROCESSED_DATA_DIR, PROCESSED_DATA_FORMAT, PROCESSED_DATA_COMPRESSION, RAW_ARROW_CACHE_DIR,
+                    TRANSFORM_CHUNK_SIZE, TRANSFORM_WORKERS, CSV_ENGINE, RAW_ARROW_CACHE, logger)
 
-def read_raw_data(file_path):
+# Especificación de las columnas procesadas: nombre -> tipo y política de nulos
+#   type: 'numeric' (float64; los valores no numéricos quedan nulos), 'integer' (int64 si no
+#         quedan nulos; los valores no enteros también quedan nulos), 'category', o 'year_date'
+#         (el año del modelo se convierte a la fecha del 1 de enero de ese año)
+#   Los tipos no dependen de los valores, así cada bloque de la transformación por bloques
+#   tiene los mismos tipos que el dataset transformado de una vez
+#   nulls: 'drop' descarta la fila si la columna es nula; cualquier otro valor reemplaza al nulo
+COLUMN_SPECS = {
+    'dol_vehicle_id': {'type': 'integer', 'nulls': 'drop'},
+    'county': {'type': 'category', 'nulls': 'drop'},
+    'city': {'type': 'category', 'nulls': 'drop'},
+    'state': {'type': 'category', 'nulls': 'drop'},
+    'postal_code': {'type': 'integer', 'nulls': 'drop'},
+    'model_year': {'type': 'year_date', 'nulls': 'drop'},
+    'make': {'type': 'category', 'nulls': 'drop'},
+    'model': {'type': 'category', 'nulls': 'drop'},
+    'electric_vehicle_type': {'type': 'category', 'nulls': 'drop'},
+    'cafv_eligibility': {'type': 'category', 'nulls': 'drop'},
+    # Se rellena con 0.0 porque el dataset ya usa 0 cuando la autonomía se desconoce
+    'electric_range': {'type': 'numeric', 'nulls': 0.0},
+}
+
+# Columnas requeridas para las preguntas analíticas
+RELEVANT_COLUMNS = list(COLUMN_SPECS)
+
+# Nombres de columnas que cambian además de la limpieza general
+COLUMN_RENAMES = {
+    'vin_1_10': 'vin',
+    'clean_alternative_fuel_vehicle_cafv_eligibility': 'cafv_eligibility'
+}
+
+# Caracteres que se reemplazan (espacios y guiones) o se eliminan (paréntesis) en los nombres
+COLUMN_NAME_TRANSLATION = str.maketrans({' ': '_', '-': '_', '(': None, ')': None})
+
+# Rango de años que se puede representar como fecha en pandas (datetime64[ns])
+MIN_DATE_YEAR = 1678
+MAX_DATE_YEAR = 2261
+
+# Nombre del archivo con la versión completa de los datos (ver export_full_data)
+FULL_DATA_FILE_NAME = 'full_processed_ev_data'
+
+# Extensión de archivo para cada formato de datos procesados
+PROCESSED_FILE_EXTENSIONS = {
+    'parquet': '.parquet',
+    'csv': '.csv'
+}
+
+def clean_column_name(name):
     """
-    Lee el archivo CSV de datos crudos en un DataFrame de pandas.
+    Limpia un nombre de columna del CSV crudo (por ejemplo 'Model Year' -> 'model_year').
+    
+    Args:
+        name (str): Nombre original de la columna
+        
+    Returns:
+        str: Nombre limpio
+    """
+    name = name.lower().translate(COLUMN_NAME_TRANSLATION)
+    return COLUMN_RENAMES.get(name, name)
+
+def get_raw_read_options(file_path, columns=None, specs=COLUMN_SPECS, raw_names=None):
+    """
+    Arma las opciones de lectura del CSV crudo a partir de COLUMN_SPECS, para que la
+    selección de columnas y las categorías se resuelvan al parsear el archivo. Sólo se lee
+    el encabezado, para traducir los nombres limpios a los nombres originales.
     
     Args:
         file_path (str): Ruta al archivo CSV de datos crudos
+        columns (list, optional): Columnas a leer, con los nombres limpios. Si es None se leen todas
+        specs (dict): Especificación de las columnas (ver COLUMN_SPECS)
+        raw_names (list, optional): Nombres originales de las columnas, si ya se leyó el encabezado
+        
+    Returns:
+        tuple: (usecols con los nombres originales o None, dtype por nombre original)
+    """
+    if raw_names is None:
+        raw_names = pd.read_csv(file_path, nrows=0).columns
+    clean_names = {raw: clean_column_name(raw) for raw in raw_names}
+    
+    usecols = None
+    selected = list(raw_names)
+    if columns is not None:
+        selected = [raw for raw in raw_names if clean_names[raw] in columns]
+        usecols = selected
+    
+    # Las categorías se arman al leer; las columnas numéricas no se fuerzan porque un valor
+    # inválido haría fallar la lectura (apply_column_specs los deja como nulos)
+    dtype = {raw: 'category' for raw in selected
+             if specs.get(clean_names[raw], {}).get('type') == 'category'}
+    return usecols, dtype
+
+@profiled_step
+def read_raw_data(file_path, columns=None, engine=CSV_ENGINE):
+    """
+    Lee el archivo CSV de datos crudos en un DataFrame de pandas. Las columnas de tipo
+    'category' en COLUMN_SPECS se leen directamente como categorías. Si el archivo está
+    comprimido (.gz o .zst, ver RAW_DATA_COMPRESSION) se descomprime al leerlo.
+    
+    Args:
+        file_path (str): Ruta al archivo CSV de datos crudos
+        columns (list, optional): Columnas a leer, con los nombres limpios. Si es None se leen todas
+        engine (str): Motor de lectura de pandas ('pyarrow' o 'c')
         
     Returns:
         pd.DataFrame: DataFrame con los datos crudos, None si hay error
     """
     try:
-        logger.info(f"Leyendo datos del archivo: {file_path}")
-        df = pd.read_csv(file_path)
+        logger.info(f"Leyendo datos del archivo: {file_path} (motor {engine})")
+        usecols, dtype = get_raw_read_options(file_path, columns)
+        df = pd.read_csv(file_path, usecols=usecols, dtype=dtype, engine=engine)
+        record_metrics(bytes_read=os.path.getsize(file_path))
         logger.info(f"Datos leídos correctamente. Filas: {len(df)}, Columnas: {len(df.columns)}")
         # Log de las columnas disponibles para referencia
         logger.info(f"Columnas disponibles: {df.columns.tolist()}")
@@ -25,6 +132,138 @@ def read_raw_data(file_path):
         logger.error(f"Error al leer el archivo CSV: {e}")
         return None
 
+def get_raw_arrow_path(file_path, columns=None, engine=CSV_ENGINE):
+    """
+    Devuelve la ruta de la copia Arrow IPC del CSV crudo en la caché. El nombre depende del
+    contenido del CSV y de las opciones de lectura, así que cambia si cambia cualquiera de ellos.
+    
+    Args:
+        file_path (str): Ruta al archivo CSV de datos crudos
+        columns (list, optional): Columnas a leer, con los nombres limpios
+        engine (str): Motor de lectura de pandas ('pyarrow' o 'c')
+        
+    Returns:
+        str: Ruta a la copia Arrow
+    """
+    usecols, dtype = get_raw_read_options(file_path, columns)
+    key = compute_stage_key('read_raw_data', get_raw_data_hash(file_path), [], {
+        'usecols': usecols,
+        'dtype': dtype,
+        'engine': engine,
+        'pandas': pd.__version__,
+        'pyarrow': pa.__version__,
+    })
+    return os.path.join(RAW_ARROW_CACHE_DIR, f"{key[:32]}.arrow")
+
+@profiled_step
+def read_raw_data_with_arrow_cache(file_path, columns=None, engine=CSV_ENGINE):
+    """
+    Lee el CSV crudo como read_raw_data, pero a través de una copia Arrow IPC en la caché
+    (ver get_raw_arrow_path). La primera vez se parsea el CSV y se guarda la copia; las
+    siguientes, mientras el CSV no cambie, la copia se mapea en memoria y pandas recibe
+    los buffers de Arrow sin copiarlos (las categorías, como diccionarios), así que no se
+    vuelve a parsear el texto y casi no se asigna memoria.
+    
+    Args:
+        file_path (str): Ruta al archivo CSV de datos crudos
+        columns (list, optional): Columnas a leer, con los nombres limpios. Si es None se leen todas
+        engine (str): Motor de lectura de pandas para la primera lectura ('pyarrow' o 'c')
+        
+    Returns:
+        pd.DataFrame: DataFrame con los datos crudos, None si hay error
+    """
+    try:
+        arrow_path = get_raw_arrow_path(file_path, columns, engine)
+    except Exception as e:
+        logger.warning(f"No se pudo usar la copia Arrow del CSV crudo: {e}")
+        return read_raw_data(file_path, columns, engine)
+    
+    if os.path.exists(arrow_path):
+        try:
+            logger.info(f"Leyendo la copia Arrow del CSV crudo: {arrow_path}")
+            with pa.memory_map(arrow_path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            record_metrics(bytes_read=os.path.getsize(arrow_path))
+            # split_blocks evita consolidar las columnas en bloques (que obligaría a copiarlas)
+            df = table.to_pandas(split_blocks=True, self_destruct=True)
+            logger.info(f"Datos leídos correctamente. Filas: {len(df)}, Columnas: {len(df.columns)}")
+            return df
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"Copia Arrow inválida ({e}). Se lee el CSV crudo.")
+    
+    df = read_raw_data(file_path, columns, engine)
+    if df is not None:
+        save_raw_arrow(df, arrow_path)
+    return df
+
+def save_raw_arrow(df, arrow_path):
+    """
+    Guarda la copia Arrow IPC de los datos crudos, sin comprimir para poder mapearla en
+    memoria, y elimina las copias de versiones anteriores del CSV.
+    
+    Args:
+        df (pd.DataFrame): Datos crudos
+        arrow_path (str): Ruta de la copia (ver get_raw_arrow_path)
+    """
+    try:
+        os.makedirs(RAW_ARROW_CACHE_DIR, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        temp_path = arrow_path + '.tmp'
+        with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(temp_path, arrow_path)
+        for file_name in os.listdir(RAW_ARROW_CACHE_DIR):
+            old_path = os.path.join(RAW_ARROW_CACHE_DIR, file_name)
+            if old_path != arrow_path and file_name.endswith('.arrow'):
+                os.remove(old_path)
+        logger.info(f"Copia Arrow del CSV crudo guardada en {arrow_path}")
+    except (OSError, pa.ArrowException) as e:
+        logger.warning(f"No se pudo guardar la copia Arrow del CSV crudo: {e}")
+
+def read_raw_data_in_chunks(file_path, chunk_size=TRANSFORM_CHUNK_SIZE, columns=None):
+    """
+    Lee el archivo CSV de datos crudos en bloques de tamaño acotado. Usa el motor 'c',
+    porque 'pyarrow' no admite la lectura por bloques. Los archivos comprimidos se
+    descomprimen a medida que se leen los bloques.
+    
+    También acepta un flujo de bytes que todavía se está escribiendo (por ejemplo la
+    descarga en el modo superpuesto, ver pipelining.py): como no se puede volver a leer,
+    el encabezado se lee una sola vez y el resto se parsea a medida que llega.
+    
+    Args:
+        file_path (str o archivo binario): Ruta al archivo CSV de datos crudos, o flujo de bytes
+        chunk_size (int): Cantidad máxima de filas por bloque
+        columns (list, optional): Columnas a leer, con los nombres limpios. Si es None se leen todas
+        
+    Yields:
+        pd.DataFrame: Bloque de datos crudos
+    """
+    if isinstance(file_path, (str, os.PathLike)):
+        logger.info(f"Leyendo datos del archivo en bloques de {chunk_size} filas: {file_path}")
+        bytes_read = os.path.getsize(file_path)
+        usecols, dtype = get_raw_read_options(file_path, columns)
+        header_options = {}
+    else:
+        logger.info(f"Leyendo datos del flujo {file_path.name} en bloques de {chunk_size} filas")
+        # Los bytes del flujo ya los registra quien lo escribe
+        bytes_read = 0
+        header = file_path.readline()
+        raw_names = list(pd.read_csv(io.BytesIO(header), nrows=0).columns)
+        usecols, dtype = get_raw_read_options(None, columns, raw_names=raw_names)
+        header_options = {'header': None, 'names': raw_names}
+    with pd.read_csv(file_path, chunksize=chunk_size, usecols=usecols, dtype=dtype, **header_options) as reader:
+        while True:
+            # Se mide sólo la lectura de cada bloque, no el procesamiento del consumidor
+            with track_step('read_raw_data_in_chunks'):
+                chunk = next(reader, None)
+                if chunk is not None:
+                    record_metrics(rows_out=len(chunk), bytes_read=bytes_read)
+                    bytes_read = 0
+            if chunk is None:
+                break
+            yield chunk
+
+@profiled_step
 def clean_column_names(df):
     """
     Limpia los nombres de las columnas: los pasa a minúsculas y reemplaza espacios con guiones bajos.
@@ -35,160 +274,273 @@ def clean_column_names(df):
     Returns:
         pd.DataFrame: DataFrame con nombres de columnas limpios
     """
-    rename_dict = {
-    'vin_1_10': 'vin',
-    'clean_alternative_fuel_vehicle_cafv_eligibility': 'cafv_eligibility'
-    }
-    
     logger.info("Limpiando nombres de columnas")
-    df.columns = df.columns.str.lower().str.replace(' ', '_').str.replace('-', '_').str.replace('(', '').str.replace(')', '')
-    df = df.rename(columns=rename_dict)
+    # Sólo se reemplazan las etiquetas: los datos no se copian
+    df.columns = [clean_column_name(name) for name in df.columns]
     return df
 
-def select_relevant_columns(df):
+def year_to_date(values):
     """
-    Selecciona sólo las columnas relevantes para el análisis requerido.
+    Convierte años (por ejemplo 2020) en la fecha del 1 de enero de ese año de forma
+    aritmética, sin armar ni volver a interpretar textos. Los años no numéricos, no
+    enteros o fuera del rango representable quedan como NaT.
     
     Args:
-        df (pd.DataFrame): DataFrame completo
+        values (pd.Series): Años
         
     Returns:
-        pd.DataFrame: DataFrame con columnas seleccionadas
+        pd.Series: Fechas (datetime64[ns])
+    """
+    years = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    valid = (years == np.floor(years)) & (years >= MIN_DATE_YEAR) & (years <= MAX_DATE_YEAR)
+    
+    dates = np.full(len(years), np.datetime64('NaT'), dtype='datetime64[ns]')
+    # datetime64[Y] cuenta los años desde 1970
+    dates[valid] = (years[valid].astype('int64') - 1970).astype('datetime64[Y]')
+    return pd.Series(dates, index=values.index, name=values.name)
+
+def convert_column(values, column_type):
     """
-    # Definir columnas requeridas para las preguntas analíticas
-    required_columns = [
-        'dol_vehicle_id', 'county', 'city', 'state', 'postal_code', 
-        'model_year', 'make', 'model', 'electric_vehicle_type',
-        'cafv_eligibility', 'electric_range'
-    ]
+    Convierte una columna al tipo indicado en COLUMN_SPECS.
     
-    # Verificar qué columnas requeridas existen en el dataset
-    available_columns = [col for col in required_columns if col in df.columns]
-    missing_columns = [col for col in required_columns if col not in df.columns]
+    Args:
+        values (pd.Series): Valores crudos
+        column_type (str): 'numeric', 'integer', 'category' o 'year_date'
+        
+    Returns:
+        pd.Series: Valores convertidos. Las columnas 'integer' quedan como float64 con nulos;
+            apply_column_specs las pasa a int64 después de descartar las filas
+    """
+    if column_type == 'numeric':
+        return pd.to_numeric(values, errors='coerce').astype('float64')
+    if column_type == 'integer':
+        numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+        return numbers.where(np.isfinite(numbers) & (numbers == np.floor(numbers)))
+    if column_type == 'category':
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Si las categorías se armaron al leer pueden quedar en el orden en que aparecieron;
+            # se ordenan para obtener el mismo resultado que astype('category')
+            if not values.cat.categories.is_monotonic_increasing:
+                values = values.cat.reorder_categories(values.cat.categories.sort_values())
+            return values
+        return values.astype('category')
+    if column_type == 'year_date':
+        return year_to_date(values)
+    raise ValueError(f"Tipo de columna no soportado: {column_type}")
+
+@profiled_step
+def apply_column_specs(df, specs=COLUMN_SPECS, seen_ids=None):
+    """
+    Arma el dataset procesado a partir de los datos crudos (con los nombres ya limpios)
+    en una sola pasada por columna: selecciona las columnas de specs, convierte su tipo,
+    aplica la política de nulos y elimina los duplicados por dol_vehicle_id. Las filas a
+    descartar se acumulan en una máscara y se filtran una sola vez al final, así que el
+    DataFrame crudo no se modifica ni se copia.
     
+    Args:
+        df (pd.DataFrame): Datos crudos con los nombres de columnas limpios
+        specs (dict): Especificación de las columnas (ver COLUMN_SPECS)
+        seen_ids (set, optional): IDs ya procesados en bloques anteriores. Si se indica,
+            también se eliminan las filas cuyo ID ya fue visto y el conjunto se actualiza
+        
+    Returns:
+        pd.DataFrame: Dataset procesado
+    """
+    missing_columns = [name for name in specs if name not in df.columns]
     if missing_columns:
         logger.warning(f"Las siguientes columnas requeridas no están en el dataset: {missing_columns}")
     
-    logger.info(f"Seleccionando {len(available_columns)} columnas relevantes de {len(df.columns)} totales")
-    return df[available_columns]
+    columns = {}
+    null_counts = {}
+    keep = np.ones(len(df), dtype=bool)
+    for name, spec in specs.items():
+        if name not in df.columns:
+            continue
+        values = convert_column(df[name], spec['type'])
+        nulls = values.isna().to_numpy()
+        null_counts[name] = int(nulls.sum())
+        if spec['nulls'] == 'drop':
+            keep &= ~nulls
+        elif null_counts[name]:
+            values = values.fillna(spec['nulls'])
+        columns[name] = values
+    
+    rows_with_nulls = len(df) - int(keep.sum())
+    logger.info(f"Columnas convertidas: {len(columns)} de {len(df.columns)}. Valores nulos por columna: {null_counts}")
+    logger.info(f"Se eliminaron {rows_with_nulls} filas que contenían valores nulos")
+    
+    # Considero DOL_VEHICLE_ID como el ID único para considerar duplicados (entre las filas válidas)
+    if 'dol_vehicle_id' in columns:
+        kept_ids = columns['dol_vehicle_id'][keep]
+        unique = ~kept_ids.duplicated().to_numpy()
+        if seen_ids is not None:
+            # Descartar IDs que ya aparecieron en bloques anteriores
+            unique &= ~kept_ids.isin(seen_ids).to_numpy()
+            seen_ids.update(kept_ids[unique].tolist())
+        keep[keep] = unique
+        logger.info(f"Se eliminaron {len(unique) - int(unique.sum())} filas duplicadas por DOL VEHICLE ID")
+    
+    # Un único filtrado por columna
+    columns = {name: values[keep] for name, values in columns.items()}
+    for name, values in columns.items():
+        if specs[name]['type'] == 'integer' and not values.isna().any():
+            columns[name] = values.astype('int64')
+    processed_df = pd.DataFrame(columns, copy=False)
+    logger.info(f"Dataset procesado: {len(processed_df)} filas de {len(df)}")
+    return processed_df
 
-def convert_data_types(df):
+def get_partition_ranges(file_path, partitions):
     """
-    Convierte las columnas a los tipos de datos adecuados.
+    Divide las filas del CSV crudo en rangos de bytes de tamaño parecido. Cada rango
+    empieza y termina en un salto de línea, así que contiene filas completas (el dataset
+    no tiene saltos de línea dentro de los valores).
     
     Args:
-        df (pd.DataFrame): DataFrame con los datos
+        file_path (str): Ruta al archivo CSV de datos crudos
+        partitions (int): Cantidad de particiones buscada
         
     Returns:
-        pd.DataFrame: DataFrame con los tipos de datos correctos
-    """
-    logger.info("Convirtiendo tipos de datos")
-    
-    # Diccionario de mapeo de columnas a tipos de datos
-    type_mapping = {
-        'dol_vehicle_id': 'numeric',
-        'county': 'category', 
-        'city': 'category', 
-        'state':'category', 
-        'postal_code': 'numeric', 
-        'model_year':'date', 
-        'make': 'category', 
-        'model': 'category', 
-        'electric_vehicle_type': 'category',
-        'cafv_eligibility': 'category', 
-        'electric_range':'numeric'
-    }
+        tuple: (encabezado en bytes, lista de rangos (inicio, fin))
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        boundaries = [f.tell()]
+        for partition in range(1, partitions):
+            offset = boundaries[0] + (file_size - boundaries[0]) * partition // partitions
+            if offset <= boundaries[-1]:
+                continue
+            # Avanzar hasta el comienzo de la fila siguiente
+            f.seek(offset - 1)
+            f.readline()
+            if boundaries[-1] < f.tell() < file_size:
+                boundaries.append(f.tell())
+    boundaries.append(file_size)
+    return header, list(zip(boundaries[:-1], boundaries[1:]))
+
+def transform_partition(file_path, header, start, end, engine=CSV_ENGINE):
+    """
+    Lee y transforma un rango de bytes del CSV crudo. Se ejecuta en un proceso aparte,
+    así que los duplicados sólo se eliminan dentro de la partición (ver merge_partitions).
     
-    try:
-        # Aplicar conversiones según el tipo
-        for col, data_type in type_mapping.items():
-            if col in df.columns:
-                if data_type == 'numeric':
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-                    logger.info(f"Columna {col} convertida a numérica")
-                elif data_type == 'category':
-                    df[col] = df[col].astype('category')
-                    logger.info(f"Columna {col} convertida a categórica")
-                elif data_type == 'date':
-                    df[col] = pd.to_datetime(df[col].astype(str) + '-01-01', errors='coerce')
-                    logger.info(f"Columna {col} convertida a fecha")
-            else:
-                logger.warning(f"Columna {col} no encontrada en el dataset")
+    Args:
+        file_path (str): Ruta al archivo CSV de datos crudos
+        header (bytes): Encabezado del CSV, que se antepone a las filas de la partición
+        start (int): Posición del primer byte de la partición
+        end (int): Posición siguiente al último byte de la partición
+        engine (str): Motor de lectura de pandas ('pyarrow' o 'c')
         
-        return df
-    
-    except Exception as e:
-        logger.error(f"Error al convertir tipos de datos: {e}")
-        return df
+    Returns:
+        tuple: (partición procesada, filas leídas)
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    usecols, dtype = get_raw_read_options(file_path, RELEVANT_COLUMNS)
+    df = pd.read_csv(io.BytesIO(header + data), usecols=usecols, dtype=dtype, engine=engine)
+    df = clean_column_names(df)
+    return apply_column_specs(df), len(df)
 
-def handle_missing_values(df):
+def merge_partitions(partitions):
     """
-    Maneja los valores faltantes en el DataFrame según la columna.
+    Une las particiones procesadas en el orden del archivo. Las categorías se unen en un
+    único diccionario ordenado, el índice sigue la numeración de filas del archivo completo
+    y los duplicados por dol_vehicle_id se eliminan entre particiones conservando la primera
+    aparición, así que el resultado es el mismo que al transformar el archivo entero.
     
     Args:
-        df (pd.DataFrame): DataFrame con posibles valores faltantes
+        partitions (list): Tuplas (partición procesada, filas leídas) en el orden del archivo
         
     Returns:
-        pd.DataFrame: DataFrame con valores faltantes tratados
-    """
-    logger.info("Manejando valores faltantes")
-    
-    # Registrar valores nulos por columna antes del tratamiento
-    null_counts = df.isnull().sum()
-    logger.info(f"Valores nulos por columna antes del tratamiento:\n{null_counts}")
-    
-    # Rellenar valores nulos en electric_range con 0.0 debido a que ya se reyenaba con 0.0 cuuando se desconoce.
-    if 'electric_range' in df.columns:
-        n_null_er = df['electric_range'].isnull().sum()
-        if n_null_er > 0:
-            df['electric_range'] = df['electric_range'].fillna(0.0)
-            logger.info(f"Columna electric_range: {n_null_er} valores nulos reemplazados con 0.0")
-    
-    #. Eliminar filas que aún tengan algún nulo, opto por esto porque son muy pocos los nulos
-    total_rows_before = len(df)
-    df = df.dropna()
-    dropped = total_rows_before - len(df)
-    logger.info(f"Se eliminaron {dropped} filas que contenían otros valores nulos")
-
-
-    # Registrar valores nulos después del tratamiento
-    null_counts_after = df.isnull().sum()
-    logger.info(f"Valores nulos por columna después del tratamiento:\n{null_counts_after}")
+        pd.DataFrame: Dataset procesado
+    """
+    frames = [df for df, _ in partitions]
+    # Las filas de cada partición se numeran a continuación de las anteriores
+    offsets = np.cumsum([0] + [rows_read for _, rows_read in partitions[:-1]])
+    index = np.concatenate([df.index.to_numpy() + offset for df, offset in zip(frames, offsets)])
     
-
+    columns = {}
+    for name in frames[0].columns:
+        values = [df[name] for df in frames]
+        if isinstance(values[0].dtype, pd.CategoricalDtype):
+            columns[name] = union_categoricals(values, sort_categories=True)
+        else:
+            columns[name] = pd.concat(values, ignore_index=True).to_numpy()
+    df = pd.DataFrame(columns, index=index, copy=False)
+    
+    if 'dol_vehicle_id' in df.columns:
+        duplicated = df['dol_vehicle_id'].duplicated().to_numpy()
+        if duplicated.any():
+            df = df[~duplicated]
+        logger.info(f"Se eliminaron {int(duplicated.sum())} filas duplicadas por DOL VEHICLE ID entre particiones")
     return df
 
-def drop_duplicates(df): # No hay valores duplicados en el dataset pero se deja la función por si acaso
+@profiled_step
+def transform_partitions_in_parallel(file_path, workers=TRANSFORM_WORKERS):
     """
-    Elimina filas duplicadas del DataFrame.
+    Lee y transforma el CSV crudo en paralelo: el archivo se divide en una partición por
+    proceso (ver get_partition_ranges), cada proceso aplica apply_column_specs a la suya
+    y los resultados se unen con merge_partitions.
     
     Args:
-        df (pd.DataFrame): DataFrame con posibles duplicados
+        file_path (str): Ruta al archivo CSV de datos crudos
+        workers (int): Cantidad de procesos
         
     Returns:
-        pd.DataFrame: DataFrame sin duplicados
+        pd.DataFrame: Dataset procesado, None si hay error
     """
-    logger.info(f"Filas antes de eliminar duplicados: {len(df)}")
+    try:
+        header, ranges = get_partition_ranges(file_path, workers)
+        logger.info(f"Transformando {file_path} en {len(ranges)} particiones con {workers} procesos")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(transform_partition, file_path, header, start, end)
+                       for start, end in ranges]
+            partitions = [future.result() for future in futures]
+        record_metrics(bytes_read=os.path.getsize(file_path))
+        return merge_partitions(partitions)
+    except Exception as e:
+        logger.error(f"Error en la transformación en paralelo: {e}")
+        return None
+
+def get_processed_file_path(file_name, file_format=PROCESSED_DATA_FORMAT):
+    """
+    Construye la ruta de un archivo procesado. Si el nombre ya tiene una extensión
+    conocida (.csv o .parquet) se respeta; si no, se agrega la del formato indicado.
     
-    # Considero DOL_VEHICLE_ID como el ID único para considerar duplicados
-    if 'dol_vehicle_id' in df.columns:
-        df_no_duplicates = df.drop_duplicates(subset=['dol_vehicle_id'])
-        logger.info(f"Duplicados eliminados basados en DOL VEHICLE ID")
+    Args:
+        file_name (str): Nombre del archivo, con o sin extensión
+        file_format (str): Formato a usar si el nombre no tiene extensión ('parquet' o 'csv')
+        
+    Returns:
+        tuple: (ruta al archivo, formato del archivo)
+    """
+    base_name, extension = os.path.splitext(file_name)
+    for known_format, known_extension in PROCESSED_FILE_EXTENSIONS.items():
+        if extension == known_extension:
+            return os.path.join(PROCESSED_DATA_DIR, file_name), known_format
     
-    logger.info(f"Filas después de eliminar duplicados: {len(df_no_duplicates)}")
-    logger.info(f"Se eliminaron {len(df) - len(df_no_duplicates)} filas duplicadas")
-    return df_no_duplicates
+    if file_format not in PROCESSED_FILE_EXTENSIONS:
+        raise ValueError(f"Formato de datos procesados no soportado: {file_format}")
+    return os.path.join(PROCESSED_DATA_DIR, file_name + PROCESSED_FILE_EXTENSIONS[file_format]), file_format
 
+def get_parquet_compression(compression=PROCESSED_DATA_COMPRESSION):
+    """
+    Traduce la compresión configurada al valor que espera pyarrow ('none' -> None).
+    """
+    return None if compression in (None, '', 'none') else compression
 
-def save_processed_data(df, file_name='processed_ev_data.csv', save_full=True):
+@profiled_step
+def save_processed_data(df, file_name='processed_ev_data', file_format=PROCESSED_DATA_FORMAT, compression=PROCESSED_DATA_COMPRESSION):
     """
-    Guarda el DataFrame procesado en un archivo CSV. 
-    Opcionalmente guarda una versión completa con todas las columnas originales.
+    Guarda el DataFrame procesado en disco. Por defecto usa parquet, que es columnar,
+    conserva los tipos (categorías y fechas) y permite leer sólo algunas columnas.
     
     Args:
         df (pd.DataFrame): DataFrame procesado
-        file_name (str): Nombre del archivo para guardar los datos procesados
-        save_full (bool): Si es True, guarda también una versión completa de los datos
+        file_name (str): Nombre del archivo para guardar los datos procesados. Si no tiene
+            extensión se usa la del formato indicado
+        file_format (str): Formato de salida, 'parquet' o 'csv'
+        compression (str): Compresión para parquet ('snappy', 'zstd', 'gzip' o 'none')
         
     Returns:
         str: Ruta al archivo guardado, None si hay error
@@ -198,10 +550,15 @@ def save_processed_data(df, file_name='processed_ev_data.csv', save_full=True):
         os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
         
         # Ruta completa del archivo
-        file_path = os.path.join(PROCESSED_DATA_DIR, file_name)
+        file_path, file_format = get_processed_file_path(file_name, file_format)
         
-        # Guardar el DataFrame optimizado en CSV
-        df.to_csv(file_path, index=False)
+        if file_format == 'parquet':
+            # Guardar en formato columnar conservando los tipos de datos
+            df.to_parquet(file_path, index=False, compression=get_parquet_compression(compression))
+        else:
+            # Guardar el DataFrame optimizado en CSV
+            df.to_csv(file_path, index=False)
+        record_metrics(bytes_written=os.path.getsize(file_path))
         logger.info(f"Datos procesados guardados en: {file_path}")
         
         return file_path
@@ -210,46 +567,136 @@ def save_processed_data(df, file_name='processed_ev_data.csv', save_full=True):
         logger.error(f"Error al guardar los datos procesados: {e}")
         return None
 
-def transform_data(input_file_path):
+@profiled_step
+def read_processed_data(file_path, columns=None):
+    """
+    Lee un archivo de datos procesados (parquet o CSV). En parquet los tipos se conservan
+    tal como los dejó apply_column_specs y sólo se leen las columnas pedidas. En CSV las
+    columnas de tipo 'year_date' se vuelven a leer como fechas.
+    
+    Args:
+        file_path (str): Ruta al archivo procesado
+        columns (list, optional): Columnas a leer. Si es None se leen todas
+        
+    Returns:
+        pd.DataFrame: DataFrame con los datos procesados
+    """
+    if file_path.endswith(PROCESSED_FILE_EXTENSIONS['parquet']):
+        return pd.read_parquet(file_path, columns=columns)
+    date_columns = [name for name, spec in COLUMN_SPECS.items()
+                    if spec['type'] == 'year_date' and (columns is None or name in columns)]
+    return pd.read_csv(file_path, usecols=columns, parse_dates=date_columns)
+
+class ProcessedChunkWriter:
+    """
+    Escribe bloques de datos procesados de forma incremental en un archivo temporal,
+    que reemplaza al archivo final recién al llamar a close().
+    
+    En parquet el esquema se fija con el primer bloque (con las categorías indexadas con
+    int32) y los bloques siguientes, que pueden inferir otros tipos, se convierten a él.
+    """
+    
+    def __init__(self, file_name, file_format=PROCESSED_DATA_FORMAT, compression=PROCESSED_DATA_COMPRESSION):
+        os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
+        self.file_path, self.file_format = get_processed_file_path(file_name, file_format)
+        self.tmp_path = self.file_path + '.tmp'
+        self.compression = get_parquet_compression(compression)
+        self.rows_written = 0
+        self._file = None
+        self._writer = None
+        self._schema = None
+    
+    def _chunk_schema(self, table):
+        fields = []
+        for field in table.schema:
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            fields.append(field)
+        return pa.schema(fields, metadata=table.schema.metadata)
+    
+    def write(self, chunk):
+        with track_step('write_processed_chunk'):
+            record_metrics(rows_in=len(chunk))
+            if self.file_format == 'parquet':
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if self._writer is None:
+                    self._schema = self._chunk_schema(table)
+                    self._writer = pq.ParquetWriter(self.tmp_path, self._schema, compression=self.compression)
+                self._writer.write_table(table.cast(self._schema))
+            else:
+                if self._file is None:
+                    self._file = open(self.tmp_path, 'w', newline='')
+                chunk.to_csv(self._file, index=False, header=self.rows_written == 0)
+            self.rows_written += len(chunk)
+    
+    def close(self):
+        self._close_handles()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.file_path)
+        logger.info(f"Datos procesados guardados en: {self.file_path}")
+        return self.file_path
+    
+    def abort(self):
+        # Descartar el archivo temporal para no dejar resultados parciales
+        self._close_handles()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+    
+    def _close_handles(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+@profiled_step
+def transform_data(input_file_path, workers=TRANSFORM_WORKERS, arrow_cache=RAW_ARROW_CACHE):
     """
-    Función principal que orquesta el proceso de transformación de datos.
+    Función principal que orquesta el proceso de transformación de datos. Del CSV crudo
+    sólo se leen las columnas de COLUMN_SPECS; la versión con todas las columnas se genera
+    aparte con export_full_data.
     
     Args:
         input_file_path (str): Ruta al archivo de datos crudos
+        workers (int): Procesos para transformar en paralelo. Con 1 se transforma en este proceso
+        arrow_cache (bool): Si es True, el CSV se lee a través de su copia Arrow en la caché
+            (ver read_raw_data_with_arrow_cache) y se transforma en este proceso
         
     Returns:
         tuple: (DataFrame procesado, ruta al archivo procesado) o (None, None) si hay error
     """
     try:
-        # Leer los datos
-        df = read_raw_data(input_file_path)
-        if df is None:
-            return None, None
-        
-        # Guardar una copia de los datos originales con todas las columnas
-        original_df = df.copy()
-        
-        # Aplicar transformaciones
-        df = clean_column_names(df)
+        if arrow_cache:
+            workers = 1
+        elif workers > 1 and get_file_compression(input_file_path) != 'none':
+            # Un archivo comprimido no se puede dividir en rangos de bytes
+            logger.info("El archivo crudo está comprimido: se transforma en un solo proceso")
+            workers = 1
         
-        # Seleccionar columnas relevantes para optimización
-        df = select_relevant_columns(df)
-        
-        # Continuar con otras transformaciones
-        df = convert_data_types(df)
-        df = handle_missing_values(df)
-        df = drop_duplicates(df)
+        if workers > 1:
+            # Leer y transformar particiones del archivo en paralelo
+            df = transform_partitions_in_parallel(input_file_path, workers)
+            if df is None:
+                return None, None
+        else:
+            # Leer los datos
+            if arrow_cache:
+                df = read_raw_data_with_arrow_cache(input_file_path, RELEVANT_COLUMNS)
+            else:
+                df = read_raw_data(input_file_path, RELEVANT_COLUMNS)
+            if df is None:
+                return None, None
+            
+            # Aplicar transformaciones
+            df = clean_column_names(df)
+            df = apply_column_specs(df)
         
         # Guardar los datos procesados optimizados
         output_file_path = save_processed_data(df)
         
-        # También guardar los datos completos para referencia (con todas las columnas)
-        original_df = clean_column_names(original_df)
-        full_output_path = save_processed_data(original_df, 'full_processed_ev_data.csv')
-        
         logger.info("Proceso de transformación completado con éxito")
         logger.info(f"Dataset optimizado: {len(df.columns)} columnas, {len(df)} filas")
-        logger.info(f"Dataset completo: {len(original_df.columns)} columnas, {len(original_df)} filas")
         
         return df, output_file_path
     
@@ -257,6 +704,83 @@ def transform_data(input_file_path):
         logger.error(f"Error en el proceso de transformación: {e}")
         return None, None
 
+def transform_data_in_chunks(input_file_path, chunk_size=TRANSFORM_CHUNK_SIZE):
+    """
+    Versión por bloques (streaming) de transform_data. Cada bloque del CSV crudo pasa por
+    la misma secuencia de transformaciones, se agrega a los archivos procesados y se entrega
+    al consumidor (por ejemplo el cargador), de modo que la memoria no depende del tamaño
+    del dataset. Los duplicados se eliminan entre bloques usando los IDs ya vistos.
+    
+    Los archivos procesados se escriben en archivos temporales y sólo reemplazan a los
+    anteriores cuando se consumieron todos los bloques.
+    
+    Args:
+        input_file_path (str o archivo binario): Ruta al archivo de datos crudos, o flujo de
+            bytes (ver read_raw_data_in_chunks)
+        chunk_size (int): Cantidad máxima de filas por bloque
+        
+    Yields:
+        pd.DataFrame: Bloque de datos procesados
+    """
+    output_writer = ProcessedChunkWriter('processed_ev_data')
+    
+    seen_ids = set()
+    total_rows_in = 0
+    completed = False
+    
+    try:
+        for chunk_number, chunk in enumerate(read_raw_data_in_chunks(input_file_path, chunk_size, RELEVANT_COLUMNS)):
+            total_rows_in += len(chunk)
+            
+            # Aplicar transformaciones al bloque
+            chunk = clean_column_names(chunk)
+            chunk = apply_column_specs(chunk, seen_ids=seen_ids)
+            
+            # Guardar el bloque procesado y entregarlo al consumidor
+            output_writer.write(chunk)
+            logger.info(f"Bloque {chunk_number + 1} procesado: {len(chunk)} filas")
+            yield chunk
+        
+        output_writer.close()
+        completed = True
+        logger.info("Proceso de transformación por bloques completado con éxito")
+        logger.info(f"Filas leídas: {total_rows_in}, filas procesadas: {output_writer.rows_written}")
+    
+    finally:
+        # Si el proceso no terminó, no dejar archivos parciales
+        if not completed:
+            output_writer.abort()
+
+@profiled_step
+def export_full_data(input_file_path, file_name=FULL_DATA_FILE_NAME, chunk_size=TRANSFORM_CHUNK_SIZE):
+    """
+    Genera la versión completa de los datos (todas las columnas del CSV crudo, con los
+    nombres limpios) para consultas de referencia. Es una salida independiente del
+    dataset procesado: se lee de nuevo el CSV crudo por bloques y cada bloque se escribe
+    directamente, así que no hace falta conservar en memoria los datos crudos durante
+    la transformación.
+    
+    Args:
+        input_file_path (str): Ruta al archivo de datos crudos
+        file_name (str): Nombre del archivo de salida, con o sin extensión
+        chunk_size (int): Cantidad máxima de filas por bloque
+        
+    Returns:
+        str: Ruta al archivo guardado, None si hay error
+    """
+    writer = ProcessedChunkWriter(file_name)
+    try:
+        logger.info(f"Generando la versión completa de los datos desde {input_file_path}")
+        for chunk in read_raw_data_in_chunks(input_file_path, chunk_size):
+            writer.write(clean_column_names(chunk))
+        record_metrics(rows_out=writer.rows_written)
+        logger.info(f"Dataset completo: {writer.rows_written} filas")
+        return writer.close()
+    except Exception as e:
+        writer.abort()
+        logger.error(f"Error al generar la versión completa de los datos: {e}")
+        return None
+
 if __name__ == "__main__":
     # Si se ejecuta directamente, necesitamos saber qué archivo procesar
     from extract import extract_data
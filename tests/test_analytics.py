@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ev_test_data_'))
+
+import analytics
+
+
+def make_data(rows):
+    # Categorías en orden de aparición, como las deja la transformación por bloques
+    df = pd.DataFrame(rows, columns=['county', 'city', 'make', 'model'])
+    for column in df.columns:
+        df[column] = pd.Categorical(df[column], categories=list(dict.fromkeys(df[column].dropna())))
+    df['cafv_eligibility'] = analytics.CAFV_ELIGIBLE
+    df['model_year'] = pd.to_datetime('2020-01-01')
+    return df
+
+
+def test_ties_are_ordered_by_value_not_by_category_order():
+    df = make_data([
+        ('Yakima', 'Zillah', 'TESLA', 'MODEL Y'),
+        ('King', 'Seattle', 'NISSAN', 'LEAF'),
+        ('King', 'Bellevue', 'BMW', 'i3'),
+        ('King', 'Seattle', 'TESLA', 'MODEL 3'),
+    ])
+
+    cafv = analytics.get_cafv_by_location(df)
+    assert list(zip(cafv['county'], cafv['city'])) == [('King', 'Seattle'), ('King', 'Bellevue'),
+                                                      ('Yakima', 'Zillah')]
+
+    top_models = analytics.get_top_models(df)
+    # Orden por bytes, como ORDER BY ... COLLATE "C": las mayúsculas antes que las minúsculas
+    assert list(top_models['make']) == ['BMW', 'NISSAN', 'TESLA', 'TESLA']
+    assert list(top_models['model']) == ['i3', 'LEAF', 'MODEL 3', 'MODEL Y']
+
+
+def test_count_by_sorts_groups_by_value_with_nulls_last():
+    df = pd.DataFrame({'county': pd.Categorical(['b', None, 'a', 'b'], categories=['b', 'a'])})
+    result = analytics.count_by(df, ['county'], 'n')
+    assert result['county'].tolist()[:2] == ['a', 'b']
+    assert pd.isna(result['county'].iloc[2])
+    assert result['n'].tolist() == [1, 2, 1]
+
+
+def test_pandas_backend_reads_csv_and_parquet_processed_files(tmp_path):
+    df = make_data([
+        ('King', 'Seattle', 'TESLA', 'MODEL 3'),
+        ('King', 'Seattle', 'NISSAN', 'LEAF'),
+        ('Yakima', 'Zillah', 'TESLA', 'MODEL Y'),
+    ])
+    df['model_year'] = pd.to_datetime(['2019-01-01', '2020-01-01', '2020-01-01'])
+    parquet_path = str(tmp_path / 'processed_ev_data.parquet')
+    csv_path = str(tmp_path / 'processed_ev_data.csv')
+    df.to_parquet(parquet_path, index=False)
+    df.to_csv(csv_path, index=False)
+
+    parquet_data = analytics.load_analytics_data(parquet_path)
+    csv_data = analytics.load_analytics_data(csv_path)
+    for name, export_function in analytics.EXPORT_FUNCTIONS.items():
+        expected = export_function(parquet_data)
+        result = export_function(csv_data)
+        pd.testing.assert_frame_equal(result, expected, obj=name)
+    assert analytics.get_vehicles_by_year(csv_data)['vehicle_count'].tolist() == [1, 2]
@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Los módulos del pipeline se importan desde src y crean sus carpetas de datos al importarse
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ev_test_data_'))
+
+from extract import fetch_if_changed, get_partial_path, read_download_metadata, write_download_metadata
+
+CONTENT = b''.join(f'{i},EV-{i}\n'.encode() for i in range(5000))
+ETAG = '"v1"'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Servidor de prueba que responde como el portal de datos: 304 con If-None-Match,
+    206 con Range/If-Range y 416 si el rango empieza en el final del archivo.
+    """
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range') == ETAG:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(CONTENT):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(CONTENT)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = CONTENT[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        else:
+            body = CONTENT
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    StandInHandler.requests_seen = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/ev.csv'
+    server.shutdown()
+    server.server_close()
+
+
+def write_partial(output_file_path, url, data):
+    partial_path = get_partial_path(output_file_path)
+    with open(partial_path, 'wb') as f:
+        f.write(data)
+    write_download_metadata(partial_path, {'url': url, 'etag': ETAG, 'last_modified': None})
+    return partial_path
+
+
+def read_file(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def test_not_modified_keeps_current_file(server_url, tmp_path):
+    output_file_path = str(tmp_path / 'ev.csv')
+    assert fetch_if_changed(server_url, output_file_path) is True
+    assert read_download_metadata(output_file_path)['etag'] == ETAG
+
+    assert fetch_if_changed(server_url, output_file_path) is False
+    assert StandInHandler.requests_seen[-1]['If-None-Match'] == ETAG
+    assert read_file(output_file_path) == CONTENT
+
+
+def test_resumes_partial_download_with_if_range(server_url, tmp_path):
+    output_file_path = str(tmp_path / 'ev.csv')
+    partial_path = write_partial(output_file_path, server_url, CONTENT[:1000])
+
+    assert fetch_if_changed(server_url, output_file_path) is True
+    assert StandInHandler.requests_seen[-1]['Range'] == 'bytes=1000-'
+    assert StandInHandler.requests_seen[-1]['If-Range'] == ETAG
+    assert read_file(output_file_path) == CONTENT
+    assert read_download_metadata(output_file_path)['size'] == len(CONTENT)
+    assert not os.path.exists(partial_path)
+
+
+def test_partial_download_already_complete(server_url, tmp_path):
+    output_file_path = str(tmp_path / 'ev.csv')
+    partial_path = write_partial(output_file_path, server_url, CONTENT)
+
+    assert fetch_if_changed(server_url, output_file_path) is True
+    # Sólo se hizo la solicitud del rango: el 416 no provocó una descarga completa
+    assert len(StandInHandler.requests_seen) == 1
+    assert read_file(output_file_path) == CONTENT
+    assert read_download_metadata(output_file_path)['etag'] == ETAG
+    assert not os.path.exists(partial_path)
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ev_test_data_'))
+
+from load import limit_load_workers
+
+
+def test_load_workers_leave_a_connection_for_the_load():
+    assert limit_load_workers(4, pool_size=8) == 4
+    assert limit_load_workers(8, pool_size=8) == 7
+    assert limit_load_workers(16, pool_size=8) == 7
+    # Con una sola conexión se copia con la de la carga
+    assert limit_load_workers(4, pool_size=1) == 1
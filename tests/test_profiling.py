@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ev_test_data_'))
+
+from profiling import start_run_report, get_run_report, track_step
+
+
+def test_rss_growth_is_measured_per_step():
+    start_run_report()
+    with track_step('allocate'):
+        block = b'x' * (200 * 1024 * 1024)
+    del block
+    with track_step('small'):
+        sum(range(1000))
+
+    steps = {step['step']: step for step in get_run_report()['steps']}
+    assert steps['allocate']['rss_growth_mb'] >= 150
+    # La memoria ya estaba reservada por la etapa anterior: el máximo del proceso no cambia
+    assert steps['small']['rss_growth_mb'] < 10
@@ -0,0 +1,152 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='ev_test_data_'))
+
+from synthetic_data import generate_synthetic_data
+from transform import (apply_column_specs, convert_column, year_to_date, get_partition_ranges,
+                       transform_data, transform_data_in_chunks, read_processed_data)
+
+# Filas crudas (con los nombres ya limpios): dol_vehicle_id, county, postal_code, model_year, make, electric_range
+RAW_ROWS = [
+    ('1', 'King', '98101', '2020', 'TESLA', '266'),
+    ('2', 'King', '98101', 'abc', 'TESLA', '266'),      # año no numérico
+    ('3', 'Pierce', '98402', '1500', 'NISSAN', '150'),  # año fuera de rango
+    ('4', 'Pierce', '98402', '2020.5', 'NISSAN', '150'),  # año no entero
+    ('x12', 'King', '98101', '2019', 'BMW', '153'),     # ID no numérico
+    ('5', None, '98101', '2019', 'BMW', '153'),         # condado nulo
+    ('6', 'Yakima', '98901', '2021', 'KIA', None),      # autonomía nula
+    ('1', 'Clark', '98660', '2022', 'FORD', '0'),       # ID duplicado
+    ('7', 'King', 'abc', '2023', 'TESLA', '0'),         # código postal no numérico
+    ('8', 'Benton', '99352', '2018', 'BMW', 'n/a'),     # autonomía no numérica
+]
+
+
+def make_raw_data():
+    return pd.DataFrame(RAW_ROWS, columns=['dol_vehicle_id', 'county', 'postal_code', 'model_year', 'make',
+                                           'electric_range'])
+
+
+def test_year_to_date_marks_invalid_years_as_nat():
+    years = pd.Series(['2020', 'abc', '2020.5', '1500', '3000', None, 2021.0, 1678, 2261])
+    dates = year_to_date(years)
+    assert dates.dtype == 'datetime64[ns]'
+    expected = pd.to_datetime(['2020-01-01', None, None, None, None, None, '2021-01-01', '1678-01-01',
+                               '2261-01-01'])
+    assert dates.tolist() == pd.Series(expected).tolist()
+
+
+def test_convert_column_coerces_numeric_and_sorts_categories():
+    numbers = convert_column(pd.Series(['1', 'x', None, '2.5']), 'numeric')
+    np.testing.assert_array_equal(numbers.to_numpy(), [1.0, np.nan, np.nan, 2.5])
+    integers = convert_column(pd.Series(['1', 'x', '2.5', 'inf', '98101']), 'integer')
+    np.testing.assert_array_equal(integers.to_numpy(), [1.0, np.nan, np.nan, np.nan, 98101.0])
+    assert convert_column(pd.Series(['1', '2']), 'numeric').dtype == 'float64'
+
+    categories = convert_column(pd.Series(['b', 'a', None, 'b']), 'category')
+    assert list(categories.cat.categories) == ['a', 'b']
+    assert categories.tolist()[:2] == ['b', 'a'] and pd.isna(categories.iloc[2])
+
+    # Categorías armadas al leer, en orden de aparición
+    read_categories = pd.Series(pd.Categorical(['b', 'a'], categories=['b', 'a']))
+    converted = convert_column(read_categories, 'category')
+    assert list(converted.cat.categories) == ['a', 'b']
+    assert converted.tolist() == ['b', 'a']
+
+
+def test_apply_column_specs_cleans_known_rows():
+    result = apply_column_specs(make_raw_data())
+
+    assert list(result.columns) == ['dol_vehicle_id', 'county', 'postal_code', 'model_year', 'make',
+                                    'electric_range']
+    assert result.index.tolist() == [0, 6, 9]
+    assert result['dol_vehicle_id'].tolist() == [1, 6, 8]
+    assert result['county'].tolist() == ['King', 'Yakima', 'Benton']
+    assert result['postal_code'].tolist() == [98101, 98901, 99352]
+    assert result['model_year'].tolist() == pd.to_datetime(['2020-01-01', '2021-01-01', '2018-01-01']).tolist()
+    # Las autonomías nulas o no numéricas se reemplazan por 0.0
+    assert result['electric_range'].tolist() == [266.0, 0.0, 0.0]
+    assert result['electric_range'].dtype == 'float64'
+    assert result['dol_vehicle_id'].dtype == 'int64'
+    assert result['postal_code'].dtype == 'int64'
+    assert result['model_year'].dtype == 'datetime64[ns]'
+    for column in ('county', 'make'):
+        assert isinstance(result[column].dtype, pd.CategoricalDtype)
+        assert result[column].cat.categories.is_monotonic_increasing
+
+
+def test_apply_column_specs_drops_ids_seen_in_previous_chunks():
+    seen_ids = {6}
+    result = apply_column_specs(make_raw_data(), seen_ids=seen_ids)
+    assert result['dol_vehicle_id'].tolist() == [1, 8]
+    assert seen_ids == {1, 6, 8}
+
+
+def write_raw_data_with_duplicates(file_path, rows=400, partitions=3):
+    """
+    Genera un CSV crudo y repite IDs entre particiones: la primera fila de cada partición
+    (ver get_partition_ranges) repite el ID de la última de la anterior, y otras filas
+    repiten IDs de particiones anteriores. Los IDs tienen el mismo largo, así que los
+    límites de las particiones no cambian.
+    """
+    generate_synthetic_data(file_path, rows, seed=7)
+    raw = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+    _, ranges = get_partition_ranges(file_path, partitions)
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    # Fila (sin contar el encabezado) en la que empieza cada partición
+    first_rows = [data[ranges[0][0]:start].count(b'\n') for start, _ in ranges]
+    ids = raw['DOL Vehicle ID']
+    for first_row in first_rows[1:]:
+        ids[first_row] = ids[first_row - 1]
+    ids[rows - 1] = ids[0]
+    ids[first_rows[1] + 5] = ids[3]
+    ids[first_rows[2] + 10] = ids[first_rows[1] + 20]
+    raw.to_csv(file_path, index=False)
+    assert get_partition_ranges(file_path, partitions)[1] == ranges
+    return file_path
+
+
+def test_parallel_transform_matches_single_process(tmp_path):
+    file_path = write_raw_data_with_duplicates(str(tmp_path / 'raw.csv'))
+
+    expected, _ = transform_data(file_path, workers=1, arrow_cache=False)
+    result, _ = transform_data(file_path, workers=3, arrow_cache=False)
+
+    assert expected['dol_vehicle_id'].is_unique
+    assert len(expected) < 400 - 4
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def as_plain_columns(df):
+    return df.astype({name: object for name in df.columns if isinstance(df[name].dtype, pd.CategoricalDtype)})
+
+
+def test_chunked_transform_matches_full_transform(tmp_path):
+    file_path = str(tmp_path / 'raw.csv')
+    generate_synthetic_data(file_path, 300, seed=11)
+    raw = pd.read_csv(file_path, dtype=str, keep_default_na=False)
+    ids = raw['DOL Vehicle ID']
+    # Con bloques de 40 filas: IDs repetidos justo en los límites y entre bloques lejanos
+    for boundary in (40, 80, 120, 160):
+        ids[boundary] = ids[boundary - 1]
+    ids[299] = ids[0]
+    ids[250] = ids[45]
+    raw.to_csv(file_path, index=False)
+
+    expected, expected_path = transform_data(file_path, workers=1, arrow_cache=False)
+    expected_file = read_processed_data(expected_path)
+    chunks = list(transform_data_in_chunks(file_path, chunk_size=40))
+
+    assert len(chunks) == 8
+    assert expected['dol_vehicle_id'].is_unique
+    # Las categorías de cada bloque son sólo las suyas: se comparan los valores
+    pd.testing.assert_frame_equal(as_plain_columns(pd.concat(chunks)), as_plain_columns(expected))
+    # El archivo que escribe ProcessedChunkWriter tiene las mismas filas que el de transform_data
+    pd.testing.assert_frame_equal(as_plain_columns(read_processed_data(expected_path)),
+                                  as_plain_columns(expected_file))